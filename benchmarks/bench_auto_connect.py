@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+# Bursts of interface events, as flapping wifi causes them, run through the auto-connect dispatcher script
+# Usage: python benchmarks/bench_auto_connect.py [--repeat N] [--events N] [--gap MS] [--debounce S] [--up-latency MS]
+# The installed script is run for every event one after another, as NetworkManager does, and compared with the script
+# of earlier versions that brought its connection up for each event. Runs against the nmcli / sudo shims, the JSON
+# result can be compared with compare.py and counts the connection activations of each burst
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+bench_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(bench_dir))
+
+from bench_gui import git, isolate, summarize
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', type=int, default=5000, help='servers in the synthetic catalog')
+    parser.add_argument('--repeat', type=int, default=5, help='bursts per measurement')
+    parser.add_argument('--events', type=int, default=20, help='interface events per burst')
+    parser.add_argument('--gap', type=float, default=200, help='maximum time between two events of a burst in ms')
+    parser.add_argument('--debounce', type=float, default=1, help='auto-connect debounce in seconds')
+    parser.add_argument('--latency', type=float, default=20, help='API and CDN round trip in ms')
+    parser.add_argument('--nm-latency', type=float, default=10, help='duration of an nmcli or sudo call in ms')
+    parser.add_argument('--up-latency', type=float, default=200, help='extra duration of nmcli connection up in ms')
+    parser.add_argument('--output', help='file for the JSON result, printed when omitted')
+    return parser.parse_args()
+
+
+def nm_state():
+    with open(os.environ['FAKE_NM_STATE']) as state_file:
+        return json.load(state_file)
+
+
+def runs_left(script):
+    """
+    :return: True while an attempt started by script is still waiting or connecting
+    """
+    for pid in filter(str.isdigit, os.listdir('/proc')):
+        try:
+            with open('/proc/%s/cmdline' % pid, 'rb') as cmdline:
+                args = cmdline.read().split(b'\0')
+        except OSError:
+            continue
+        if b'--attempt' in args and script.encode() in args:
+            return True
+    return False
+
+
+def burst(script, events, gap, rng):
+    """
+    Runs script for events interface events spaced up to gap seconds apart, each one after the previous one finished
+
+    :return: perf_counter time of the last event
+    """
+    due = time.perf_counter()
+    for event in range(events):
+        time.sleep(max(0.0, due - time.perf_counter()))
+        last = time.perf_counter()
+        subprocess.run(['bash', script, 'wlan0', 'up' if event % 2 else 'connectivity-change'], check=True)
+        due = last + rng.uniform(0, gap)
+    return last
+
+
+def main(args):
+    isolate(args)
+    import catalog
+    from fakenord import FakeNord
+    import nord_nm_core
+    from nord_nm_core import NordCore, Probe, build_index, connection_name
+
+    servers = catalog.generate(args.size)
+    nord = FakeNord(servers, latency=args.latency / 1e3).start()
+    nord_nm_core.api = nord.api
+    nord_nm_core.cdn = nord.url
+    nord_nm_core.dbus = None  # the shims stand in for NetworkManager, not the system bus
+    core = NordCore()
+    core.setup()
+    if not core.authorize('bench'):
+        raise RuntimeError('the helper did not start')
+    server_index = core.load_catalog()  # ranks the connections the script is installed with
+    server_index = server_index if len(server_index.store) else build_index(servers)
+    preferred, other, fastest = server_index.lookup(server_index.store.countries[0], 'Standard')[:3]
+    for server in (fastest, other, preferred):  # kept by the profile cache, preferred was connected to last
+        core.disconnect(core.connect(server, 'Standard', 'UDP', 'bench@example.com', 'bench'))
+    core.prober.results = {server.domain: Probe(rtt=rtt, loss=0.0, measured_at=time.time())
+                           for server, rtt in ((preferred, 0.05), (other, 0.08), (fastest, 0.02))}
+    preferred_name = connection_name(preferred, 'UDP')
+    core.config['SETTINGS']['auto_connect_debounce'] = str(args.debounce)  # shorter than the default
+    core.install_auto_connect(preferred_name)
+    script = core.helper.dispatcher_path('auto_connect')
+    legacy_script = os.path.join(os.environ['HOME'], 'legacy_auto_connect')
+    with open(legacy_script, 'w') as script_file:
+        script_file.write('#!/bin/bash\n\n'
+                          'if [[ "$1" =~ eth0|wlan0 ]] && [[ "$2" =~ up|connectivity-change ]]; then\n'
+                          '  nmcli connection up id "' + preferred_name + '"\n'
+                          'fi\n')
+
+    def reset():
+        for name in nm_state()['active']:
+            core.backend.deactivate(name)
+        state = nm_state()
+        state['activations'] = 0
+        with open(os.environ['FAKE_NM_STATE'], 'w') as state_file:
+            json.dump(state, state_file)
+
+    rng = random.Random(0)
+    seconds = {'legacy': [], 'debounced': []}
+    activations = {'legacy': [], 'debounced': [], 'debounced_connected': []}
+    chosen = set()
+    for run in range(args.repeat):
+        reset()
+        last = burst(legacy_script, args.events, args.gap / 1e3, rng)
+        seconds['legacy'].append(time.perf_counter() - last)  # the last up ran after the last event
+        activations['legacy'].append(nm_state()['activations'])
+
+        reset()
+        last = burst(script, args.events, args.gap / 1e3, rng)
+        while runs_left(script):
+            time.sleep(0.01)
+        seconds['debounced'].append(time.perf_counter() - last)
+        activations['debounced'].append(nm_state()['activations'])
+        chosen.update(nm_state()['active'])
+
+        burst(script, args.events, args.gap / 1e3, rng)  # the connection is up, nothing may be activated again
+        while runs_left(script):
+            time.sleep(0.01)
+        activations['debounced_connected'].append(nm_state()['activations'] - activations['debounced'][-1])
+    reset()
+    core.helper.stop()
+
+    report = {
+        'commit': git('rev-parse', 'HEAD'),
+        'dirty': bool(git('status', '--porcelain', '--untracked-files=no')),
+        'python': platform.python_version(),
+        'parameters': {'repeat': args.repeat, 'events': args.events, 'gap_ms': args.gap, 'debounce': args.debounce,
+                       'nm_latency_ms': args.nm_latency, 'up_latency_ms': args.up_latency},
+        'activations': activations,
+        'chosen': sorted(chosen),
+        'expected': [connection_name(fastest, 'UDP')],
+        'seconds': {'settle_' + name: summarize(runs) for name, runs in seconds.items()}}
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            print(output, file=output_file)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main(parse_args())
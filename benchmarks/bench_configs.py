@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+# Time to obtain a server's ovpn file on connect, with and without the local config store, against a local CDN
+# Usage: python benchmarks/bench_configs.py [latency in ms]
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import catalog
+import nord_nm_core
+from cdn import CDN
+from nord_nm_core import ConfigStore, HttpClient
+
+
+def connect_path(store, domain, protocol, work_dir):
+    """
+    The get_ovpn() part of connect(): find or download the file and copy it for import
+    """
+    path = store.get(domain, protocol) or store.fetch(domain, protocol)
+    return shutil.copy(path, os.path.join(work_dir, os.path.basename(path)))
+
+
+def main(latency):
+    servers = catalog.generate(2000)
+    cdn = CDN(servers, latency=latency).start()
+    nord_nm_core.cdn = cdn.url
+    nord_nm_core.config_archives = [cdn.url + '/archives/servers/ovpn.zip']
+    domains = [server['domain'] for server in servers[:50]]
+    work_dir = tempfile.mkdtemp()
+
+    cold = []
+    for domain in domains:  # a fresh store and client per connect is the download-on-every-connect behaviour
+        store = ConfigStore(tempfile.mkdtemp(), HttpClient())
+        start = time.perf_counter()
+        connect_path(store, domain, 'udp', work_dir)
+        cold.append(time.perf_counter() - start)
+
+    store = ConfigStore(tempfile.mkdtemp(), HttpClient())
+    start = time.perf_counter()
+    count = store.refresh()
+    ingest = time.perf_counter() - start
+    warm = []
+    for domain in domains:
+        start = time.perf_counter()
+        connect_path(store, domain, 'udp', work_dir)
+        warm.append(time.perf_counter() - start)
+
+    print('CDN latency %.0f ms, archive of %d files ingested in %.2f s' % (latency * 1e3, count, ingest))
+    print('%-14s %10s %10s' % ('', 'median ms', 'max ms'))
+    print('%-14s %10.2f %10.2f' % ('download', statistics.median(cold) * 1e3, max(cold) * 1e3))
+    print('%-14s %10.2f %10.2f' % ('config store', statistics.median(warm) * 1e3, max(warm) * 1e3))
+
+
+if __name__ == '__main__':
+    main(float(sys.argv[1]) / 1e3 if len(sys.argv) > 1 else 0.05)
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+# Time from a failed connection to a working one: failover to the imported standby against disconnect and connect
+# Also counts failovers the GUI would make after nord-nm disconnects its connection, there must be none
+# Usage: python benchmarks/bench_failover.py [--repeat N] [--latency MS] [--nm-latency MS] [--up-latency MS] [--kill-switch]
+# Runs NordCore against fakenord.FakeNord and the nmcli / sudo shims, the JSON result can be compared with compare.py
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+bench_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(bench_dir))
+
+from bench_gui import git, isolate, summarize
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', type=int, default=5000, help='servers in the synthetic catalog')
+    parser.add_argument('--repeat', type=int, default=10, help='runs per measurement')
+    parser.add_argument('--latency', type=float, default=20, help='API and CDN round trip in ms')
+    parser.add_argument('--nm-latency', type=float, default=10, help='duration of an nmcli or sudo call in ms')
+    parser.add_argument('--up-latency', type=float, default=200, help='extra duration of nmcli connection up in ms')
+    parser.add_argument('--kill-switch', action='store_true', help='connect with the kill switch on')
+    parser.add_argument('--output', help='file for the JSON result, printed when omitted')
+    return parser.parse_args()
+
+
+def main(args):
+    isolate(args)
+    import catalog
+    from fakenord import FakeNord
+    import nord_nm_core
+    from nord_nm_core import NordCore, build_index, nm_failure_reasons
+
+    servers = catalog.generate(args.size)
+    nord = FakeNord(servers, latency=args.latency / 1e3).start()
+    nord_nm_core.cdn = nord.url
+    nord_nm_core.dbus = None  # the shims stand in for NetworkManager, not the system bus
+    core = NordCore()
+    core.setup()
+    if not core.authorize('bench'):
+        raise RuntimeError('the helper did not start')
+    server_index = build_index(servers)
+    failed, backup = server_index.lookup(server_index.store.countries[0], 'Standard')[:2]
+    options = {'kill_switch': args.kill_switch}
+    for server in (failed, backup):  # both configs are stored before timing, as after a connect
+        core.get_config(server.domain, 'udp')
+
+    failovers, reconnects = [], []
+    for run in range(args.repeat):
+        name = core.connect(failed, 'Standard', 'UDP', 'bench@example.com', 'bench', **options)
+        core.prepare_standby(backup, 'Standard', 'UDP', 'bench@example.com', 'bench')
+        start = time.perf_counter()
+        name = core.failover()
+        failovers.append(time.perf_counter() - start)
+        core.disconnect(name)
+
+        name = core.connect(failed, 'Standard', 'UDP', 'bench@example.com', 'bench', **options)
+        start = time.perf_counter()
+        core.disconnect(name)
+        name = core.connect(backup, 'Standard', 'UDP', 'bench@example.com', 'bench', **options)
+        reconnects.append(time.perf_counter() - start)
+        core.disconnect(name)
+
+    cli = NordCore()  # nord-nm, sharing settings and profile cache with the core of the GUI
+    if not cli.authorize('bench'):
+        raise RuntimeError('the helper did not start')
+    unwanted_failovers = 0
+    for run in range(args.repeat):
+        name = core.connect(failed, 'Standard', 'UDP', 'bench@example.com', 'bench', **options)
+        core.prepare_standby(backup, 'Standard', 'UDP', 'bench@example.com', 'bench')
+        cli.disconnect(name)
+        # whatever reason NetworkManager reports, or none with the nmcli monitor, the GUI must not bring the standby up
+        if any(core.connection_failed(reason) for reason in nm_failure_reasons | {None}):
+            unwanted_failovers += 1
+            name = core.failover()
+            core.disconnect(name)
+        else:
+            core.remove_standby()
+    core.helper.stop()
+
+    report = {
+        'commit': git('rev-parse', 'HEAD'),
+        'dirty': bool(git('status', '--porcelain', '--untracked-files=no')),
+        'python': platform.python_version(),
+        'parameters': {'repeat': args.repeat, 'latency_ms': args.latency, 'nm_latency_ms': args.nm_latency,
+                       'up_latency_ms': args.up_latency, 'kill_switch': args.kill_switch},
+        'seconds': {'failover': summarize(failovers), 'reconnect': summarize(reconnects)},
+        'unwanted_failovers': unwanted_failovers}
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            print(output, file=output_file)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main(parse_args())
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+# Filter latency of get_server_list: full catalog scan versus the prebuilt ServerIndex
+# Usage: python benchmarks/bench_filter.py [size ...]
+import os
+import sys
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import catalog
+from nord_nm_core import build_index, server_type_options, category_types
+
+
+def scan_filter(api_data, country, server_type):
+    """
+    The per-filter work get_server_list did before the index existed
+    """
+    servers = []
+    for server in api_data:
+        server_types = [category_types[category['name']] for category in server['categories'] if category['name'] in category_types]
+        if server['country'] == country and server_type in server_types:
+            servers.append(server)
+    return sorted(servers, key=lambda server: server['load'])
+
+
+def best_of(fn, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main(sizes):
+    print('%8s %12s %12s %12s' % ('servers', 'scan (ms)', 'build (ms)', 'lookup (us)'))
+    for size in sizes:
+        api_data = catalog.generate(size)
+        filters = [(country, server_type) for country, _, _ in catalog.countries for server_type in server_type_options]
+        scan = best_of(lambda: [scan_filter(api_data, *f) for f in filters], repeat=1) / len(filters)
+        build = best_of(lambda: build_index(api_data), repeat=3)
+        index = build_index(api_data)
+        lookup = best_of(lambda: [index.lookup(*f) for f in filters]) / len(filters)
+        print('%8d %12.2f %12.2f %12.2f' % (size, scan * 1e3, build * 1e3, lookup * 1e6))
+
+
+if __name__ == '__main__':
+    main([int(size) for size in sys.argv[1:]] or [5000, 20000, 100000])
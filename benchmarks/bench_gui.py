@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+# End to end timings of MainWindow against fakenord.FakeNord and the nmcli / sudo shims, without a display
+# Usage: python benchmarks/bench_gui.py [--size N] [--repeat N] [--latency MS] [--nm-latency MS] [--kill-switch] [--output FILE]
+# The JSON result is tagged with the git commit, compare two of them with compare.py
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+bench_dir = os.path.dirname(os.path.abspath(__file__))
+repo_dir = os.path.dirname(bench_dir)
+sys.path.insert(0, repo_dir)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', type=int, default=5000, help='servers in the synthetic catalog')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per measurement')
+    parser.add_argument('--latency', type=float, default=20, help='API and CDN round trip in ms')
+    parser.add_argument('--nm-latency', type=float, default=10, help='duration of an nmcli or sudo call in ms')
+    parser.add_argument('--up-latency', type=float, default=200, help='extra duration of nmcli connection up in ms')
+    parser.add_argument('--kill-switch', action='store_true', help='connect and disconnect with the kill switch on')
+    parser.add_argument('--output', help='file for the JSON result, printed when omitted')
+    return parser.parse_args()
+
+
+def git(*args):
+    try:
+        return subprocess.run(('git',) + args, cwd=repo_dir, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                              universal_newlines=True).stdout.strip()
+    except OSError:
+        return ''
+
+
+def isolate(args):
+    """
+    Points HOME, PATH, Qt and keyring at throwaway stand-ins before anything reads them
+    """
+    os.environ['HOME'] = tempfile.mkdtemp(prefix='nord-bench-')
+    os.environ['PATH'] = os.path.join(bench_dir, 'shims') + os.pathsep + os.environ['PATH']
+    os.environ['QT_QPA_PLATFORM'] = 'offscreen'
+    os.environ['PYTHON_KEYRING_BACKEND'] = 'keyring.backends.null.Keyring'
+    os.environ['FAKE_NM_STATE'] = os.path.join(os.environ['HOME'], 'nm_state.json')
+    os.environ['FAKE_NM_LATENCY'] = str(args.nm_latency / 1e3)
+    os.environ['FAKE_NM_UP_LATENCY'] = str(args.up_latency / 1e3)
+    os.environ['FAKE_SUDO_LATENCY'] = str(args.nm_latency / 1e3)
+    os.environ['NORD_NM_HELPER_ROOT'] = os.path.join(os.environ['HOME'], 'root')  # the helper runs unprivileged
+
+
+def summarize(runs):
+    return {'runs': [round(run, 6) for run in runs], 'median': round(statistics.median(runs), 6),
+            'min': round(min(runs), 6), 'max': round(max(runs), 6)}
+
+
+def main(args):
+    isolate(args)
+    import catalog
+    from fakenord import FakeNord
+    from PyQt5 import QtCore, QtWidgets
+    app = QtWidgets.QApplication(sys.argv)
+    import nord_nm_core
+    import nord_nm_gui
+
+    servers = catalog.generate(args.size)
+    nord = FakeNord(servers, latency=args.latency / 1e3).start()
+    nord_nm_core.api = nord.api
+    nord_nm_core.token_api = nord.token_api
+    nord_nm_core.cdn = nord.url
+    nord_nm_core.config_archives = [nord.url + '/archives/servers/ovpn.zip']
+    nord_nm_core.dbus = None  # the shims stand in for NetworkManager, not the system bus
+
+    def wait_until(predicate, timeout=60):
+        deadline = time.monotonic() + timeout
+        while not predicate():
+            if time.monotonic() > deadline:
+                raise TimeoutError('benchmark step did not finish within %d seconds' % timeout)
+            app.processEvents(QtCore.QEventLoop.AllEvents, 5)
+            time.sleep(0.001)
+
+    def settle(window):
+        window.pool.waitForDone()
+        app.processEvents()
+
+    def start_window():
+        """
+        :return: (window, seconds in the constructor, seconds until the catalog is loaded, seconds to log in)
+        """
+        start = time.perf_counter()
+        window = nord_nm_gui.MainWindow()
+        constructed = time.perf_counter() - start
+        wait_until(lambda: len(window.server_index.store) > 0)
+        catalog_ready = time.perf_counter() - start
+        window.user_input.setText('bench@example.com')
+        window.password_input.setText('bench')
+        start = time.perf_counter()
+        window.verify_credentials()
+        wait_until(lambda: window.country_list is not None and window.country_list.count() > 0)
+        logged_in = time.perf_counter() - start
+        if not window.core.helper.running():  # answered sudo prompt
+            window.core.helper.start(sudo_password='bench')
+        return window, constructed, catalog_ready, logged_in
+
+    results = {}
+    windows = []
+    for phase in ('cold', 'warm'):  # warm starts find the catalog and configs of the cold ones on disk
+        constructed, ready, logged_in = [], [], []
+        for run in range(args.repeat):
+            if phase == 'cold':
+                os.environ['HOME'] = tempfile.mkdtemp(prefix='nord-bench-')
+            window, *timings = start_window()
+            for timing, samples in zip(timings, (constructed, ready, logged_in)):
+                samples.append(timing)
+            settle(window)
+            window.monitor.stop()
+            windows.append(window)
+        results[phase + '_start'] = summarize(constructed)
+        results[phase + '_catalog'] = summarize(ready)
+        results[phase + '_login'] = summarize(logged_in)
+
+    window = windows[-1]
+    country_list, server_list = [], []
+    for run in range(args.repeat):
+        start = time.perf_counter()
+        window.get_country_list()
+        country_list.append(time.perf_counter() - start)
+        for row in range(window.country_list.count()):
+            window.country_list.setCurrentRow(row)
+            start = time.perf_counter()
+            window.get_server_list()
+            server_list.append(time.perf_counter() - start)
+    results['get_country_list'] = summarize(country_list)
+    results['get_server_list'] = summarize(server_list)
+
+    window, *timings = start_window()  # a monitored window for the connection cycle
+    settle(window)
+    connects, disconnects = [], []
+    for run in range(args.repeat):
+        window.country_list.setCurrentRow(run % window.country_list.count())
+        window.get_server_list()
+        window.server_list.setCurrentIndex(window.server_model.index(0))
+        window.killswitch_btn.setChecked(args.kill_switch)
+        settle(window)
+        start = time.perf_counter()
+        window.connect()
+        wait_until(lambda: window.monitor.nord_connections() and window.disconnect_btn.isVisible())
+        connects.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        window.disconnect_vpn()
+        wait_until(lambda: not window.monitor.nord_connections() and window.connect_btn.isVisible())
+        disconnects.append(time.perf_counter() - start)
+    results['connect'] = summarize(connects)
+    results['disconnect'] = summarize(disconnects)
+    window.monitor.stop()
+
+    report = {
+        'commit': git('rev-parse', 'HEAD'),
+        'dirty': bool(git('status', '--porcelain', '--untracked-files=no')),
+        'python': platform.python_version(),
+        'parameters': {'size': args.size, 'repeat': args.repeat, 'latency_ms': args.latency,
+                       'nm_latency_ms': args.nm_latency, 'up_latency_ms': args.up_latency,
+                       'kill_switch': args.kill_switch},
+        'seconds': results}
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            print(output, file=output_file)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main(parse_args())
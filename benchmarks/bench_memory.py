@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+# Resident size of the catalog and allocations per filter change: raw json dicts versus ServerStore
+# Usage: python benchmarks/bench_memory.py [size ...]
+import gc
+import json
+import os
+import sys
+import tracemalloc
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import catalog
+from bench_filter import scan_filter
+from nord_nm_core import build_index, server_city, server_label, server_type_options, ServerInfo, category_types, category_labels
+
+
+def retained(build):
+    """
+    :return: tuple of (object built, bytes still allocated once it is built)
+    """
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+
+def peak(fn):
+    """
+    :return: peak bytes allocated while fn runs
+    """
+    gc.collect()
+    tracemalloc.start()
+    fn()
+    size = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return size
+
+
+def legacy_filter(api_data, country, server_type):
+    """
+    Records and labels the json based get_server_list built on every filter change
+    """
+    servers = []
+    for server in scan_filter(api_data, country, server_type):
+        labels = [category_labels.get(category['name'], category['name']) for category in server['categories']]
+        server_types = [category_types[category['name']] for category in server['categories'] if category['name'] in category_types]
+        servers.append(ServerInfo(id=server['id'], name=server['name'], country=server['country'],
+                                  city=server_city(server), domain=server['domain'],
+                                  type=server_types, load=server['load'], categories=' '.join(labels)))
+    return [server_label(server) for server in servers]
+
+
+def main(sizes):
+    print('%8s %14s %14s %16s %16s' % ('servers', 'json (KiB)', 'store (KiB)', 'json filter (KiB)', 'store filter (KiB)'))
+    for size in sizes:
+        payload = json.dumps(catalog.generate(size))
+        api_data, json_size = retained(lambda: json.loads(payload))
+        index, store_size = retained(lambda: build_index(json.loads(payload)))
+        filters = [(country, server_type) for country, _, _ in catalog.countries for server_type in server_type_options]
+        json_filter = max(peak(lambda: legacy_filter(api_data, *f)) for f in filters[:10])
+        store_filter = max(peak(lambda: index.lookup(*f)) for f in filters[:10])
+        print('%8d %14.0f %14.0f %16.1f %16.1f' % (size, json_size / 1024, store_size / 1024, json_filter / 1024, store_filter / 1024))
+
+
+if __name__ == '__main__':
+    main([int(size) for size in sys.argv[1:]] or [5000, 20000, 100000])
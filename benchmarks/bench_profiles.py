@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+# Connect to a server whose connection the profile cache kept against one that is imported, and one garbage collection
+# Usage: python benchmarks/bench_profiles.py [--repeat N] [--latency MS] [--nm-latency MS] [--up-latency MS] [--orphans N]
+# Runs NordCore against fakenord.FakeNord and the nmcli / sudo shims, the JSON result can be compared with compare.py
+import argparse
+import contextlib
+import json
+import os
+import platform
+import sys
+import time
+
+bench_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(bench_dir))
+
+from bench_gui import git, isolate, summarize
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', type=int, default=5000, help='servers in the synthetic catalog')
+    parser.add_argument('--repeat', type=int, default=10, help='runs per measurement')
+    parser.add_argument('--latency', type=float, default=20, help='API and CDN round trip in ms')
+    parser.add_argument('--nm-latency', type=float, default=10, help='duration of an nmcli or sudo call in ms')
+    parser.add_argument('--up-latency', type=float, default=200, help='extra duration of nmcli connection up in ms')
+    parser.add_argument('--orphans', type=int, default=20, help='connections left behind by crashes before collect')
+    parser.add_argument('--output', help='file for the JSON result, printed when omitted')
+    return parser.parse_args()
+
+
+def main(args):
+    isolate(args)
+    import catalog
+    from fakenord import FakeNord
+    import nord_nm_core
+    from nord_nm_core import NordCore, NetworkManagerError, build_index, connection_name
+
+    servers = catalog.generate(args.size)
+    nord = FakeNord(servers, latency=args.latency / 1e3).start()
+    nord_nm_core.cdn = nord.url
+    nord_nm_core.dbus = None  # the shims stand in for NetworkManager, not the system bus
+    core = NordCore()
+    core.setup()
+    if not core.authorize('bench'):
+        raise RuntimeError('the helper did not start')
+    server_index = build_index(servers)
+    kept, imported = server_index.lookup(server_index.store.countries[0], 'Standard')[:2]
+    core.get_config(imported.domain, 'udp')  # configs are stored, as after an archive refresh
+    core.disconnect(core.connect(kept, 'Standard', 'UDP', 'bench@example.com', 'bench'))
+
+    kept_connects, imported_connects = [], []
+    for run in range(args.repeat):
+        start = time.perf_counter()
+        name = core.connect(kept, 'Standard', 'UDP', 'bench@example.com', 'bench')
+        kept_connects.append(time.perf_counter() - start)
+        core.disconnect(name)
+        with contextlib.suppress(NetworkManagerError):  # never kept, as for a server connected to first
+            core.profiles.discard(connection_name(imported, 'UDP'))
+        start = time.perf_counter()
+        name = core.connect(imported, 'Standard', 'UDP', 'bench@example.com', 'bench')
+        imported_connects.append(time.perf_counter() - start)
+        core.disconnect(name)
+
+    collects = []
+    for run in range(args.repeat):
+        with open(os.environ['FAKE_NM_STATE']) as state_file:
+            state = json.load(state_file)
+        state['connections'] += [connection_name(server, 'TCP') for server in server_index.lookup(None, 'P2P')[:args.orphans]]
+        with open(os.environ['FAKE_NM_STATE'], 'w') as state_file:
+            json.dump(state, state_file)
+        start = time.perf_counter()
+        core.collect_profiles()
+        collects.append(time.perf_counter() - start)
+    core.helper.stop()
+
+    report = {
+        'commit': git('rev-parse', 'HEAD'),
+        'dirty': bool(git('status', '--porcelain', '--untracked-files=no')),
+        'python': platform.python_version(),
+        'parameters': {'repeat': args.repeat, 'latency_ms': args.latency, 'nm_latency_ms': args.nm_latency,
+                       'up_latency_ms': args.up_latency, 'orphans': args.orphans},
+        'seconds': {'connect_kept': summarize(kept_connects), 'connect_imported': summarize(imported_connects),
+                    'collect': summarize(collects)}}
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            print(output, file=output_file)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main(parse_args())
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+# Connect latency of race mode against connecting to the selected server only, when some handshakes are slow
+# Usage: python benchmarks/bench_race.py [--repeat N] [--slow-share F] [--slow-latency S] [--up-latency MS] [--candidates N]
+# A share of the activations of the nmcli shim take --slow-latency seconds longer, as a server slow to complete its TLS
+# handshake does. The connections are kept by the profile cache before timing, so only the activations are compared.
+# Runs NordCore against fakenord.FakeNord and the nmcli / sudo shims, the JSON result can be compared with compare.py
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+bench_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(bench_dir))
+
+from bench_gui import git, isolate, summarize
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', type=int, default=5000, help='servers in the synthetic catalog')
+    parser.add_argument('--repeat', type=int, default=20, help='connects per measurement')
+    parser.add_argument('--candidates', type=int, default=3, help='servers raced against each other')
+    parser.add_argument('--slow-share', type=float, default=0.25, help='share of the activations that are slow')
+    parser.add_argument('--slow-latency', type=float, default=5, help='extra duration of a slow activation in seconds')
+    parser.add_argument('--latency', type=float, default=20, help='API and CDN round trip in ms')
+    parser.add_argument('--nm-latency', type=float, default=10, help='duration of an nmcli or sudo call in ms')
+    parser.add_argument('--up-latency', type=float, default=200, help='extra duration of nmcli connection up in ms')
+    parser.add_argument('--output', help='file for the JSON result, printed when omitted')
+    return parser.parse_args()
+
+
+def main(args):
+    isolate(args)
+    import catalog
+    from fakenord import FakeNord
+    import nord_nm_core
+    from nord_nm_core import NordCore, build_index, percentile
+
+    servers = catalog.generate(args.size)
+    nord = FakeNord(servers, latency=args.latency / 1e3).start()
+    nord_nm_core.cdn = nord.url
+    nord_nm_core.dbus = None  # the shims stand in for NetworkManager, not the system bus
+    core = NordCore()
+    core.setup()
+    if not core.authorize('bench'):
+        raise RuntimeError('the helper did not start')
+    server_index = build_index(servers)
+    candidates = list(server_index.lookup(server_index.store.countries[0], 'Standard')[:args.candidates])
+    core.disconnect(core.connect(candidates[0], 'Standard', 'UDP', 'bench@example.com', 'bench',
+                                 alternatives=candidates[1:]))  # all of them are kept before timing
+    os.environ['FAKE_NM_SLOW_SHARE'] = str(args.slow_share)
+    os.environ['FAKE_NM_SLOW_LATENCY'] = str(args.slow_latency)
+
+    connects = {'selected': [], 'race': []}
+    for run in range(args.repeat):
+        for mode, alternatives in (('selected', ()), ('race', candidates[1:])):
+            start = time.perf_counter()
+            name = core.connect(candidates[0], 'Standard', 'UDP', 'bench@example.com', 'bench', alternatives=alternatives)
+            connects[mode].append(time.perf_counter() - start)
+            core.disconnect(name)
+    core.helper.stop()
+
+    report = {
+        'commit': git('rev-parse', 'HEAD'),
+        'dirty': bool(git('status', '--porcelain', '--untracked-files=no')),
+        'python': platform.python_version(),
+        'parameters': {'repeat': args.repeat, 'candidates': args.candidates, 'slow_share': args.slow_share,
+                       'slow_latency': args.slow_latency, 'nm_latency_ms': args.nm_latency,
+                       'up_latency_ms': args.up_latency},
+        'tail': {mode: {'p90': round(percentile(runs, 90), 6), 'p99': round(percentile(runs, 99), 6)}
+                 for mode, runs in connects.items()},
+        'seconds': {'connect_' + mode: summarize(runs) for mode, runs in connects.items()}}
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            print(output, file=output_file)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main(parse_args())
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+# Cost of applying a refreshed catalog as changes against rebuilding the server and search indexes from scratch
+# Usage: python benchmarks/bench_refresh.py [size ...]
+import copy
+import os
+import random
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import catalog
+from bench_filter import best_of
+from nord_nm_core import build_index, update_index, SearchIndex
+
+fractions = [0.001, 0.01, 0.1]  # share of the servers whose load changes between two downloads
+
+
+def refreshed(api_data, fraction, seed=0):
+    """
+    :return: copy of api_data with the loads of fraction of the servers changed, one server removed and one added
+    """
+    rng = random.Random(seed)
+    api_data = copy.deepcopy(api_data)
+    for server in rng.sample(api_data, max(1, int(len(api_data) * fraction))):
+        server['load'] = (server['load'] + rng.randint(1, 50)) % 101
+    added = copy.deepcopy(api_data.pop())
+    added['id'] += len(api_data) + 1
+    added['name'] += ' (new)'
+    api_data.insert(0, added)
+    return api_data
+
+
+def main(sizes):
+    print('%8s %9s %9s %12s %12s %12s %12s' % ('servers', 'loads', 'changed', 'update (ms)', 'search (ms)',
+                                              'build (ms)', 'reindex (ms)'))
+    for size in sizes:
+        api_data = catalog.generate(size)
+        server_index = build_index(api_data)
+        search_index = SearchIndex().updated(server_index.store)
+        build = best_of(lambda: build_index(api_data), repeat=3)
+        reindex = best_of(lambda: SearchIndex().updated(server_index.store), repeat=3)
+        for fraction in fractions:
+            new_data = refreshed(api_data, fraction)
+            update = best_of(lambda: update_index(server_index, new_data), repeat=3)
+            updated = update_index(server_index, new_data)
+            search = best_of(lambda: search_index.updated(updated.store, updated.changed), repeat=3)
+            print('%8d %8.1f%% %9d %12.2f %12.2f %12.2f %12.2f' % (size, fraction * 100, len(updated.changed),
+                                                                  update * 1e3, search * 1e3, build * 1e3, reindex * 1e3))
+
+
+if __name__ == '__main__':
+    main([int(size) for size in sys.argv[1:]] or [5000, 20000, 100000])
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+# Keystroke latency of the server search and the cost of indexing a catalog and a refreshed copy of it
+# Usage: python benchmarks/bench_search.py [size ...]
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import catalog
+from bench_filter import best_of
+from nord_nm_core import build_index, SearchIndex
+
+queries = ['us9', 'Zurich', 'new york', 'de12', 'Germany #17']
+
+
+def keystrokes(query):
+    """
+    :return: every prefix of query as it is typed
+    """
+    return [query[:length] for length in range(1, len(query) + 1)]
+
+
+def main(sizes):
+    print('%8s %12s %14s %16s %16s' % ('servers', 'build (ms)', 'refresh (ms)', 'keystroke (us)', 'worst key (us)'))
+    for size in sizes:
+        api_data = catalog.generate(size)
+        store = build_index(api_data).store
+        build = best_of(lambda: SearchIndex().updated(store), repeat=3)
+        search = SearchIndex().updated(store)
+        for server in api_data[::50]:  # a refresh where a few servers were renamed
+            server['name'] += ' (renamed)'
+        refreshed = build_index(api_data).store
+        refresh = best_of(lambda: search.updated(refreshed), repeat=3)
+        typed = [prefix for query in queries for prefix in keystrokes(query)]
+        keystroke = best_of(lambda: [search.search(prefix) for prefix in typed]) / len(typed)
+        worst = max(best_of(lambda: search.search(prefix)) for prefix in typed)
+        print('%8d %12.2f %14.2f %16.1f %16.1f' % (size, build * 1e3, refresh * 1e3, keystroke * 1e6, worst * 1e6))
+
+
+if __name__ == '__main__':
+    main([int(size) for size in sys.argv[1:]] or [5000, 20000, 100000])
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+# Startup time of the GUI against fakenord.FakeNord and the nmcli / sudo shims, without a display
+# Usage: python benchmarks/bench_startup.py [--size N] [--repeat N] [--latency MS] [--check] [--output FILE]
+# Every run is a fresh interpreter: cold runs start without a config directory, warm runs find the catalog and the
+# saved login of an earlier run. --check exits with 1 when a median exceeds the budget or a deferred module is
+# loaded by the import, the JSON result can be compared with compare.py like the one of bench_gui.py
+import argparse
+import compileall
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+bench_dir = os.path.dirname(os.path.abspath(__file__))
+repo_dir = os.path.dirname(bench_dir)
+sys.path.insert(0, repo_dir)
+
+# seconds, medians of cold and warm runs
+budget = {
+    'import': 0.2,  # PyQt5, nord_nm_gui and nord_nm_core
+    'first_paint': 0.3,  # interpreter start until the login window is painted
+}
+# modules that are loaded by the first request, keyring access, connect or archive refresh instead of the import
+deferred_modules = ['requests', 'urllib3', 'keyring', 'prctl', 'uuid', 'zipfile', 'logging.handlers', 'concurrent.futures']
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', type=int, default=5000, help='servers in the synthetic catalog')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per phase')
+    parser.add_argument('--latency', type=float, default=20, help='API and CDN round trip in ms')
+    parser.add_argument('--nm-latency', type=float, default=10, help='duration of an nmcli or sudo call in ms')
+    parser.add_argument('--check', action='store_true', help='exit with 1 if the startup is over budget')
+    parser.add_argument('--output', help='file for the JSON result, printed when omitted')
+    parser.add_argument('--child', choices=['measure', 'prepare'], help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def git(*args):
+    try:
+        return subprocess.run(('git',) + args, cwd=repo_dir, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                              universal_newlines=True).stdout.strip()
+    except OSError:
+        return ''
+
+
+def child(mode):
+    """
+    Starts the GUI once and prints its timings as JSON, run by run_child() in a fresh interpreter
+    prepare also waits for the catalog download and saves a login for the warm runs
+    """
+    start = time.perf_counter()
+    preloaded = set(sys.modules)  # site-packages hooks may load some of them into every interpreter
+    from PyQt5 import QtCore, QtWidgets
+    import nord_nm_gui
+    import nord_nm_core
+    imported = time.perf_counter() - start
+    loaded_by_import = [name for name in deferred_modules if name in sys.modules and name not in preloaded]
+    url = os.environ['NORD_BENCH_URL']
+    nord_nm_core.api = url + '/server'
+    nord_nm_core.token_api = url + '/v1/users/tokens'
+    nord_nm_core.cdn = url
+    nord_nm_core.config_archives = [url + '/archives/servers/ovpn.zip']
+    nord_nm_core.dbus = None
+
+    timings = {'import': imported}
+    loaded_by_paint = []
+
+    class PaintFilter(QtCore.QObject):
+        def eventFilter(self, watched, event):
+            if event.type() == QtCore.QEvent.Paint and 'first_paint' not in timings:
+                timings['first_paint'] = time.perf_counter() - start
+                loaded_by_paint.extend(name for name in deferred_modules if name in sys.modules and name not in preloaded)
+            return False
+
+    app = QtWidgets.QApplication(sys.argv)
+    paint_filter = PaintFilter()
+    app.installEventFilter(paint_filter)
+    constructing = time.perf_counter()
+    window = nord_nm_gui.MainWindow()
+    timings['constructor'] = time.perf_counter() - constructing
+    deadline = time.monotonic() + 60
+    while 'first_paint' not in timings or not len(window.server_index.store):
+        if time.monotonic() > deadline:
+            raise TimeoutError('the window was not painted or the catalog not loaded within 60 seconds')
+        app.processEvents(QtCore.QEventLoop.AllEvents, 5)
+        time.sleep(0.001)
+    timings['catalog'] = time.perf_counter() - start
+    if mode == 'prepare':
+        window.pool.waitForDone()
+        window.core.config['USER']['USER_NAME'] = 'bench@example.com'
+        window.core.write_conf()
+    print(json.dumps({'seconds': timings, 'loaded_by_import': loaded_by_import, 'loaded_by_paint': loaded_by_paint}))
+    sys.stdout.flush()
+    os._exit(0)  # workers still revalidating the configs are abandoned
+
+
+def run_child(mode, home, url, args):
+    env = dict(os.environ)
+    env.update({
+        'HOME': home,
+        'PATH': os.path.join(bench_dir, 'shims') + os.pathsep + os.environ['PATH'],
+        'QT_QPA_PLATFORM': 'offscreen',
+        'PYTHON_KEYRING_BACKEND': 'keyring.backends.null.Keyring',
+        'FAKE_NM_STATE': os.path.join(home, 'nm_state.json'),
+        'FAKE_NM_LATENCY': str(args.nm_latency / 1e3),
+        'FAKE_SUDO_LATENCY': str(args.nm_latency / 1e3),
+        'NORD_NM_HELPER_ROOT': os.path.join(home, 'root'),
+        'NORD_BENCH_URL': url,
+        'PYTHONPATH': os.pathsep.join(filter(None, [repo_dir, os.environ.get('PYTHONPATH')]))})
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', mode], env=env,
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True, timeout=120)
+    if output.returncode:
+        raise RuntimeError('startup run failed with exit status %d' % output.returncode)
+    return json.loads(output.stdout.splitlines()[-1])
+
+
+def summarize(runs):
+    return {'runs': [round(run, 6) for run in runs], 'median': round(statistics.median(runs), 6),
+            'min': round(min(runs), 6), 'max': round(max(runs), 6)}
+
+
+def main(args):
+    import catalog
+    from fakenord import FakeNord
+    compileall.compile_dir(repo_dir, maxlevels=0, quiet=1)  # an installed copy does not compile on startup either
+    nord = FakeNord(catalog.generate(args.size), latency=args.latency / 1e3).start()
+    nord.handle_error = lambda request, client_address: None  # runs end while the config archive is still downloading
+    warm_home = tempfile.mkdtemp(prefix='nord-bench-')
+    run_child('prepare', warm_home, nord.base, args)
+
+    results = {}
+    loaded_by_import, loaded_by_paint = set(), set()
+    for phase in ('cold', 'warm'):
+        runs = []
+        for run in range(args.repeat):
+            home = tempfile.mkdtemp(prefix='nord-bench-') if phase == 'cold' else warm_home
+            runs.append(run_child('measure', home, nord.base, args))
+        for name in runs[0]['seconds']:
+            results[phase + '_' + name] = summarize([run['seconds'][name] for run in runs])
+        for run in runs:
+            loaded_by_import.update(run['loaded_by_import'])
+            loaded_by_paint.update(run['loaded_by_paint'])
+
+    report = {
+        'commit': git('rev-parse', 'HEAD'),
+        'dirty': bool(git('status', '--porcelain', '--untracked-files=no')),
+        'python': platform.python_version(),
+        'parameters': {'size': args.size, 'repeat': args.repeat, 'latency_ms': args.latency,
+                       'nm_latency_ms': args.nm_latency},
+        'budget': budget,
+        'loaded_by_import': sorted(loaded_by_import),
+        'loaded_by_paint': sorted(loaded_by_paint),
+        'seconds': results}
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            print(output, file=output_file)
+    else:
+        print(output)
+
+    if args.check:
+        failures = ['%s_%s: %.0f ms over the budget of %.0f ms' % (phase, name, results[phase + '_' + name]['median'] * 1e3,
+                                                                 limit * 1e3)
+                    for phase in ('cold', 'warm') for name, limit in budget.items()
+                    if results[phase + '_' + name]['median'] > limit]
+        failures += ['%s is loaded by the import' % name for name in sorted(loaded_by_import)]
+        for failure in failures:
+            print('startup budget exceeded: ' + failure, file=sys.stderr)
+        return 1 if failures else 0
+    return 0
+
+
+if __name__ == '__main__':
+    arguments = parse_args()
+    if arguments.child:
+        child(arguments.child)
+    sys.exit(main(arguments))
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+# Synthetic server catalogs shaped like the api.nordvpn.com/server payload
+import random
+
+categories = ['Standard VPN servers', 'P2P', 'Double VPN', 'Onion Over VPN', 'Dedicated IP', 'Obfuscated Servers', 'Anti-DDoS']
+countries = [
+    ('United States', 'US', 'New York'), ('Germany', 'DE', 'Frankfurt'), ('Switzerland', 'CH', 'Zurich'),
+    ('Japan', 'JP', 'Tokyo'), ('France', 'FR', 'Paris'), ('Canada', 'CA', 'Toronto'), ('Netherlands', 'NL', 'Amsterdam'),
+    ('Sweden', 'SE', 'Stockholm'), ('United Kingdom', 'UK', 'London'), ('Australia', 'AU', 'Sydney'),
+    ('Singapore', 'SG', 'Singapore'), ('Brazil', 'BR', 'Sao Paulo'), ('Italy', 'IT', 'Milan'), ('Spain', 'ES', 'Madrid'),
+    ('Poland', 'PL', 'Warsaw'), ('Norway', 'NO', 'Oslo'), ('Finland', 'FI', 'Helsinki'), ('Denmark', 'DK', 'Copenhagen'),
+    ('Austria', 'AT', 'Vienna'), ('Belgium', 'BE', 'Brussels')]
+
+
+def generate(size, seed=0):
+    """
+    Builds a catalog of size servers spread over the countries above
+
+    :param seed: seed of the random generator so runs are comparable
+    :return: list of server dictionaries in the format of the API
+    """
+    rng = random.Random(seed)
+    servers = []
+    for server_id in range(1, size + 1):
+        country, code, city = rng.choice(countries)
+        number = server_id
+        server_categories = rng.sample(categories[:5], rng.choice((1, 1, 1, 2)))
+        servers.append({
+            'id': server_id,
+            'name': '%s #%d' % (country, number),
+            'domain': '%s%d.nordvpn.com' % (code.lower(), number),
+            'ip_address': '10.%d.%d.%d' % ((server_id >> 16) & 255, (server_id >> 8) & 255, server_id & 255),
+            'country': country,
+            'flag': code,
+            'load': rng.randint(0, 100),
+            'categories': [{'name': name} for name in server_categories],
+            'location': {'lat': rng.uniform(-90, 90), 'long': rng.uniform(-180, 180)},
+            'search_keywords': [],
+            'price': 0,
+            'features': {'ikev2': True, 'openvpn_udp': True, 'openvpn_tcp': True, 'socks': False, 'proxy': False,
+                         'pptp': False, 'l2tp': False, 'openvpn_xor_udp': False, 'openvpn_xor_tcp': False,
+                         'proxy_cybersec': False, 'proxy_ssl': False, 'proxy_ssl_cybersec': False},
+            'locations': [{'country': {'name': country, 'code': code, 'city': {'name': city}}}]})
+    return servers
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+# Local stand-in for downloads.nordcdn.com serving generated configuration files
+import io
+import threading
+import time
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ovpn_template = (
+    'client\ndev tun\nproto {proto}\nremote {ip} {port}\nresolv-retry infinite\nremote-random\nnobind\n'
+    'tun-mtu 1500\nmssfix 1450\nping 15\nping-restart 0\nreneg-sec 0\ncomp-lzo no\nverify-x509-name CN={domain}\n'
+    'remote-cert-tls server\nauth-user-pass\ncipher AES-256-CBC\nauth SHA512\n<ca>\n-----BEGIN CERTIFICATE-----\n{pad}\n-----END CERTIFICATE-----\n</ca>\n'
+    'key-direction 1\n<tls-auth>\n-----BEGIN OpenVPN Static key V1-----\n{pad}\n-----END OpenVPN Static key V1-----\n</tls-auth>\n')
+
+
+def ovpn(server, proto):
+    return ovpn_template.format(proto=proto, ip=server['ip_address'], port=1194 if proto == 'udp' else 443,
+                                domain=server['domain'], pad='A' * 64 + ('\n' + 'A' * 64) * 25).encode('utf-8')
+
+
+def archive(servers):
+    """
+    :return: bytes of an ovpn.zip archive for servers
+    """
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        for server in servers:
+            for proto in ('udp', 'tcp'):
+                zip_file.writestr('ovpn_%s/%s.%s.ovpn' % (proto, server['domain'], proto), ovpn(server, proto))
+    return buffer.getvalue()
+
+
+class CDN(ThreadingHTTPServer):
+    """
+    Serves /configs/files/ovpn_<proto>/servers/<file> and /configs/archives/servers/ovpn.zip
+    Every response is delayed by latency seconds to stand in for the round trip to the real CDN
+    The archive is revalidated against etag, tests replace both to publish an updated archive
+    """
+    daemon_threads = True
+
+    def __init__(self, servers, latency=0.0, handler=None):
+        super(CDN, self).__init__(('127.0.0.1', 0), handler or CDNHandler)
+        self.servers = {server['domain']: server for server in servers}
+        self.latency = latency
+        self.archive = archive(servers)
+        self.etag = '"archive"'
+        self.requests = 0
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d/configs' % self.server_port
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class CDNHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.requests += 1
+        time.sleep(self.server.latency)
+        body = None
+        if self.path.endswith('/archives/servers/ovpn.zip'):
+            if self.headers.get('If-None-Match') == self.server.etag:
+                self.send_response(304)
+                self.end_headers()
+                return
+            body = self.server.archive
+        elif self.path.endswith('.ovpn'):
+            domain, proto = self.path.rsplit('/', 1)[1].rsplit('.', 2)[:2]
+            if domain in self.server.servers:
+                body = ovpn(self.server.servers[domain], proto)
+        if body is None:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('ETag', self.server.etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
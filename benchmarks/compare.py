@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+# Side by side medians of two bench_gui.py results
+# Usage: python benchmarks/compare.py BASELINE.json CANDIDATE.json
+import json
+import sys
+
+
+def main(baseline_path, candidate_path):
+    with open(baseline_path) as baseline_file, open(candidate_path) as candidate_file:
+        baseline, candidate = json.load(baseline_file), json.load(candidate_file)
+    if baseline['parameters'] != candidate['parameters']:
+        print('warning: parameters differ %s / %s' % (baseline['parameters'], candidate['parameters']))
+    print('%-18s %12s %12s %8s' % ('', baseline['commit'][:10], candidate['commit'][:10], 'ratio'))
+    for name, result in baseline['seconds'].items():
+        if name not in candidate['seconds']:
+            continue
+        before, after = result['median'], candidate['seconds'][name]['median']
+        print('%-18s %10.2fms %10.2fms %7.2fx' % (name, before * 1e3, after * 1e3, after / before if before else float('nan')))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:3])
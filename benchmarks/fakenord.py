@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+# Local stand-in for api.nordvpn.com (server catalog and tokens) and the configuration CDN
+import json
+import time
+
+from cdn import CDN, CDNHandler
+
+
+class FakeNord(CDN):
+    """
+    Serves /server, /v1/users/tokens and the CDN paths of cdn.CDN on one port
+    The catalog carries an ETag so revalidations of an unchanged catalog are answered with 304
+    Logins with the password 'wrong' are rejected
+    """
+    def __init__(self, servers, latency=0.0):
+        super(FakeNord, self).__init__(servers, latency=latency, handler=FakeNordHandler)
+        self.catalog = json.dumps(servers).encode('utf-8')
+
+    @property
+    def base(self):
+        return 'http://127.0.0.1:%d' % self.server_port
+
+    @property
+    def api(self):
+        return self.base + '/server'
+
+    @property
+    def token_api(self):
+        return self.base + '/v1/users/tokens'
+
+
+class FakeNordHandler(CDNHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/server':
+            return super(FakeNordHandler, self).do_GET()
+        self.server.requests += 1
+        time.sleep(self.server.latency)
+        if self.headers.get('If-None-Match') == '"catalog"':
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('ETag', '"catalog"')
+        self.send_header('Content-Length', str(len(self.server.catalog)))
+        self.end_headers()
+        self.wfile.write(self.server.catalog)
+
+    def do_POST(self):
+        self.server.requests += 1
+        time.sleep(self.server.latency)
+        credentials = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        if self.path != '/v1/users/tokens':
+            status, body = 404, {}
+        elif credentials.get('password') == 'wrong':
+            status, body = 401, {'errors': {'message': 'Invalid username or password'}}
+        else:
+            status, body = 201, {'token': 'bench', 'renew_token': 'bench', 'expires_at': '2099-01-01 00:00:00'}
+        body = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
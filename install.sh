@@ -38,3 +38,12 @@ Categories=Internet;System;Utilities;" | sudo tee $DESK_PATH/nordvpn.desktop > /
 
 sudo chmod +x $DESK_PATH/nordvpn.desktop
 
+
+# the release build only contains the GUI, the command line client runs from a source checkout
+if [ -f "$current_dir"/nord_nm_cli.py ]
+then
+    echo "Linking the nord-nm command line client in /usr/local/bin"
+    sudo ln -sf "$current_dir"/nord_nm_cli.py /usr/local/bin/nord-nm
+else
+    echo "The nord-nm command line client is not part of this build, run install.sh from a source checkout to link it"
+fi
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# NordVPN-NetworkManager-GUI command line client, needs neither Qt nor a display
+# Copyright (C) 2018 Vincent Foster-Mueller
+# Usage: nord-nm [--config-dir DIR] {list,connect,disconnect,status} [options], see nord-nm <command> --help
+import argparse
+import getpass
+import sys
+from array import array
+
+from nord_nm_core import (NordCore, NetworkManagerError, HelperError, ServerView, SearchIndex,
+                          parse_connection_name, search_key, connection_type_options, server_type_options,
+                          probe_candidates, race_candidates)
+
+
+class CommandError(Exception):
+    pass
+
+
+def find_servers(core, args):
+    """
+    :return: ServerView of the servers matching the query, --country and --type arguments, best match first
+    """
+    server_index = core.load_catalog()
+    store = server_index.store
+    if not len(store):
+        raise CommandError('no server catalog, check the network connection')
+    country = None
+    if args.country:
+        countries = {search_key(name): name for name in store.countries}
+        country = countries.get(search_key(args.country))
+        if country is None:
+            raise CommandError('unknown country ' + args.country)
+    if not args.query:
+        return server_index.lookup(country, args.type)
+    servers = SearchIndex().updated(store).search(args.query, args.type)
+    if country is not None:
+        country_id = store.country_lookup[country]
+        servers = ServerView(store, array('I', (row for row in servers.rows if store.country_ids[row] == country_id)))
+    return servers
+
+
+def credentials(core, args):
+    """
+    :return: (username, password), the ones saved by the GUI unless --user names another account
+    """
+    username = args.user or core.saved_username() or input('Email: ')
+    password = None
+    if username == core.saved_username():
+        try:
+            password = core.saved_password(username)
+        except Exception:  # no usable keyring, ask instead
+            pass
+    return username, password or getpass.getpass('NordVPN password: ')
+
+
+def authorize(core):
+    """
+    Starts the privileged helper through polkit or, failing that, sudo
+    """
+    if not core.authorize() and not core.authorize(getpass.getpass('[sudo] password for the NetworkManager helper: ')):
+        raise CommandError('could not start the privileged helper')
+
+
+def list_servers(core, args):
+    servers = find_servers(core, args)
+    for server in servers[:args.limit]:
+        print('{:<28}{:<24}{:>4}%  {:<16}{}'.format(server.name, server.domain, server.load, server.city, server.categories))
+    if len(servers) > args.limit:
+        print('... %d more, raise --limit to see them' % (len(servers) - args.limit))
+    return 0 if servers else 1
+
+
+def connect(core, args):
+    servers = find_servers(core, args)
+    if not servers:
+        raise CommandError('no server matches')
+    server = servers[0]
+    options = {}  # settings are read before a disconnect clears them
+    for option, setting in (('auto_connect', 'auto_connect'), ('kill_switch', 'kill_switch'), ('randomize_mac', 'mac_randomizer'),
+                            ('race', 'race')):
+        options[option] = core.setting(setting) if getattr(args, option) is None else getattr(args, option)
+    if options.pop('race'):
+        options['alternatives'] = [candidate for candidate in servers[:race_candidates] if candidate.id != server.id][:race_candidates - 1]
+    if args.fastest:
+        options['fastest'] = servers[:probe_candidates]
+    username, password = credentials(core, args)
+    authorize(core)
+
+    active = core.active_connection()
+    if active:
+        for error in core.disconnect(active):
+            print('nord-nm: disconnecting ' + active + ' failed at ' + error, file=sys.stderr)
+    core.collect_profiles()  # a connection left behind by a crash must not shadow the one imported now
+    name = core.connect(server, args.type, args.protocol, username, password, **options)
+    print('Connected to ' + name)
+    return 0
+
+
+def disconnect(core, args):
+    name = core.active_connection()
+    if name is None:
+        print('Not connected')
+        return 0
+    authorize(core)
+    errors = core.disconnect(name)
+    for error in errors:
+        print('nord-nm: ' + error, file=sys.stderr)
+    print('Disconnected from ' + name)
+    return 1 if errors else 0
+
+
+def status(core, args):
+    name = core.active_connection()
+    if name is None:
+        print('Disconnected')
+        return 1
+    connection = parse_connection_name(name)
+    print('Connected to ' + connection.server)
+    print('Server type: ' + ', '.join(connection.type))
+    print('Protocol:    ' + connection.protocol)
+    print('Kill switch: ' + ('on' if core.setting('kill_switch') else 'off'))
+    print('Auto connect: ' + ('on' if core.setting('auto_connect') else 'off'))
+    return 0
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog='nord-nm', description='NordVPN through NetworkManager, without the GUI')
+    parser.add_argument('--config-dir', help='settings and caches of the GUI (default ~/.nordnmconfigs)')
+    commands = parser.add_subparsers(dest='command', required=True, metavar='{list,connect,disconnect,status}')
+
+    def add_filter(command):
+        command.add_argument('query', nargs='?', help='server name, domain or city, e.g. "us9" or "Zurich"')
+        command.add_argument('--country', help='only servers in this country')
+        command.add_argument('--type', default='Standard', choices=server_type_options, help='server type (default Standard)')
+
+    list_command = commands.add_parser('list', help='list servers, lowest load first')
+    add_filter(list_command)
+    list_command.add_argument('--limit', type=int, default=20, help='servers shown (default 20)')
+    list_command.set_defaults(run=list_servers)
+
+    connect_command = commands.add_parser('connect', help='connect to the best matching server')
+    add_filter(connect_command)
+    connect_command.add_argument('--fastest', action='store_true',
+                                 help='probe the %d lowest load matches and connect to the fastest' % probe_candidates)
+    connect_command.add_argument('--protocol', default='UDP', type=str.upper, choices=connection_type_options)
+    connect_command.add_argument('--user', help='NordVPN account, defaults to the one saved by the GUI')
+    for option in ('kill-switch', 'auto-connect', 'randomize-mac', 'race'):
+        connect_command.add_argument('--' + option, action=argparse.BooleanOptionalAction,
+                                     help='defaults to the setting of the GUI')
+    connect_command.set_defaults(run=connect)
+
+    commands.add_parser('disconnect', help='disconnect and remove the NordVPN connection').set_defaults(run=disconnect)
+    commands.add_parser('status', help='show the active NordVPN connection, exits with 1 when disconnected').set_defaults(run=status)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    core = NordCore(args.config_dir)
+    try:
+        core.setup()
+        return args.run(core, args)
+    except (CommandError, NetworkManagerError, HelperError, OSError) as ex:
+        print('nord-nm: ' + str(ex), file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        return 130
+    finally:
+        if core.helper.process is not None:  # a helper of a running GUI is left alone
+            core.helper.stop()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
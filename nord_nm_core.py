@@ -0,0 +1,2588 @@
+# -*- coding: utf-8 -*-
+# NordVPN-NetworkManager-GUI core: server catalog, configs, NetworkManager and privileged helper without any GUI
+# Copyright (C) 2018 Vincent Foster-Mueller
+import sys
+import os
+import re
+import shlex
+import json
+import math
+import queue
+import codecs
+import shutil
+import socket
+import struct
+import statistics
+import time
+import subprocess
+import tempfile
+import configparser
+import unicodedata
+import threading
+import contextlib
+import contextvars
+from functools import cached_property
+from http import HTTPStatus
+from array import array
+from collections import namedtuple, deque, OrderedDict
+from collections.abc import Sequence
+from nord_nm_helper import connection_name_pattern, dispatcher_dir
+try:
+    import dbus
+except ImportError:  # python-dbus is optional, NetworkManager is driven through nmcli without it
+    dbus = None
+
+connection_type_options = ['UDP', 'TCP']
+server_type_options = ['P2P', 'Standard', 'Double VPN', 'TOR over VPN', 'Dedicated IP'] # , 'Anti-DDoS', 'Obfuscated Server']
+api = "https://api.nordvpn.com/server"
+token_api = "https://api.nordvpn.com/v1/users/tokens"
+cdn = "https://downloads.nordcdn.com/configs"
+config_archives = [cdn + '/archives/servers/ovpn.zip', cdn + '/archives/servers/ovpn_xor.zip']
+config_dirs = {'udp': 'ovpn_udp', 'tcp': 'ovpn_tcp', 'xor_udp': 'ovpn_xor_udp', 'xor_tcp': 'ovpn_xor_tcp'}
+catalog_ttl = 3600  # seconds before the cached server catalog is revalidated
+config_ttl = 86400  # seconds before the configuration archives are revalidated
+chunk_size = 64 * 1024
+probe_port = 443  # OpenVPN over TCP, answered by every NordVPN server
+probe_candidates = 5  # lowest load servers of the current filter that are probed for the fastest one
+prefetch_count = 3  # lowest load servers of the current filter whose configs are prefetched
+search_gram = 3  # length of the substrings indexed for search, shorter queries match the start of words
+catalog_refresh_interval = 300  # seconds between load refreshes of the catalog while the GUI is open
+health_interval = 2  # seconds between probes of the server of the active connection
+health_failures = 2  # consecutive failed probes after which the active connection fails over to its standby
+profile_cache_size = 5  # connections kept in NetworkManager after a disconnect, 0 deletes them on disconnect
+latency_history = 500  # probe results kept in the latency cache, the most recent ones
+auto_connect_debounce = 5  # seconds without interface events before auto-connect brings a connection up
+auto_connect_candidates = 3  # kept connections the auto-connect script tries in turn, the fastest first
+race_candidates = 3  # servers of the current filter raced against each other in race mode, the selected one first
+race_stagger = 1.0  # seconds an attempt of race mode has to come up before the next candidate is started
+ServerInfo = namedtuple('ServerInfo', 'id, name, country, city, domain, type, load, categories')
+Probe = namedtuple('Probe', 'rtt, loss, measured_at')
+RequestTiming = namedtuple('RequestTiming', 'method, url, status, seconds')
+ConnectionName = namedtuple('ConnectionName', 'server, type, protocol')
+StageTiming = namedtuple('StageTiming', 'name, seconds, subprocesses, outcome')
+# API category name -> entry of server_type_options
+category_types = {
+    'Standard VPN servers': 'Standard',
+    'P2P': 'P2P',
+    'Anti-DDoS': 'Anti-DDoS',
+    'Obfuscated Servers': 'Obfuscated Server',
+    'Dedicated IP': 'Dedicated IP',
+    'Double VPN': 'Double VPN',
+    'Onion Over VPN': 'TOR over VPN'}
+type_categories = {server_type: category for category, server_type in category_types.items()}
+# API category name -> text shown in the server list, defaults to the API name
+category_labels = {
+    'Standard VPN servers': 'Standard',
+    'Obfuscated Servers': 'Obfuscated'}
+
+
+def wait_until(condition, timeout, interval=0.05, sleep=time.sleep):
+    """
+    Polls condition until it returns a true value or timeout seconds passed
+
+    :param sleep: called with interval between polls
+    :return: last value returned by condition
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        value = condition()
+        if value or time.monotonic() >= deadline:
+            return value
+        sleep(interval)
+
+
+class HttpClient:
+    """
+    Shared HTTP client for all NordVPN API and CDN traffic
+    Keeps connections alive per host, applies consistent timeouts, retries with backoff and records the timing of every request
+    """
+    def __init__(self, timeout=10, retries=3, backoff=0.5, pool_size=8):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self.session = None
+        self.lock = threading.Lock()
+        self.timings = deque(maxlen=200)  # RequestTiming of the latest requests, time until the headers arrived
+
+    def open_session(self):
+        """
+        Creates the session on the first request, which runs on a worker thread in the GUI
+        Importing requests takes longer than building the whole login window
+
+        :return: requests.Session
+        """
+        with self.lock:
+            if self.session is None:
+                import requests  # deferred, commands that only talk to NetworkManager never load it
+                from requests.adapters import HTTPAdapter
+                from urllib3.util.retry import Retry
+                session = requests.Session()
+                # connection errors are retried for every method, server errors only for idempotent ones
+                retry = Retry(total=self.retries, backoff_factor=self.backoff, status_forcelist=(429, 500, 502, 503, 504),
+                              allowed_methods=frozenset(['GET', 'HEAD']), raise_on_status=False)
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_size, max_retries=retry)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                session.headers['Accept-Encoding'] = 'gzip, deflate'
+                self.errors = requests.RequestException
+                self.session = session
+            return self.session
+
+    def request(self, method, url, timeout=None, **kwargs):
+        session = self.session or self.open_session()
+        start = time.monotonic()
+        try:
+            resp = session.request(method, url, timeout=timeout or self.timeout, **kwargs)
+        except self.errors:
+            self.timings.append(RequestTiming(method, url, None, time.monotonic() - start))
+            raise
+        self.timings.append(RequestTiming(method, url, resp.status_code, time.monotonic() - start))
+        return resp
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+
+class CatalogCache:
+    """
+    Persistent copy of the server catalog kept in the config directory
+    Stale copies are revalidated against the API with ETag / If-Modified-Since
+    """
+    def __init__(self, cache_dir, http, ttl=catalog_ttl):
+        self.http = http
+        self.data_path = os.path.join(cache_dir, 'servers.json')
+        self.meta_path = os.path.join(cache_dir, 'servers.meta')
+        self.ttl = ttl
+        self.meta = self.read_meta()
+
+    def read_meta(self):
+        """
+        Reads the validators and fetch time of the cached catalog
+
+        :return: dictionary of cache metadata, empty if none exists
+        """
+        try:
+            with open(self.meta_path, 'r') as meta_file:
+                return json.load(meta_file)
+        except (OSError, ValueError):
+            return {}
+
+    def write_meta(self):
+        """
+        Atomically replaces the metadata file so a crash never leaves it truncated
+        """
+        temp_path = self.meta_path + '.tmp'
+        with open(temp_path, 'w') as meta_file:
+            json.dump(self.meta, meta_file)
+        os.replace(temp_path, self.meta_path)
+
+    def load(self, report=None):
+        """
+        Loads the cached catalog from disk
+
+        :param report: called with each country as it is first seen
+        :return: ServerIndex or None if no usable copy exists
+        """
+        try:
+            with open(self.data_path, 'rb') as data_file:
+                return build_index(iter_json_array(iter(lambda: data_file.read(chunk_size), b'')), report)
+        except (OSError, ValueError):
+            return None
+
+    def is_stale(self):
+        """
+        :return: True if the cached catalog is missing or older than the TTL
+        """
+        if not os.path.isfile(self.data_path):
+            return True
+        return time.time() - self.meta.get('fetched_at', 0) > self.ttl
+
+    def refresh(self, timeout=5, report=None, server_index=None):
+        """
+        Conditionally downloads the catalog, sending the stored validators if a cached copy exists
+        The body is parsed into the server store while it arrives and written to the cache alongside
+
+        :param timeout: seconds to wait for the API
+        :param report: called with each country as it is first seen, unless server_index is updated
+        :param server_index: ServerIndex the download is applied to with update_index() instead of building a new one
+        :return: new ServerIndex or None if the cached copy is still current
+        """
+        headers = {}
+        if os.path.isfile(self.data_path):
+            if self.meta.get('etag'):
+                headers['If-None-Match'] = self.meta['etag']
+            if self.meta.get('last_modified'):
+                headers['If-Modified-Since'] = self.meta['last_modified']
+
+        resp = self.http.get(api, headers=headers, timeout=timeout, stream=True)
+        if resp.status_code == HTTPStatus.NOT_MODIFIED:
+            server_index = None
+            self.meta['fetched_at'] = time.time()
+        else:
+            resp.raise_for_status()
+            temp_path = self.data_path + '.tmp'
+            with open(temp_path, 'wb') as out_file:
+                api_data = iter_json_array(tee_chunks(resp.iter_content(chunk_size), out_file))
+                if server_index is not None and len(server_index.store):
+                    server_index = update_index(server_index, api_data)
+                else:
+                    server_index = build_index(api_data, report)
+            os.replace(temp_path, self.data_path)  # only a completely parsed catalog replaces the cache
+            self.meta = {
+                'etag': resp.headers.get('ETag'),
+                'last_modified': resp.headers.get('Last-Modified'),
+                'fetched_at': time.time()}
+        self.write_meta()
+        return server_index
+
+
+def tee_chunks(chunks, out_file):
+    """
+    Writes each chunk to out_file as it is passed on
+    """
+    for chunk in chunks:
+        out_file.write(chunk)
+        yield chunk
+
+
+json_separators = re.compile(r'[\s,]*')
+
+
+def iter_json_array(chunks):
+    """
+    Incrementally parses a json array from an iterable of byte chunks
+    Each element is yielded as soon as it has been received completely, the whole array is never buffered
+
+    :param chunks: iterable of utf-8 encoded bytes
+    :return: generator of array elements
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    pos = 0
+    started = False
+    for chunk in chunks:
+        buffer = buffer[pos:] + text_decoder.decode(chunk)
+        pos = 0
+        while True:
+            pos = json_separators.match(buffer, pos).end()
+            if pos == len(buffer):
+                break
+            if not started:
+                if buffer[pos] != '[':
+                    raise ValueError('Expected a json array')
+                started = True
+                pos += 1
+                continue
+            if buffer[pos] == ']':
+                return
+            try:
+                element, end = decoder.raw_decode(buffer, pos)
+            except ValueError:
+                break  # element incomplete, wait for more data
+            if not isinstance(element, (dict, list)) and (end == len(buffer) or buffer[end] in '.eE+-0123456789'):
+                break  # a number may continue in the next chunk
+            yield element
+            pos = end
+    raise ValueError('Truncated json array')
+
+
+def server_label(server):
+    """
+    :param server: ServerInfo
+    :return: multi-line text describing the server, shown as tooltip of the server_list
+    """
+    return server.name + '\n' + 'Load: ' + str(server.load) + '%\n' + "Domain: " + server.domain + '\n' + "Categories: " + server.categories
+
+
+def server_city(server):
+    """
+    :param server: server in json format
+    :return: city of the first location of the server, empty if the catalog has none
+    """
+    try:
+        return server['locations'][0]['country']['city']['name'] or ''
+    except (KeyError, IndexError, TypeError):
+        return ''
+
+
+def search_key(text):
+    """
+    :return: text without case and accents, the form in which queries and servers are compared
+    """
+    text = unicodedata.normalize('NFKD', text.casefold())
+    return ''.join(c for c in text if not unicodedata.combining(c))
+
+
+def search_grams(fields):
+    """
+    :param fields: normalized search fields of a server
+    :return: set of the substrings of search_gram characters and word prefixes shorter than that
+    """
+    grams = set()
+    for field in fields:
+        grams.update(field[i:i + search_gram] for i in range(len(field) - search_gram + 1))
+        for word in re.findall(r'\w+', field):
+            grams.update(word[:length] for length in range(1, min(len(word) + 1, search_gram)))
+    return grams
+
+
+class ServerStore:
+    """
+    Column store of the server catalog, the parsed json is dropped once it has been added
+    Country and category names are interned, each server keeps a country id, a category bitmask and its load in arrays
+    Rows of servers that left the catalog are kept until the store is compacted, so rows never move
+    """
+    def __init__(self):
+        self.ids = array('L')
+        self.names = []
+        self.domains = []
+        self.country_ids = array('H')
+        self.city_ids = array('H')
+        self.category_masks = array('I')
+        self.loads = array('B')
+        self.countries = []  # country id -> name
+        self.country_lookup = {}
+        self.cities = ['']  # city id -> name
+        self.city_lookup = {'': 0}
+        # category id -> API name, seeded so that bits follow the order of category_types
+        self.categories = list(category_types)
+        self.category_lookup = {category: i for i, category in enumerate(self.categories)}
+        self.mask_cache = {}  # category mask -> (server types, label text)
+        self.row_lookup = {}  # server id -> row, servers that were removed are left out
+        self.removed = set()  # rows of servers that were removed
+
+    def __len__(self):
+        return len(self.ids)
+
+    def copy(self):
+        """
+        :return: store with copies of every column that can be changed without affecting this one
+        """
+        store = ServerStore()
+        store.ids = self.ids[:]
+        store.names = self.names[:]
+        store.domains = self.domains[:]
+        store.country_ids = self.country_ids[:]
+        store.city_ids = self.city_ids[:]
+        store.category_masks = self.category_masks[:]
+        store.loads = self.loads[:]
+        store.countries = self.countries[:]
+        store.country_lookup = dict(self.country_lookup)
+        store.cities = self.cities[:]
+        store.city_lookup = dict(self.city_lookup)
+        store.categories = self.categories[:]
+        store.category_lookup = dict(self.category_lookup)
+        store.mask_cache = dict(self.mask_cache)
+        store.row_lookup = dict(self.row_lookup)
+        store.removed = set(self.removed)
+        return store
+
+    def compacted(self):
+        """
+        :return: new store with only the servers that were not removed
+        """
+        store = ServerStore()
+        store.categories = self.categories[:]
+        store.category_lookup = dict(self.category_lookup)
+        for row in self.live_rows():
+            store.ids.append(self.ids[row])
+            store.names.append(self.names[row])
+            store.domains.append(self.domains[row])
+            store.country_ids.append(store.intern_country(self.countries[self.country_ids[row]]))
+            store.city_ids.append(store.intern_city(self.cities[self.city_ids[row]]))
+            store.category_masks.append(self.category_masks[row])
+            store.loads.append(self.loads[row])
+            store.row_lookup[self.ids[row]] = len(store.ids) - 1
+        return store
+
+    def live_rows(self):
+        """
+        :return: iterable of the rows of servers that were not removed
+        """
+        if not self.removed:
+            return range(len(self.ids))
+        return (row for row in range(len(self.ids)) if row not in self.removed)
+
+    def intern_country(self, country):
+        country_id = self.country_lookup.get(country)
+        if country_id is None:
+            country_id = self.country_lookup[country] = len(self.countries)
+            self.countries.append(country)
+        return country_id
+
+    def intern_city(self, city):
+        city_id = self.city_lookup.get(city)
+        if city_id is None:
+            city_id = self.city_lookup[city] = len(self.cities)
+            self.cities.append(city)
+        return city_id
+
+    def category_mask(self, categories):
+        """
+        :param categories: category list of a server in json format
+        :return: bitmask of interned category ids, categories beyond the 32nd are not tracked
+        """
+        mask = 0
+        for category in categories:
+            category_id = self.category_lookup.get(category['name'])
+            if category_id is None:
+                if len(self.categories) == 32:
+                    continue
+                category_id = self.category_lookup[category['name']] = len(self.categories)
+                self.categories.append(category['name'])
+            mask |= 1 << category_id
+        return mask
+
+    def add(self, server):
+        """
+        Appends a server in json format
+
+        :return: row of the new server
+        """
+        server_id = server.get('id', len(self.ids))
+        self.row_lookup[server_id] = len(self.ids)
+        self.ids.append(server_id)
+        self.names.append(server['name'])
+        self.domains.append(server['domain'])
+        self.country_ids.append(self.intern_country(server['country']))
+        self.city_ids.append(self.intern_city(server_city(server)))
+        self.category_masks.append(self.category_mask(server['categories']))
+        self.loads.append(max(0, min(255, server['load'])))
+        return len(self.ids) - 1
+
+    def remove(self, row):
+        """
+        Removes the server at row from lookups, its row stays allocated
+        """
+        self.removed.add(row)
+        if self.row_lookup.get(self.ids[row]) == row:
+            del self.row_lookup[self.ids[row]]
+
+    def same_server(self, row, server):
+        """
+        :param server: server in json format
+        :return: True if server only differs from the one at row in its load
+        """
+        return (self.names[row] == server['name'] and self.domains[row] == server['domain']
+                and self.country_lookup.get(server['country']) == self.country_ids[row]
+                and self.city_lookup.get(server_city(server)) == self.city_ids[row]
+                and self.category_mask(server['categories']) == self.category_masks[row])
+
+    def describe_mask(self, mask):
+        """
+        :return: tuple of (server types, category text shown in the server list) for a category mask
+        """
+        description = self.mask_cache.get(mask)
+        if description is None:
+            server_types = []
+            labels = []
+            for category_id, category in enumerate(self.categories):
+                if mask & (1 << category_id):
+                    if category in category_types:
+                        server_types.append(category_types[category])
+                    labels.append(category_labels.get(category, category))
+            description = self.mask_cache[mask] = (tuple(server_types), ' '.join(labels))
+        return description
+
+    def info(self, row):
+        """
+        :return: ServerInfo of the server at row
+        """
+        server_types, categories = self.describe_mask(self.category_masks[row])
+        return ServerInfo(id=self.ids[row], name=self.names[row], country=self.countries[self.country_ids[row]],
+                          city=self.cities[self.city_ids[row]], domain=self.domains[row],
+                          type=server_types, load=self.loads[row], categories=categories)
+
+    def find(self, server_id):
+        """
+        :return: row of the server with server_id or None
+        """
+        return self.row_lookup.get(server_id)
+
+
+class ServerView(Sequence):
+    """
+    Read-only sequence of ServerInfo over rows of a ServerStore, records are only built when accessed
+    """
+    def __init__(self, store=None, rows=()):
+        self.store = store
+        self.rows = rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return ServerView(self.store, self.rows[i])
+        row = self.rows[i]
+        return self.store.info(row)
+
+    def index_of(self, server_id):
+        """
+        :return: position of the server with server_id in this view or None
+        """
+        row = self.store.find(server_id) if self.store is not None else None
+        try:
+            return None if row is None else self.rows.index(row)
+        except ValueError:
+            return None
+
+
+class ServerIndex:
+    """
+    Maps country -> server type -> rows of a ServerStore sorted by load
+    Built once per catalog load so that changing the filter is a dictionary lookup
+    An index derived from another one by a refresh only rebuilds the groups of the servers that changed
+    """
+    def __init__(self, store, base=None, changed_rows=()):
+        """
+        :param base: ServerIndex over the store that store was copied from, None to index every row
+        :param changed_rows: rows whose load changed, that were added or removed since base
+        """
+        self.store = store
+        self.base = base.store if base is not None else None  # store of the index this one was derived from
+        self.changed = {store.ids[row] for row in changed_rows} if base is not None else None  # server ids
+        groups = {}  # (country id, category id) -> [row]
+        mask_categories = {}
+        for row in (changed_rows if base is not None else store.live_rows()):
+            mask = store.category_masks[row]
+            category_ids = mask_categories.get(mask)
+            if category_ids is None:
+                category_ids = mask_categories[mask] = [i for i in range(len(store.categories)) if mask & (1 << i)]
+            for category_id in category_ids:
+                groups.setdefault((store.country_ids[row], category_id), []).append(row)
+
+        if base is None:
+            self.rows = {key: array('I', sorted(rows, key=store.loads.__getitem__)) for key, rows in groups.items()}
+        else:  # unchanged rows keep their order, the loads of the changed ones are sorted in
+            self.rows = dict(base.rows)
+            for key, rows in groups.items():
+                changed = set(rows)
+                rows = [row for row in base.rows.get(key, ()) if row not in changed]
+                rows.extend(row for row in changed if row not in store.removed)
+                if rows:
+                    self.rows[key] = array('I', sorted(rows, key=store.loads.__getitem__))
+                else:
+                    self.rows.pop(key, None)
+        self.countries = sorted({store.countries[country_id] for country_id, _ in self.rows})
+
+    def lookup(self, country, server_type):
+        """
+        :param country: country name or None for all countries
+        :return: ServerView of the servers matching the filter sorted by load
+        """
+        category_id = self.store.category_lookup.get(type_categories.get(server_type))
+        if country is None:
+            groups = [rows for (_, group_category), rows in self.rows.items() if group_category == category_id]
+            rows = sorted((row for group in groups for row in group), key=self.store.loads.__getitem__)
+            return ServerView(self.store, array('I', rows))
+        return ServerView(self.store, self.rows.get((self.store.country_lookup.get(country), category_id), ()))
+
+
+class SearchIndex:
+    """
+    Substring search over the name, domain and city of every server
+    Maps each substring of search_gram characters to the ids of the servers containing it, a query only verifies the
+    servers listed under its rarest substring. Queries shorter than search_gram match the start of words.
+    Entries are keyed by server id so that a refreshed catalog only reindexes the servers whose text changed.
+    """
+    def __init__(self, store=None, texts=None, grams=None):
+        self.store = store if store is not None else ServerStore()
+        self.texts = texts or {}  # server id -> normalized search text, each field enclosed in newlines
+        self.grams = grams or {}  # substring -> array of server ids, never modified once published
+
+    @staticmethod
+    def text(store, row):
+        """
+        :return: normalized search text of the server at row
+        """
+        fields = (store.names[row], store.domains[row].split('.')[0], store.cities[store.city_ids[row]])
+        return '\n' + search_key('\n'.join(fields)) + '\n'
+
+    def updated(self, store, server_ids=None):
+        """
+        Indexes a refreshed catalog, reusing the entries of servers whose text did not change
+        The current index is left untouched so searches can continue on it meanwhile
+
+        :param server_ids: ids of the only servers that may have changed since the store of this index, None if any
+        :return: new SearchIndex over store
+        """
+        if server_ids is None:
+            texts = {store.ids[row]: self.text(store, row) for row in store.live_rows()}
+            server_ids = texts.keys() | self.texts.keys()
+        else:
+            texts = dict(self.texts)
+            for server_id in server_ids:
+                row = store.row_lookup.get(server_id)
+                if row is None:
+                    texts.pop(server_id, None)
+                else:
+                    texts[server_id] = self.text(store, row)
+        removed = {server_id for server_id in server_ids
+                   if server_id in self.texts and texts.get(server_id) != self.texts[server_id]}
+        added = [server_id for server_id in server_ids if server_id in texts and self.texts.get(server_id) != texts[server_id]]
+        grams = dict(self.grams)
+        for gram in set().union(*(search_grams(self.texts[server_id].split('\n')) for server_id in removed)):
+            remaining = array('I', (server_id for server_id in grams[gram] if server_id not in removed))
+            if remaining:
+                grams[gram] = remaining
+            else:
+                del grams[gram]
+        copied = set()  # arrays shared with the current index are copied before the first append
+        for server_id in added:
+            for gram in search_grams(texts[server_id].split('\n')):
+                if gram not in copied:
+                    grams[gram] = array('I', grams.get(gram, ()))
+                    copied.add(gram)
+                grams[gram].append(server_id)
+        return SearchIndex(store, texts, grams)
+
+    def search(self, query, server_type=None):
+        """
+        :param query: text typed by the user
+        :param server_type: entry of server_type_options the results are limited to, all servers if None
+        :return: ServerView of the matches, exact matches of a field first, then prefix matches, each sorted by load
+        """
+        query = search_key(query.strip())
+        if not query:
+            return ServerView(self.store)
+        if len(query) <= search_gram:  # every candidate matches
+            candidates = self.grams.get(query, ())
+        else:
+            postings = [self.grams.get(query[i:i + search_gram], ()) for i in range(len(query) - search_gram + 1)]
+            candidates = min(postings, key=len)
+
+        store = self.store
+        mask = 0
+        if server_type is not None:
+            category_id = store.category_lookup.get(type_categories.get(server_type))
+            if category_id is None:
+                return ServerView(store)
+            mask = 1 << category_id
+        verify = len(query) > search_gram
+        prefix = '\n' + query
+        exact = prefix + '\n'
+        texts, rows, masks, loads = self.texts, store.row_lookup, store.category_masks, store.loads
+        matches = []
+        for server_id in candidates:
+            text = texts[server_id]
+            if verify and query not in text:
+                continue
+            row = rows[server_id]
+            if mask and not masks[row] & mask:
+                continue
+            matches.append((0 if exact in text else 1 if prefix in text else 2, loads[row], row))
+        matches.sort()
+        return ServerView(store, array('I', (row for _, _, row in matches)))
+
+
+def build_index(api_data, report=None):
+    """
+    Loads server information in json format into a new ServerStore
+
+    :param api_data: iterable of servers in json format, consumed as it is produced
+    :param report: called with each country as it is first seen
+    :return: ServerIndex over the store
+    """
+    store = ServerStore()
+    for server in api_data:
+        countries = len(store.countries)
+        store.add(server)
+        if report and len(store.countries) > countries:
+            report(store.countries[-1])
+    return ServerIndex(store)
+
+
+def update_index(server_index, api_data):
+    """
+    Applies a refreshed catalog to a copy of the store of server_index, matching servers by id
+    Loads are updated in place, servers that changed otherwise get a new row and missing ones are removed.
+    Only the index groups of those servers are rebuilt, the store is compacted once a quarter of it was removed.
+
+    :param api_data: iterable of servers in json format, consumed as it is produced
+    :return: ServerIndex derived from server_index, or a new one if the store was compacted
+    """
+    store = server_index.store.copy()
+    seen = set()
+    changed_rows = []
+    for server in api_data:
+        server_id = server.get('id')
+        seen.add(server_id)
+        row = store.row_lookup.get(server_id)
+        if row is not None and store.same_server(row, server):
+            load = max(0, min(255, server['load']))
+            if load != store.loads[row]:
+                store.loads[row] = load
+                changed_rows.append(row)
+            continue
+        if row is not None:
+            store.remove(row)
+            changed_rows.append(row)
+        changed_rows.append(store.add(server))
+    for server_id in store.row_lookup.keys() - seen:
+        row = store.row_lookup[server_id]
+        store.remove(row)
+        changed_rows.append(row)
+    if len(store.removed) * 4 > len(store):
+        return ServerIndex(store.compacted())
+    return ServerIndex(store, server_index, changed_rows)
+
+
+class LatencyProber:
+    """
+    Measures TCP connect round trip time and loss to servers
+    Probes run concurrently with bounded parallelism and results are cached until they expire
+
+    :param path: file the results are kept in between runs, auto-connect ranks servers by them
+    """
+    def __init__(self, port=probe_port, attempts=3, timeout=1.0, max_workers=8, ttl=300, path=None):
+        self.port = port
+        self.attempts = attempts
+        self.timeout = timeout
+        self.max_workers = max_workers
+        self.ttl = ttl
+        self.path = path
+        self.results = self.read()  # host -> Probe
+        self.lock = threading.Lock()
+
+    def read(self):
+        """
+        :return: dictionary of host -> Probe stored in path, empty without one
+        """
+        if self.path is None:
+            return {}
+        try:
+            with open(self.path, 'r') as latency_file:
+                return {host: Probe(*probe) for host, probe in json.load(latency_file).items()}
+        except (OSError, ValueError, TypeError):
+            return {}
+
+    def write(self):
+        with self.lock:
+            results = sorted(self.results.items(), key=lambda item: item[1].measured_at)[-latency_history:]
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as latency_file:
+            json.dump({host: list(probe) for host, probe in results}, latency_file)
+        os.replace(temp_path, self.path)
+
+    def probe_host(self, host):
+        """
+        Resolves host once and times attempts TCP connects to it
+
+        :return: Probe with the median rtt in seconds (None if every attempt failed) and the fraction of failed attempts
+        """
+        rtts = []
+        try:
+            address = socket.getaddrinfo(host, self.port, type=socket.SOCK_STREAM)[0]
+        except OSError:
+            address = None
+        for _ in range(self.attempts if address else 0):
+            sock = socket.socket(address[0], address[1], address[2])
+            sock.settimeout(self.timeout)
+            try:
+                start = time.monotonic()
+                sock.connect(address[4])
+                rtts.append(time.monotonic() - start)
+            except OSError:
+                pass
+            finally:
+                sock.close()
+        probe = Probe(rtt=statistics.median(rtts) if rtts else None, loss=1 - len(rtts) / self.attempts, measured_at=time.time())
+        with self.lock:
+            self.results[host] = probe
+        return probe
+
+    def cached(self, host, ttl=None):
+        """
+        :param ttl: maximum age in seconds instead of the TTL of the prober
+        :return: Probe measured within the TTL or None
+        """
+        with self.lock:
+            probe = self.results.get(host)
+        if probe and time.time() - probe.measured_at <= (self.ttl if ttl is None else ttl):
+            return probe
+        return None
+
+    def probe(self, hosts):
+        """
+        Probes every host without a fresh cached result
+
+        :return: dictionary of host -> Probe
+        """
+        results = {host: self.cached(host) for host in hosts}
+        missing = [host for host, probe in results.items() if probe is None]
+        if missing:
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(missing))) as pool:
+                results.update(zip(missing, pool.map(self.probe_host, missing)))
+            if self.path is not None:
+                with contextlib.suppress(OSError):  # the results are still used by this process
+                    self.write()
+        return results
+
+    def fastest(self, hosts):
+        """
+        :return: reachable host with the lowest loss and rtt or None if no host answered
+        """
+        reachable = [(probe.loss, probe.rtt, host) for host, probe in self.probe(hosts).items() if probe.rtt is not None]
+        return min(reachable)[2] if reachable else None
+
+
+class TunnelHealth:
+    """
+    Judges the server of the active connection from periodic probes
+    A probe fails when more than max_loss of its attempts went unanswered or its rtt exceeds max_rtt, the connection
+    counts as failed after failures probes in a row failed. Servers that never answered, e.g. behind a firewall
+    blocking the probe port, are not judged
+    """
+    def __init__(self, max_loss=0.5, max_rtt=1.0, failures=health_failures):
+        self.prober = LatencyProber(attempts=2, timeout=max_rtt / 2, ttl=0)  # a failed probe returns within max_rtt
+        self.max_loss = max_loss
+        self.max_rtt = max_rtt
+        self.failures = failures
+        self.failed_probes = 0
+        self.answered = False
+        self.last = None  # latest Probe
+
+    def reset(self):
+        self.failed_probes = 0
+        self.answered = False
+        self.last = None
+
+    def check(self, host):
+        """
+        Probes host once
+
+        :return: True once the connection counts as failed
+        """
+        self.last = self.prober.probe_host(host)
+        if self.last.rtt is None or self.last.loss > self.max_loss or self.last.rtt > self.max_rtt:
+            self.failed_probes += 1
+        else:
+            self.failed_probes = 0
+        self.answered = self.answered or self.last.rtt is not None
+        return self.answered and self.failed_probes >= self.failures
+
+
+class NetworkManagerError(Exception):
+    """
+    Raised when NetworkManager rejects or fails an operation
+    """
+
+
+class NetworkManagerBackend:
+    """
+    Operations the GUI performs on NetworkManager
+    """
+    def add_vpn(self, name, ovpn_path, username, password):
+        """
+        Creates an inactive OpenVPN connection called name from an ovpn file, including the user's secrets
+        """
+        raise NotImplementedError
+
+    def activate(self, name):
+        raise NotImplementedError
+
+    def deactivate(self, name):
+        raise NotImplementedError
+
+    def delete(self, name):
+        raise NotImplementedError
+
+    def delete_all(self, names):
+        """
+        Deletes every connection in names, the ones that exist are deleted even if others do not
+        """
+        failed = []
+        for name in names:
+            try:
+                self.delete(name)
+            except NetworkManagerError:
+                failed.append(name)
+        if failed:
+            raise NetworkManagerError('Could not delete ' + ', '.join(failed))
+
+    def active_connections(self):
+        """
+        :return: list of (type, name, uuid) of the active connections
+        """
+        raise NotImplementedError
+
+    def is_active(self, name):
+        return any(active == name for connection_type, active, uuid in self.active_connections())
+
+    def saved_connections(self):
+        """
+        :return: list of (type, name) of the saved connections, active or not
+        """
+        raise NotImplementedError
+
+    def devices(self):
+        """
+        :return: list of (type, interface) of the network devices
+        """
+        raise NotImplementedError
+
+    def randomize_mac(self):
+        """
+        Brings every active non VPN connection back up with a random MAC address
+        """
+        raise NotImplementedError
+
+
+class NmcliBackend(NetworkManagerBackend):
+    """
+    NetworkManager backend driving the nmcli command line client
+    """
+    def nmcli(self, *args):
+        """
+        :return: stdout of nmcli
+        """
+        count_subprocess()
+        output = subprocess.run(('nmcli',) + args, stdout=subprocess.PIPE)
+        if output.returncode != 0:
+            raise NetworkManagerError('nmcli ' + ' '.join(args[:2]) + ' failed')
+        return output.stdout.decode('utf-8')
+
+    def terse(self, *args):
+        """
+        :return: list of colon separated fields per line of terse nmcli output
+        """
+        output = self.nmcli('--mode', 'tabular', '--terse', *args)
+        return [line.strip().split(':') for line in output.split('\n') if line]
+
+    def add_vpn(self, name, ovpn_path, username, password):
+        path = os.path.join(os.path.dirname(ovpn_path), name + '.ovpn')  # nmcli names the connection after the file
+        shutil.copy(ovpn_path, path)
+        try:
+            self.nmcli('connection', 'import', 'type', 'openvpn', 'file', path)
+        finally:
+            os.remove(path)
+        self.nmcli('connection', 'modify', name,
+                   '+vpn.data', 'password-flags=0',
+                   '+vpn.data', 'username=' + username,
+                   '+vpn.secrets', 'password=' + password,
+                   'ipv6.method', 'ignore')
+
+    def activate(self, name):
+        self.nmcli('connection', 'up', name)
+
+    def deactivate(self, name):
+        self.nmcli('connection', 'down', name)
+
+    def delete(self, name):
+        self.nmcli('connection', 'delete', name)
+
+    def delete_all(self, names):
+        if names:  # one nmcli call for all of them
+            self.nmcli('connection', 'delete', *[arg for name in names for arg in ('id', name)])
+
+    def active_connections(self):
+        return [(line[0], ':'.join(line[1:-1]), line[-1]) for line in self.terse('--fields', 'TYPE,NAME,UUID', 'connection', 'show', '--active')]
+
+    def saved_connections(self):
+        return [(line[0], ':'.join(line[1:])) for line in self.terse('--fields', 'TYPE,NAME', 'connection', 'show')]
+
+    def devices(self):
+        return [(line[0], line[1]) for line in self.terse('--fields', 'TYPE,DEVICE', 'device', 'status')]
+
+    def randomize_mac(self):
+        for connection_type, name, uuid in self.active_connections():
+            if connection_type != 'vpn':
+                self.nmcli('connection', 'down', uuid)
+                self.nmcli('connection', 'modify', '--temporary', uuid, connection_type + '.cloned-mac-address', 'random')
+                self.nmcli('connection', 'up', uuid)
+
+
+nm_bus_name = 'org.freedesktop.NetworkManager'
+nm_path = '/org/freedesktop/NetworkManager'
+nm_settings_path = '/org/freedesktop/NetworkManager/Settings'
+nm_device_types = {1: 'ethernet', 2: 'wifi'}
+nm_active_activated = 2
+nm_active_deactivating = 3
+nm_active_deactivated = 4
+# NMActiveConnectionStateReason of a connection that failed, unlike one taken down by a user, e.g. from nm-applet, or
+# one that lost its device
+nm_failure_reasons = {4, 5, 6, 7, 8, 9, 10, 12, 13}
+# ovpn option -> NetworkManager openvpn plugin data key, options that only take a value
+ovpn_data_keys = {
+    'cipher': 'cipher',
+    'auth': 'auth',
+    'tun-mtu': 'tunnel-mtu',
+    'fragment': 'fragment-size',
+    'ping': 'ping',
+    'ping-exit': 'ping-exit',
+    'ping-restart': 'ping-restart',
+    'reneg-sec': 'reneg-seconds',
+    'remote-cert-tls': 'remote-cert-tls',
+    'key-direction': 'ta-dir',
+    'tls-cipher': 'tls-cipher'}
+# ovpn options without a key of the plugin, nmcli connection import drops them as well
+ovpn_implied_options = {'client', 'nobind', 'resolv-retry', 'persist-key', 'persist-tun', 'auth-user-pass', 'pull',
+                        'tls-client', 'verb', 'mute', 'fast-io', 'ping-timer-rem', 'tun-mtu-extra', 'auth-nocache'}
+# inline ovpn block -> NetworkManager openvpn plugin data key of the file holding it
+ovpn_inline_keys = {'ca': 'ca', 'cert': 'cert', 'key': 'key', 'tls-auth': 'ta', 'tls-crypt': 'tls-crypt'}
+
+
+def cert_path(cert_dir, name, block):
+    """
+    :return: path of the file holding the inline block of the connection called name
+    """
+    return os.path.join(cert_dir, re.sub(r'[^\w.-]', '_', name) + '-' + block + '.pem')
+
+
+def parse_ovpn(ovpn_path, cert_dir, name):
+    """
+    Translates an ovpn file into NetworkManager openvpn plugin data, as nmcli connection import does
+    Inline certificates and keys are written to files in cert_dir named after the connection
+
+    :return: dictionary of vpn.data
+    """
+    data = {'connection-type': 'password', 'dev-type': 'tun'}
+    remotes = []
+    ignored = []
+    port = None
+    proto = 'udp'
+    with open(ovpn_path, 'r') as ovpn_file:
+        content = ovpn_file.read()
+
+    for block, key in ovpn_inline_keys.items():
+        match = re.search('<' + block + '>(.*?)</' + block + '>', content, re.S)
+        if match:
+            path = cert_path(cert_dir, name, block)
+            with open(path, 'w') as cert_file:
+                cert_file.write(match.group(1).strip() + '\n')
+            os.chmod(path, 0o600)
+            data[key] = path
+        content = content.replace(match.group(0), '') if match else content
+
+    for line in content.splitlines():
+        words = line.split()
+        if not words or words[0].startswith(('#', ';')):
+            continue
+        option, values = words[0], words[1:]
+        if option == 'remote' and values:
+            remotes.append(values[0] + (':' + values[1] if len(values) > 1 else ''))
+        elif option == 'port' and values:
+            port = values[0]
+        elif option == 'proto' and values:
+            proto = values[0]
+        elif option == 'dev' and values:
+            data['dev-type'] = 'tap' if values[0].startswith('tap') else 'tun'
+        elif option == 'comp-lzo':
+            data['comp-lzo'] = 'no-by-default' if values[:1] == ['no'] else 'adaptive'
+        elif option == 'mssfix':
+            data['mssfix'] = values[0] if values else 'yes'
+        elif option == 'remote-random':
+            data['remote-random'] = 'yes'
+        elif option == 'verify-x509-name' and values:
+            with contextlib.suppress(ValueError):
+                values = shlex.split(line)[1:]  # a subject may be quoted
+            data['verify-x509-name'] = (values[1] if len(values) > 1 else 'subject') + ':' + values[0]
+        elif option in ovpn_data_keys and values:
+            data[ovpn_data_keys[option]] = values[0]
+        elif option not in ovpn_implied_options:
+            ignored.append(option)
+
+    if not remotes:
+        raise NetworkManagerError('No remote in ' + ovpn_path)
+    if ignored:
+        import logging  # deferred, only needed for configs with options this translation does not know
+        logging.getLogger(__name__).warning('Options of %s not passed to NetworkManager: %s',
+                                            os.path.basename(ovpn_path), ', '.join(ignored))
+    data['remote'] = ', '.join(remotes)
+    if port:
+        data['port'] = port
+    if proto.startswith('tcp'):
+        data['proto-tcp'] = 'yes'
+    return data
+
+
+def ovpn_endpoints(ovpn_path):
+    """
+    Reads the servers an ovpn file connects to, host names are resolved so the kill switch can allow their addresses
+
+    :return: list of (address, port, protocol) with protocol udp or tcp
+    """
+    remotes = []
+    port = '1194'
+    proto = 'udp'
+    with open(ovpn_path, 'r') as ovpn_file:
+        for line in ovpn_file:
+            words = line.split()
+            if not words or words[0].startswith(('#', ';')):
+                continue
+            option, values = words[0], words[1:]
+            if option == 'remote' and values:
+                remotes.append(values[:3])
+            elif option == 'port' and values:
+                port = values[0]
+            elif option == 'proto' and values:
+                proto = values[0]
+
+    endpoints = []
+    for remote in remotes:
+        protocol = 'tcp' if (remote[2] if len(remote) > 2 else proto).startswith('tcp') else 'udp'
+        try:
+            addresses = socket.getaddrinfo(remote[0], remote[1] if len(remote) > 1 else port,
+                                           proto=socket.IPPROTO_TCP if protocol == 'tcp' else socket.IPPROTO_UDP)
+        except (OSError, UnicodeError) as ex:
+            raise NetworkManagerError('Cannot resolve ' + remote[0] + ': ' + str(ex))
+        for address in addresses:
+            endpoint = (address[4][0], address[4][1], protocol)
+            if endpoint not in endpoints:
+                endpoints.append(endpoint)
+    if not endpoints:
+        raise NetworkManagerError('No remote in ' + ovpn_path)
+    return endpoints
+
+
+class DBusBackend(NetworkManagerBackend):
+    """
+    NetworkManager backend talking to org.freedesktop.NetworkManager over the system bus
+    Connections are created with their data and secrets in a single AddConnection call
+    """
+    def __init__(self, cert_dir, bus=None, activation_timeout=60):
+        self.cert_dir = cert_dir
+        self.bus = bus or dbus.SystemBus()
+        self.activation_timeout = activation_timeout
+        self.manager = dbus.Interface(self.bus.get_object(nm_bus_name, nm_path), nm_bus_name)
+        self.settings = dbus.Interface(self.bus.get_object(nm_bus_name, nm_settings_path), nm_bus_name + '.Settings')
+
+    def get_property(self, path, interface, name):
+        return self.bus.get_object(nm_bus_name, path).Get(interface, name, dbus_interface=dbus.PROPERTIES_IFACE)
+
+    def connection(self, path):
+        return dbus.Interface(self.bus.get_object(nm_bus_name, path), nm_bus_name + '.Settings.Connection')
+
+    def find_connection(self, name):
+        """
+        :return: object path of the saved connection called name
+        """
+        for path in self.settings.ListConnections():
+            if self.connection(path).GetSettings()['connection']['id'] == name:
+                return path
+        raise NetworkManagerError('Unknown connection ' + name)
+
+    def find_active(self, name):
+        """
+        :return: object path of the active connection called name or None
+        """
+        for path in self.get_property(nm_path, nm_bus_name, 'ActiveConnections'):
+            if self.get_property(path, nm_bus_name + '.Connection.Active', 'Id') == name:
+                return path
+        return None
+
+    def call(self, method, *args):
+        try:
+            return method(*args)
+        except dbus.DBusException as ex:
+            raise NetworkManagerError(ex.get_dbus_message())
+
+    def add_vpn(self, name, ovpn_path, username, password):
+        import uuid
+        data = parse_ovpn(ovpn_path, self.cert_dir, name)
+        data.update({'username': username, 'password-flags': '0'})
+        settings = {
+            'connection': {'id': name, 'type': 'vpn', 'uuid': str(uuid.uuid4()), 'autoconnect': False},
+            'vpn': {'service-type': nm_bus_name + '.openvpn',
+                    'data': dbus.Dictionary(data, signature='ss'),
+                    'secrets': dbus.Dictionary({'password': password}, signature='ss')},
+            'ipv4': {'method': 'auto'},
+            'ipv6': {'method': 'ignore'}}
+        self.call(self.settings.AddConnection, settings)
+
+    def activate(self, name):
+        """
+        Activates the connection and waits until NetworkManager reports it activated or failed
+        """
+        active = self.call(self.manager.ActivateConnection, self.find_connection(name), '/', '/')
+
+        def settled():
+            try:
+                state = self.get_property(active, nm_bus_name + '.Connection.Active', 'State')
+            except dbus.DBusException:  # object is removed once activation failed
+                state = nm_active_deactivated
+            return state if state in (nm_active_activated, nm_active_deactivated) else None
+
+        if wait_until(settled, self.activation_timeout, interval=0.1) != nm_active_activated:
+            raise NetworkManagerError('Activation of ' + name + ' failed')
+
+    def deactivate(self, name):
+        active = self.find_active(name)
+        if active is None:
+            raise NetworkManagerError(name + ' is not active')
+        self.call(self.manager.DeactivateConnection, active)
+
+    def delete(self, name):
+        self.call(self.connection(self.find_connection(name)).Delete)
+        for block in ovpn_inline_keys:
+            if os.path.isfile(cert_path(self.cert_dir, name, block)):
+                os.remove(cert_path(self.cert_dir, name, block))
+
+    def active_connections(self):
+        connections = []
+        for path in self.get_property(nm_path, nm_bus_name, 'ActiveConnections'):
+            properties = self.bus.get_object(nm_bus_name, path).GetAll(nm_bus_name + '.Connection.Active', dbus_interface=dbus.PROPERTIES_IFACE)
+            connections.append((str(properties['Type']), str(properties['Id']), str(properties['Uuid'])))
+        return connections
+
+    def saved_connections(self):
+        connections = []
+        for path in self.settings.ListConnections():
+            settings = self.connection(path).GetSettings()['connection']
+            connections.append((str(settings['type']), str(settings['id'])))
+        return connections
+
+    def devices(self):
+        devices = []
+        for path in self.manager.GetDevices():
+            device_type = self.get_property(path, nm_bus_name + '.Device', 'DeviceType')
+            devices.append((nm_device_types.get(int(device_type), str(device_type)), str(self.get_property(path, nm_bus_name + '.Device', 'Interface'))))
+        return devices
+
+    def randomize_mac(self):
+        for path in self.get_property(nm_path, nm_bus_name, 'ActiveConnections'):
+            active = self.bus.get_object(nm_bus_name, path).GetAll(nm_bus_name + '.Connection.Active', dbus_interface=dbus.PROPERTIES_IFACE)
+            if active['Type'] == 'vpn':
+                continue
+            connection = self.connection(active['Connection'])
+            settings = connection.GetSettings()
+            setting_name = str(settings['connection']['type'])
+            for secret_setting in ('802-11-wireless-security', '802-1x'):
+                if secret_setting in settings:  # updates without the secrets would drop them
+                    try:
+                        settings[secret_setting].update(connection.GetSecrets(secret_setting)[secret_setting])
+                    except dbus.DBusException:
+                        pass
+            settings[setting_name]['assigned-mac-address'] = 'random'
+            self.call(connection.UpdateUnsaved, settings)  # temporary, like nmcli modify --temporary
+            device = active['Devices'][0] if active['Devices'] else '/'
+            self.call(self.manager.ActivateConnection, active['Connection'], device, '/')
+
+
+def get_backend(cert_dir):
+    """
+    :return: DBusBackend if python-dbus is installed and NetworkManager answers on the system bus, otherwise NmcliBackend
+    """
+    if dbus is not None:
+        try:
+            return DBusBackend(cert_dir)
+        except dbus.DBusException:
+            pass
+    return NmcliBackend()
+
+
+class HelperError(Exception):
+    pass
+
+
+helper_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'nord_nm_helper.py')
+
+
+class PrivilegedHelper:
+    """
+    Client of nord_nm_helper.py, the root process that installs the dispatcher scripts, loads the kill switch and toggles ipv6
+    The helper is authorized once per session, every toggle after that is a single request over its unix socket
+
+    :param root: directory standing in for / (NORD_NM_HELPER_ROOT), the helper then runs as the current user
+    """
+    def __init__(self, name=None, root=None, timeout=5):
+        self.name = name or 'nord-nm-helper-%d' % os.getuid()
+        self.root = root if root is not None else os.environ.get('NORD_NM_HELPER_ROOT')
+        self.timeout = timeout
+        self.process = None
+
+    def command(self):
+        command = [sys.executable, helper_path, '--uid', str(os.getuid()), '--parent', str(os.getpid()), '--name', self.name]
+        if self.root:
+            command += ['--root', self.root]
+        return command
+
+    def connect(self):
+        """
+        :return: socket connected to the helper, after checking that root is listening on it
+        """
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect('\0' + self.name)
+            pid, uid, gid = struct.unpack('3i', sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i')))
+        except OSError as ex:
+            sock.close()
+            raise HelperError(str(ex))
+        if uid != (os.getuid() if self.root else 0):
+            sock.close()
+            raise HelperError('helper socket is held by uid %d' % uid)
+        return sock
+
+    def call(self, *ops):
+        """
+        Sends ops as one batch, the helper applies none of them unless all are valid
+
+        :return: response of the helper
+        """
+        try:
+            with self.connect() as sock:
+                sock.sendall(json.dumps({'ops': list(ops)}).encode('utf-8') + b'\n')
+                with sock.makefile('rb') as reader:
+                    line = reader.readline()
+        except OSError as ex:
+            raise HelperError(str(ex))
+        if not line:
+            raise HelperError('helper closed the connection')
+        response = json.loads(line.decode('utf-8'))
+        if not response.get('ok'):
+            raise HelperError(response.get('error', 'request failed'))
+        return response
+
+    def running(self):
+        try:
+            self.call({'op': 'ping'})
+            return True
+        except HelperError:
+            return False
+
+    def start(self, sudo_password=None, timeout=120):
+        """
+        Starts the helper through sudo with the password on stdin or, without a password, through pkexec
+
+        :return: True once the helper answers, False if authentication failed or was cancelled
+        """
+        if sudo_password is None:
+            if not shutil.which('pkexec'):
+                return False
+            count_subprocess()
+            self.process = subprocess.Popen(['pkexec'] + self.command(), stdin=subprocess.DEVNULL,
+                                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        else:
+            count_subprocess()
+            self.process = subprocess.Popen(['sudo', '-S', '-p', ''] + self.command(), stdin=subprocess.PIPE,
+                                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                self.process.stdin.write(sudo_password.encode('utf-8') + b'\n')
+                self.process.stdin.close()
+            except BrokenPipeError:
+                pass
+        wait_until(lambda: self.process.poll() is not None or self.running(), timeout)
+        return self.running()
+
+    def dispatcher_path(self, name):
+        return os.path.join(self.root or '/', dispatcher_dir.lstrip('/'), name)
+
+    def stop(self):
+        try:
+            self.call({'op': 'quit'})
+        except HelperError:
+            pass
+
+
+def connection_name(server, protocol):
+    """
+    :param server: ServerInfo
+    :param protocol: entry of connection_type_options
+    :return: name of the NetworkManager connection for server, e.g. "Germany #1 [Standard | P2P] [UDP]"
+    """
+    return server.name + ' [' + ' | '.join(server.type) + '] [' + protocol + ']'
+
+
+def valid_connection_type(server_type, connection_type):
+    """
+    :return: entry of connection_type_options to use, Double VPN servers only accept TCP
+    """
+    return 'TCP' if server_type == 'Double VPN' else connection_type
+
+
+def config_protocol(server_type, connection_type):
+    """
+    :return: key of config_dirs of the configs for a server type and connection type
+    """
+    protocol = connection_type.lower()
+    if server_type == 'Obfuscated Server':
+        protocol = 'xor_' + protocol
+    return protocol
+
+
+def parse_connection_name(name):
+    """
+    Reverses connection_name()
+
+    :return: ConnectionName or None if name was not generated by this application
+    """
+    match = connection_name_pattern.match(name)
+    if match is None:
+        return None
+    return ConnectionName(server=match.group('server'), type=match.group('type').split(' | '), protocol=match.group('protocol'))
+
+
+def request_token(http, username, password, timeout=5):
+    """
+    Posts the username and password to the token endpoint of NordApi
+
+    :return: HTTP status code of the response
+    """
+    json_data = {'username': username, 'password': password}
+    resp = http.post(token_api, json=json_data, timeout=timeout)
+    return resp.status_code
+
+
+class ConfigStore:
+    """
+    Local copy of the server .ovpn files indexed by domain and protocol
+    Filled from the bulk configuration archives, single files are only downloaded for servers missing from them
+    """
+    def __init__(self, store_dir, http, ttl=config_ttl):
+        self.http = http
+        self.store_dir = store_dir
+        self.meta_path = os.path.join(store_dir, 'archives.meta')
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.index = {}  # (domain, protocol) -> path
+        for protocol, directory in config_dirs.items():
+            os.makedirs(os.path.join(store_dir, directory), exist_ok=True)
+            for entry in os.scandir(os.path.join(store_dir, directory)):
+                if entry.name.endswith('.ovpn'):
+                    self.index[(entry.name.rsplit('.', 2)[0], protocol)] = entry.path
+        try:
+            with open(self.meta_path, 'r') as meta_file:
+                self.meta = json.load(meta_file)
+        except (OSError, ValueError):
+            self.meta = {}
+
+    @staticmethod
+    def filename(domain, protocol):
+        """
+        :return: name of the ovpn file, e.g. sg173.nordvpn.com.udp.ovpn
+        """
+        return domain + '.' + protocol.rsplit('_', 1)[-1] + '.ovpn'
+
+    def get(self, domain, protocol):
+        """
+        :param protocol: key of config_dirs
+        :return: path of the stored ovpn file or None
+        """
+        with self.lock:
+            return self.index.get((domain, protocol))
+
+    def add(self, domain, protocol, content):
+        """
+        Atomically stores an ovpn file
+        A stored file with the same content is not rewritten, its modification time tells the profile cache whether
+        connections imported from it are stale, so an updated archive only invalidates the servers that changed
+
+        :return: path of the stored file
+        """
+        path = os.path.join(self.store_dir, config_dirs[protocol], self.filename(domain, protocol))
+        try:
+            with open(path, 'rb') as stored_file:
+                unchanged = stored_file.read(len(content) + 1) == content
+        except OSError:
+            unchanged = False
+        if not unchanged:
+            temp_path = path + '.' + str(threading.get_ident()) + '.tmp'
+            with open(temp_path, 'wb') as out_file:
+                out_file.write(content)
+            os.replace(temp_path, path)
+        with self.lock:
+            self.index[(domain, protocol)] = path
+        return path
+
+    def remove(self, domain, protocol):
+        with self.lock:
+            path = self.index.pop((domain, protocol), None)
+        if path and os.path.isfile(path):
+            os.remove(path)
+
+    def fetch(self, domain, protocol, timeout=10):
+        """
+        Downloads a single ovpn file into the store
+
+        :return: path of the stored file
+        """
+        url = cdn + '/files/' + config_dirs[protocol] + '/servers/' + self.filename(domain, protocol)
+        resp = self.http.get(url, timeout=timeout)
+        resp.raise_for_status()
+        return self.add(domain, protocol, resp.content)
+
+    def ingest_archive(self, archive):
+        """
+        Stores every ovpn file of a configuration archive
+
+        :param archive: path or file object of a zip archive laid out as <config dir>/<domain>.<transport>.ovpn
+        :return: number of files stored
+        """
+        protocols = {directory: protocol for protocol, directory in config_dirs.items()}
+        count = 0
+        import zipfile  # only the daily archive refresh needs it
+        with zipfile.ZipFile(archive) as zip_file:
+            for member in zip_file.namelist():
+                parts = member.split('/')
+                if len(parts) == 2 and parts[0] in protocols and parts[1].endswith('.ovpn'):
+                    self.add(parts[1].rsplit('.', 2)[0], protocols[parts[0]], zip_file.read(member))
+                    count += 1
+        return count
+
+    def is_stale(self):
+        """
+        :return: True if an archive was never ingested or was last checked longer than the TTL ago
+        """
+        return any(time.time() - self.meta.get(url, {}).get('fetched_at', 0) > self.ttl for url in config_archives)
+
+    def refresh(self, timeout=30):
+        """
+        Conditionally downloads the configuration archives and ingests the ones that changed
+
+        :return: number of files stored
+        """
+        count = 0
+        for url in config_archives:
+            meta = self.meta.get(url, {})
+            headers = {'If-None-Match': meta['etag']} if meta.get('etag') else {}
+            resp = self.http.get(url, headers=headers, timeout=timeout, stream=True)
+            if resp.status_code != HTTPStatus.NOT_MODIFIED:
+                resp.raise_for_status()
+                resp.raw.decode_content = True
+                with tempfile.TemporaryFile() as archive:
+                    shutil.copyfileobj(resp.raw, archive)
+                    count += self.ingest_archive(archive)
+                meta = {'etag': resp.headers.get('ETag')}
+            meta['fetched_at'] = time.time()
+            self.meta[url] = meta
+            self.write_meta()  # keep the progress of earlier archives if a later one fails
+        return count
+
+    def write_meta(self):
+        temp_path = self.meta_path + '.tmp'
+        with open(temp_path, 'w') as meta_file:
+            json.dump(self.meta, meta_file)
+        os.replace(temp_path, self.meta_path)
+
+
+class ConfigPrefetcher:
+    """
+    Warms the config store for the servers most likely to be connected to next
+    Starting a prefetch cancels the one for the previous filter, downloads are rate limited and prefetched files capped
+    """
+    def __init__(self, store, count=prefetch_count, rate=32 * 1024, max_files=100):
+        self.store = store
+        self.count = count
+        self.rate = rate  # bytes per second
+        self.max_files = max_files
+        self.generation = 0
+        self.prefetched = deque()  # (domain, protocol) of prefetched files not connected to yet, oldest first
+        self.lock = threading.Lock()
+
+    def start(self):
+        """
+        Cancels the running prefetch
+
+        :return: generation to pass to prefetch()
+        """
+        with self.lock:
+            self.generation += 1
+            return self.generation
+
+    def prefetch(self, generation, domains, protocol):
+        """
+        Fetches the ovpn files missing from the store for the first count domains
+        Stops as soon as a newer prefetch was started
+
+        :return: number of files fetched
+        """
+        fetched = 0
+        transferred = 0
+        start = time.monotonic()
+        for domain in domains[:self.count]:
+            if generation != self.generation:
+                break
+            if self.store.get(domain, protocol):
+                continue
+            path = self.store.fetch(domain, protocol)
+            transferred += os.path.getsize(path)
+            fetched += 1
+            with self.lock:
+                self.prefetched.append((domain, protocol))
+                evicted = [self.prefetched.popleft() for _ in range(len(self.prefetched) - self.max_files)]
+            for key in evicted:
+                self.store.remove(*key)
+            delay = transferred / self.rate - (time.monotonic() - start)
+            if delay > 0:  # stay below the bandwidth cap
+                time.sleep(delay)
+        return fetched
+
+    def used(self, domain, protocol):
+        """
+        Keeps a prefetched file that was connected to from being evicted
+        """
+        with self.lock:
+            if (domain, protocol) in self.prefetched:
+                self.prefetched.remove((domain, protocol))
+
+
+class ProfileCache:
+    """
+    NetworkManager connections kept after a disconnect, so connecting to the same server again is a single up
+    Connections are keyed by their name, which holds server, categories and protocol, and evicted least recently used
+    first once more than limit are kept. The order is kept in a file shared by the GUI and nord-nm, together with a
+    released mark on the connections let go on purpose, so the GUI does not fail over when nord-nm disconnects
+    """
+    def __init__(self, backend, path, limit=profile_cache_size):
+        self.backend = backend
+        self.path = path
+        self.limit = limit
+        self.lock = threading.RLock()  # held by imports so collect() never sees a connection before it is recorded
+
+    def read(self):
+        """
+        :return: OrderedDict of name -> (username, imported_at, released), least recently used first
+        """
+        try:
+            with open(self.path, 'r') as cache_file:
+                # entries of earlier versions have no released mark
+                return OrderedDict((name, (username, imported_at, any(released)))
+                                   for name, username, imported_at, *released in json.load(cache_file))
+        except (OSError, ValueError, TypeError):
+            return OrderedDict()
+
+    def write(self, profiles):
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as cache_file:
+            json.dump([[name, username, imported_at, released]
+                       for name, (username, imported_at, released) in profiles.items()], cache_file)
+        os.replace(temp_path, self.path)
+
+    def get(self, name, username, config_mtime=0):
+        """
+        Marks the connection name as the most recently used if it can be brought up as it is
+
+        :param config_mtime: modification time of the ovpn file, connections imported from an older copy are stale
+        :return: True if name is kept with the secrets of username and is not stale
+        """
+        with self.lock:
+            profiles = self.read()
+            if name not in profiles:
+                return False
+            if profiles[name][0] != username or profiles[name][1] < config_mtime:
+                try:
+                    self.discard(name)
+                except NetworkManagerError:  # already gone
+                    pass
+                return False
+            profiles[name] = profiles[name][:2] + (False,)
+            profiles.move_to_end(name)
+            self.write(profiles)
+            return True
+
+    def add(self, name, username):
+        """
+        Records the connection name, just imported with the secrets of username
+        """
+        with self.lock:
+            profiles = self.read()
+            profiles.pop(name, None)
+            profiles[name] = (username, time.time(), False)
+            self.write(profiles)
+
+    def discard(self, name):
+        """
+        Deletes the connection name, whether it is kept or not
+        """
+        with self.lock:
+            profiles = self.read()
+            if profiles.pop(name, None) is not None:
+                self.write(profiles)
+        self.backend.delete(name)
+
+    def release(self, name, keep=()):
+        """
+        Keeps the connection name, which is no longer used, and evicts the least recently used connections beyond limit
+        Connections that were never recorded, e.g. imported by an earlier version, are deleted
+
+        :param keep: names of connections in use, they are never evicted
+        """
+        with self.lock:
+            profiles = self.read()
+            if name in profiles:
+                profiles[name] = profiles[name][:2] + (True,)
+                evicted = self.evict(profiles, keep)
+            else:
+                evicted = [name]
+            self.write(profiles)
+        self.backend.delete_all(evicted)
+
+    def mark(self, name, released):
+        """
+        Sets the released mark of the connection name if it is kept, a connection is marked before it is taken down
+        """
+        with self.lock:
+            profiles = self.read()
+            if name in profiles and profiles[name][2] != released:
+                profiles[name] = profiles[name][:2] + (released,)
+                self.write(profiles)
+
+    def released(self, name):
+        """
+        :return: True if the connection name was let go on purpose and not brought up again since
+        """
+        return self.read().get(name, (None, 0, False))[2]
+
+    def evict(self, profiles, keep):
+        """
+        Removes the least recently used connections beyond limit from profiles
+
+        :return: names of the evicted connections
+        """
+        unused = [name for name in profiles if name not in keep]
+        evicted = unused[:max(0, len(profiles) - self.limit)]
+        for name in evicted:
+            del profiles[name]
+        return evicted
+
+    def collect(self, keep=()):
+        """
+        Deletes in one pass the Nord connections NetworkManager holds that are not kept, e.g. left behind by a crash,
+        evicts the connections beyond limit and forgets kept connections that no longer exist
+
+        :param keep: names of connections in use, they are never deleted
+        :return: names of the deleted connections
+        """
+        with self.lock:
+            saved = [name for connection_type, name in self.backend.saved_connections()
+                     if connection_type == 'vpn' and parse_connection_name(name)]
+            profiles = self.read()
+            for name in [name for name in profiles if name not in saved]:
+                del profiles[name]
+            deleted = [name for name in saved if name not in profiles and name not in keep]
+            deleted += self.evict(profiles, keep)
+            self.write(profiles)
+        with contextlib.suppress(NetworkManagerError):  # removed meanwhile
+            self.backend.delete_all(deleted)
+        return deleted
+
+
+current_trace = contextvars.ContextVar('current_trace', default=None)  # Trace whose stage runs in this context
+
+
+def count_subprocess():
+    """
+    Counts a subprocess started by nmcli or the helper for the trace of the stage running in the current context
+    Other work, e.g. background refreshes on other threads, runs outside of that context and is not counted
+    """
+    trace = current_trace.get()
+    if trace is not None:
+        trace.count_subprocess()
+
+
+def percentile(values, q):
+    """
+    :return: nearest rank q-th percentile of values
+    """
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+class Trace:
+    """
+    Wall time, subprocess count and outcome of each stage of a connect or disconnect
+    Stages are timed with the stage() context manager, subprocesses count for the stage of the context they are started in
+    """
+    def __init__(self, operation):
+        self.operation = operation
+        self.started = time.time()
+        self.start = time.monotonic()
+        self.subprocesses = 0
+        self.lock = threading.Lock()  # race attempts count from several threads
+        self.stages = []
+        self.pending = {}
+        self.failure = None
+
+    def count_subprocess(self):
+        with self.lock:
+            self.subprocesses += 1
+
+    def begin(self, name):
+        self.failure = None
+        self.pending[name] = (time.monotonic(), self.subprocesses)
+
+    def end(self, name, outcome=None):
+        """
+        :param outcome: defaults to the reason passed to fail() during the stage or 'ok'
+        """
+        start, subprocesses = self.pending.pop(name)
+        self.stages.append(StageTiming(name, time.monotonic() - start, self.subprocesses - subprocesses,
+                                       outcome or self.failure or 'ok'))
+
+    def fail(self, reason):
+        """
+        Marks the running stage as failed for errors that are handled instead of raised
+        """
+        self.failure = reason
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """
+        Times name, the subprocesses started in the current context meanwhile count for it
+        """
+        self.begin(name)
+        token = current_trace.set(self)
+        try:
+            yield
+        except Exception as ex:
+            self.end(name, 'error: ' + str(ex))
+            raise
+        finally:
+            current_trace.reset(token)
+        self.end(name)
+
+    def finish(self, outcome=None):
+        """
+        :param outcome: defaults to 'error' if a stage failed and 'ok' otherwise
+        :return: record for the TimingLog
+        """
+        if outcome is None:
+            outcome = 'ok' if all(stage.outcome == 'ok' for stage in self.stages) else 'error'
+        return {
+            'operation': self.operation,
+            'started': self.started,
+            'seconds': round(time.monotonic() - self.start, 6),
+            'subprocesses': self.subprocesses,
+            'outcome': outcome,
+            'stages': [dict(stage._asdict(), seconds=round(stage.seconds, 6)) for stage in self.stages]}
+
+
+class TimingLog:
+    """
+    Rotating JSON lines log of connect and disconnect traces
+    The latest records are kept in memory for the percentile summary
+    """
+    def __init__(self, log_dir, max_bytes=256 * 1024, backups=3, recent=200):
+        self.path = os.path.join(log_dir, 'timings.jsonl')
+        self.recent = deque(maxlen=recent)
+        try:
+            with open(self.path) as log:
+                for line in log:
+                    try:
+                        self.recent.append(json.loads(line))
+                    except ValueError:  # line cut short by a crash
+                        pass
+        except OSError:
+            pass
+        import logging.handlers  # deferred until the first connect
+        self.make_record = logging.makeLogRecord
+        self.handler = logging.handlers.RotatingFileHandler(self.path, maxBytes=max_bytes, backupCount=backups, delay=True)
+
+    def write(self, record):
+        self.recent.append(record)
+        self.handler.handle(self.make_record({'msg': json.dumps(record)}))
+
+    def summary(self):
+        """
+        :return: rows of (operation, stage, count, p50, p90, p99, failures), the stage 'total' covers the whole operation
+        """
+        samples = {}
+        for record in self.recent:
+            samples.setdefault((record['operation'], 'total'), []).append((record['seconds'], record['outcome']))
+            for stage in record['stages']:
+                samples.setdefault((record['operation'], stage['name']), []).append((stage['seconds'], stage['outcome']))
+        rows = []
+        for (operation, stage), values in samples.items():  # in pipeline order
+            seconds = [value for value, outcome in values]
+            failures = sum(outcome != 'ok' for value, outcome in values)
+            rows.append((operation, stage, len(values), percentile(seconds, 50), percentile(seconds, 90),
+                         percentile(seconds, 99), failures))
+        return rows
+
+
+class NordCore:
+    """
+    Settings, catalog, configs, NetworkManager and privileged helper behind both MainWindow and the nord-nm command
+    Connecting and disconnecting are split into steps that raise on failure, so the GUI can run slow steps in the
+    background and report between them, connect() and disconnect() run the whole pipeline for the command line
+    Heavier members are only created when first used
+    """
+    def __init__(self, base_dir=None):
+        self.base_dir = base_dir or os.path.join(os.path.abspath(os.path.expanduser('~')), '.nordnmconfigs')
+        self.config_path = os.path.join(os.path.abspath(self.base_dir), '.configs')
+        self.scripts_path = os.path.join(os.path.abspath(self.base_dir), '.scripts')
+        self.cache_path = os.path.join(os.path.abspath(self.base_dir), '.cache')
+        self.certs_path = os.path.join(os.path.abspath(self.base_dir), '.certs')
+        self.store_path = os.path.join(os.path.abspath(self.base_dir), '.ovpn_store')
+        self.logs_path = os.path.join(os.path.abspath(self.base_dir), '.logs')
+        self.conf_path = os.path.join(self.config_path, 'nord_settings.conf')
+        self.config = configparser.ConfigParser()
+        self.helper = PrivilegedHelper()
+        self.connection_name = None
+        self.standby_name = None  # inactive connection the active one fails over to
+        self.endpoints = {}  # connection name: servers of its ovpn file, allowed through the kill switch
+        self.server_index = None  # ServerIndex last loaded, see loaded_catalog()
+        self.trace = None
+
+    @cached_property
+    def http(self):
+        return HttpClient()
+
+    @cached_property
+    def prober(self):
+        return LatencyProber(path=os.path.join(self.cache_path, 'latency.json'))
+
+    @cached_property
+    def health(self):
+        return TunnelHealth()
+
+    @cached_property
+    def backend(self):
+        return get_backend(self.certs_path)
+
+    @cached_property
+    def catalog(self):
+        return CatalogCache(self.cache_path, self.http, self.config.getint('SETTINGS', 'catalog_ttl', fallback=catalog_ttl))
+
+    @cached_property
+    def configs(self):
+        return ConfigStore(self.store_path, self.http, self.config.getint('SETTINGS', 'config_ttl', fallback=config_ttl))
+
+    @cached_property
+    def profiles(self):
+        return ProfileCache(self.backend, os.path.join(self.cache_path, 'profiles.json'),
+                            self.config.getint('SETTINGS', 'profile_cache', fallback=profile_cache_size))
+
+    @cached_property
+    def prefetcher(self):
+        return ConfigPrefetcher(self.configs)
+
+    @cached_property
+    def timing_log(self):
+        return TimingLog(self.logs_path)
+
+    def setup(self):
+        """
+        Creates the config directories and the default settings if they do not exist and reads the settings
+        """
+        for path in (self.base_dir, self.config_path, self.scripts_path, self.cache_path, self.store_path, self.logs_path):
+            if not os.path.isdir(path):
+                os.mkdir(path)
+        if not os.path.isdir(self.certs_path):
+            os.mkdir(self.certs_path, 0o700)
+        if not os.path.isfile(self.conf_path):
+            self.config['USER'] = {
+                'USER_NAME': 'None'}
+            self.config['SETTINGS'] = {
+                'MAC_RANDOMIZER': 'False',
+                'FASTEST': 'False',
+                'KILL_SWITCH': 'False',
+                'AUTO_CONNECT': 'False',
+                'CATALOG_TTL': str(catalog_ttl),
+                'CONFIG_TTL': str(config_ttl),
+                'PROFILE_CACHE': str(profile_cache_size),
+                'AUTO_CONNECT_DEBOUNCE': str(auto_connect_debounce),
+                'RACE': 'False'}
+            self.write_conf()
+        self.config.read(self.conf_path)
+
+    def write_conf(self):
+        """
+        Writes config file
+        """
+        with open(self.conf_path, 'w') as configfile:
+            self.config.write(configfile)
+
+    def setting(self, name):
+        """
+        :return: boolean setting from the SETTINGS section, False if it is missing
+        """
+        return self.config.getboolean('SETTINGS', name, fallback=False)
+
+    def set_setting(self, name, value):
+        self.config['SETTINGS'][name] = str(bool(value))
+        self.write_conf()
+
+    def saved_username(self):
+        """
+        :return: username saved with "Remember" or None
+        """
+        username = self.config.get('USER', 'USER_NAME', fallback='None')
+        return None if username == 'None' else username
+
+    def saved_password(self, username):
+        import keyring  # deferred, finding a keyring backend is slow
+        return keyring.get_password('NordVPN', username)
+
+    def remember(self, username, password):
+        """
+        Saves the password in the keyring and the username in the settings
+        """
+        import keyring
+        keyring.set_password('NordVPN', username, password)
+        self.config['USER']['USER_NAME'] = username
+        self.write_conf()
+
+    def forget(self, username):
+        import keyring
+        keyring.delete_password('NordVPN', username)
+        self.config['USER']['USER_NAME'] = 'None'
+        self.write_conf()
+
+    def load_catalog(self, timeout=5):
+        """
+        Loads the cached catalog, revalidating it first once it is stale
+        A failed revalidation falls back to the cached copy
+
+        :return: ServerIndex, empty if no catalog could be loaded
+        """
+        server_index = None
+        if self.catalog.is_stale():
+            try:
+                server_index = self.catalog.refresh(timeout=timeout)
+            except (OSError, ValueError):
+                pass
+        self.server_index = server_index or self.catalog.load() or build_index([])
+        return self.server_index
+
+    def loaded_catalog(self):
+        """
+        :return: ServerIndex last loaded by load_catalog() or handed over by the GUI, the cached catalog is only parsed
+                 if there is none yet. None without a catalog
+        """
+        if self.server_index is None:
+            self.server_index = self.catalog.load()
+        return self.server_index
+
+    def begin_trace(self, operation):
+        self.trace = Trace(operation)
+
+    def stage(self, name):
+        """
+        :return: context manager timing name as a stage of the running connect or disconnect, a no-op outside of one
+        """
+        return self.trace.stage(name) if self.trace else contextlib.nullcontext()
+
+    def stage_failed(self, reason):
+        if self.trace:
+            self.trace.fail(reason)
+
+    def finish_trace(self, outcome=None):
+        """
+        Writes the running connect or disconnect trace to the timing log
+        """
+        if self.trace:
+            record = self.trace.finish(outcome)
+            record['connection'] = self.connection_name
+            record['backend'] = type(self.backend).__name__
+            self.timing_log.write(record)
+            self.trace = None
+
+    def authorize(self, sudo_password=None):
+        """
+        :param sudo_password: starts the helper through sudo instead of polkit
+        :return: True if the privileged helper runs
+        """
+        return self.helper.running() or self.helper.start(sudo_password=sudo_password)
+
+    def active_connection(self):
+        """
+        :return: name of the active connection created by this application or None
+        """
+        for connection_type, name, _ in self.backend.active_connections():
+            if connection_type == 'vpn' and parse_connection_name(name):
+                return name
+        return None
+
+    def interfaces(self):
+        """
+        :return: names of the wifi and ethernet interfaces
+        """
+        return [interface for device_type, interface in self.backend.devices() if device_type in ('wifi', 'ethernet')]
+
+    def randomize_mac(self):
+        self.backend.randomize_mac()
+
+    def get_config(self, domain, protocol, timeout=10):
+        """
+        :param protocol: key of config_dirs
+        :return: path of the stored ovpn file, downloaded if the store does not have it
+        """
+        self.prefetcher.used(domain, protocol)
+        return self.configs.get(domain, protocol) or self.configs.fetch(domain, protocol, timeout=timeout)
+
+    def import_config(self, name, stored_path, username, password):
+        """
+        Imports a stored ovpn file as the connection name together with the username and password
+        The copy handed to NetworkManager is removed afterwards
+        """
+        self.connection_name = name
+        self.import_profile(name, stored_path, username, password)
+
+    def import_profile(self, name, stored_path, username, password):
+        """
+        Imports a stored ovpn file as the inactive connection name, the copy handed to NetworkManager is removed afterwards
+        The connection is recorded in the profile cache
+        """
+        self.endpoints[name] = ovpn_endpoints(stored_path)
+        ovpn_path = shutil.copy(stored_path, os.path.join(self.config_path, os.path.basename(stored_path)))
+        try:
+            with self.profiles.lock:
+                self.backend.add_vpn(name, ovpn_path, username, password)
+                self.profiles.add(name, username)
+        finally:
+            os.remove(ovpn_path)
+
+    def connection_kept(self, name, domain, protocol, username):
+        """
+        :param protocol: key of config_dirs
+        :return: True if the connection name is kept from an import for username of the current ovpn file, it can then
+                 be brought up without downloading and importing it
+        """
+        stored_path = self.configs.get(domain, protocol)
+        # without the ovpn file the servers to allow through the kill switch are unknown, the connection is imported again
+        if not self.profiles.get(name, username, os.path.getmtime(stored_path) if stored_path else math.inf):
+            return False
+        self.endpoints[name] = ovpn_endpoints(stored_path)
+        return True
+
+    def collect_profiles(self):
+        """
+        Deletes the Nord connections left behind by crashes and the kept ones beyond the cache limit
+
+        :return: names of the deleted connections
+        """
+        in_use = {name for connection_type, name, uuid in self.backend.active_connections()}
+        return self.profiles.collect(keep=in_use | {self.connection_name, self.standby_name})
+
+    def activate(self):
+        """
+        Brings the connection up, a connection that fails to come up is deleted so the next connect imports it again
+        """
+        try:
+            self.backend.activate(self.connection_name)
+        except NetworkManagerError:
+            with contextlib.suppress(NetworkManagerError):  # e.g. a kept connection with an outdated password
+                self.profiles.discard(self.connection_name)
+            raise
+
+    def race(self, servers, server_type, connection_type, username, password, stagger=race_stagger):
+        """
+        Connects to whichever of servers comes up first, so a server slow to complete its handshake is not waited for
+        All of them are prepared at once, imported unless the profile cache keeps them. Like happy eyeballs the first
+        server is brought up right away and the next one once stagger seconds passed or an attempt failed. The
+        connections that lost are taken down and handed to the profile cache
+
+        :param servers: ServerInfo candidates, the preferred one first
+        :param server_type: entry of server_type_options the servers were chosen for
+        :param connection_type: entry of connection_type_options
+        :return: name of the connection that came up, which becomes the active one
+        """
+        connection_type = valid_connection_type(server_type, connection_type)
+        protocol = config_protocol(server_type, connection_type)
+        names = [connection_name(server, connection_type) for server in servers]
+        turns = [threading.Event() for _ in servers]  # set once the attempt may bring its connection up
+        activating = set()
+        results = queue.Queue()  # (index, exception or None) of each attempt that ended
+        lock = threading.Lock()
+        decided = threading.Event()
+        winner = None
+
+        def attempt(index):
+            name = names[index]
+            try:
+                if not self.connection_kept(name, servers[index].domain, protocol, username):
+                    self.import_profile(name, self.get_config(servers[index].domain, protocol), username, password)
+                turns[index].wait()
+                with lock:
+                    if decided.is_set():  # never started
+                        with contextlib.suppress(NetworkManagerError):
+                            self.profiles.release(name, keep=(names[winner] if winner is not None else None, self.standby_name))
+                        return
+                    activating.add(index)
+                self.backend.activate(name)
+            except Exception as ex:
+                results.put((index, ex))
+            else:
+                results.put((index, None))
+
+        # each attempt counts its subprocesses for the race stage, a context can only be entered by one thread at a time
+        threads = [threading.Thread(target=contextvars.copy_context().run, args=(attempt, index), daemon=True)
+                   for index in range(len(servers))]
+        for thread in threads:
+            thread.start()
+        started = 0
+        errors = {}
+        while winner is None and len(errors) < len(servers):
+            if started < len(servers) and not set(range(started)) - set(errors):
+                turns[started].set()  # the first attempt, or every started one already failed
+                started += 1
+            try:
+                index, error = results.get(timeout=stagger if started < len(servers) else None)
+            except queue.Empty:
+                turns[started].set()
+                started += 1
+                continue
+            if error is None:
+                winner = index
+            else:
+                errors[index] = error
+                if index in activating:
+                    with contextlib.suppress(NetworkManagerError):  # e.g. a kept connection with an outdated password
+                        self.profiles.discard(names[index])
+
+        with lock:
+            decided.set()
+            racing = activating - set(errors) - {winner}
+        for turn in turns:
+            turn.set()
+        for index in racing:
+            with contextlib.suppress(NetworkManagerError):  # came up or failed meanwhile
+                self.backend.deactivate(names[index])
+        for index in racing:
+            threads[index].join()
+        while not results.empty():
+            index, error = results.get()
+            if index in racing and error is None:  # came up before it was taken down
+                with contextlib.suppress(NetworkManagerError):
+                    self.backend.deactivate(names[index])
+        keep = (names[winner] if winner is not None else None, self.standby_name)
+        for index in racing:
+            with contextlib.suppress(NetworkManagerError):
+                self.profiles.release(names[index], keep=keep)
+        if winner is None:
+            raise errors.get(0, next(iter(errors.values())))
+        self.connection_name = names[winner]
+        return self.connection_name
+
+    def deactivate(self, sleep=time.sleep):
+        """
+        Takes the connection down, marked as released first so a GUI watching it does not fail over
+
+        :param sleep: passed to wait_until() while waiting for the connection to go down
+        """
+        self.profiles.mark(self.connection_name, True)
+        self.backend.deactivate(self.connection_name)
+        # D-Bus deactivation returns before the connection is down
+        if not wait_until(lambda: not self.backend.is_active(self.connection_name), 10, sleep=sleep):
+            raise NetworkManagerError(self.connection_name + ' is still active')
+
+    def remove_connection(self):
+        """
+        Hands the inactive connection back to the profile cache, which deletes it unless it is kept for reconnects
+        """
+        self.profiles.release(self.connection_name, keep=(self.standby_name,))
+
+    def prepare_standby(self, server, server_type, connection_type, username, password):
+        """
+        Imports server as the inactive standby of the active connection, replacing the previous standby
+        A failover then only has to bring it up
+
+        :param server: ServerInfo, not the server of the active connection
+        :return: name of the standby connection
+        """
+        connection_type = valid_connection_type(server_type, connection_type)
+        name = connection_name(server, connection_type)
+        if name == self.connection_name:
+            raise NetworkManagerError(name + ' is the active connection')
+        if name != self.standby_name:
+            self.remove_standby()
+            protocol = config_protocol(server_type, connection_type)
+            if not self.connection_kept(name, server.domain, protocol, username):
+                self.import_profile(name, self.get_config(server.domain, protocol), username, password)
+            self.standby_name = name
+            if self.setting('kill_switch'):
+                self.install_kill_switch()  # lets the standby through once the active connection is lost
+        return name
+
+    def remove_standby(self):
+        if self.standby_name is not None:
+            name, self.standby_name = self.standby_name, None
+            self.profiles.release(name, keep=(self.connection_name,))
+            if self.setting('kill_switch'):
+                self.install_kill_switch()
+
+    def failover(self):
+        """
+        Switches from the active connection to its standby
+        The standby is brought up before the failed connection is removed. The kill switch lets the standby server
+        through, so the standby also comes up after the failed connection went down while the kill switch was on
+
+        :return: name of the connection that is now active
+        """
+        if self.standby_name is None:
+            raise NetworkManagerError('no standby connection')
+        failed, standby = self.connection_name, self.standby_name
+        self.begin_trace('failover')
+        try:
+            with self.stage('enable_standby'):
+                self.backend.activate(standby)
+        except Exception:
+            self.finish_trace()
+            raise
+        self.connection_name, self.standby_name = standby, None
+        steps = [('remove_connection', lambda: self.profiles.discard(failed))]  # also takes it down if it is still active
+        if self.setting('kill_switch'):
+            steps.append(('set_kill_switch', self.install_kill_switch))  # also installs auto-connect for the standby
+        elif self.setting('auto_connect'):
+            steps.append(('set_auto_connect', lambda: self.install_auto_connect(standby)))
+        for stage, step in steps:
+            try:
+                with self.stage(stage):
+                    step()
+            except (NetworkManagerError, HelperError):
+                pass  # the standby is up, the failed step is recorded in the trace
+        self.finish_trace()
+        return standby
+
+    def connection_failed(self, reason):
+        """
+        :param reason: NMActiveConnectionStateReason the active connection went down with, None if it is unknown as
+                       nmcli monitor does not report it
+        :return: True if the connection failed and its standby should take over, False if it was taken down on purpose,
+                 also by nord-nm disconnect while the GUI runs. A connection that went down for an unknown reason
+                 failed unless it was released, a tunnel that dropped is never left down
+        """
+        if self.profiles.released(self.connection_name):
+            return False
+        return reason is None or reason in nm_failure_reasons
+
+    def auto_connect_connections(self, preferred, server_index, allowed=None, count=auto_connect_candidates):
+        """
+        Ranks the connections the profile cache keeps by the latency of their servers as last probed and then by the
+        load of the cached catalog. Connections to other countries or over the other protocol than preferred are only
+        chosen if no other is kept
+
+        :param preferred: connection auto-connect is turned on for, always among the ones returned
+        :param server_index: ServerIndex the servers of the connections are looked up in, None without a catalog
+        :param allowed: names the candidates are limited to, e.g. the ones the kill switch lets through
+        :return: names of at most count connections, the one to bring up first
+        """
+        saved = {name for connection_type, name in self.backend.saved_connections()
+                 if connection_type == 'vpn' and parse_connection_name(name)}
+        candidates = [name for name in self.profiles.read() if name in saved and name != preferred and
+                      (allowed is None or name in allowed)] + [preferred]
+        store = server_index.store if server_index else ServerStore()
+        rows = {name: row for row, name in enumerate(store.names) if row not in store.removed}
+
+        def server_row(name):
+            return rows.get(parse_connection_name(name).server)
+
+        protocol, row = parse_connection_name(preferred).protocol, server_row(preferred)
+        candidates = [name for name in candidates if parse_connection_name(name).protocol == protocol and (
+            row is None or server_row(name) is not None and store.country_ids[server_row(name)] == store.country_ids[row])]
+
+        def rank(name):
+            row = server_row(name)
+            if row is None:  # left the catalog
+                return 2, 0, 0, 0, name != preferred
+            probe = self.prober.cached(store.domains[row], ttl=math.inf)
+            if probe is None or probe.rtt is None:
+                return 1, 0, 0, store.loads[row], name != preferred
+            return 0, probe.loss, probe.rtt, store.loads[row], name != preferred
+        ranked = sorted(candidates, key=rank)[:count]
+        if preferred not in ranked:
+            ranked[-1] = preferred
+        return ranked
+
+    def auto_connect_op(self, name, kill_switch):
+        """
+        :param kill_switch: True if the kill switch will be on, the script then only tries the connections it lets
+                            through, any other would only time out
+        :return: helper operation installing the dispatcher script that brings a Nord connection up once a wifi or
+                 ethernet interface comes up and no further interface event came for the debounce of the settings. The
+                 script tries the connections of auto_connect_connections() in turn
+        """
+        interfaces = self.interfaces()
+        if not interfaces:
+            raise NetworkManagerError('no wifi or ethernet interfaces')
+        allowed = {self.connection_name, self.standby_name} if kill_switch else None
+        return {'op': 'install', 'name': 'auto_connect', 'interfaces': interfaces,
+                'connections': self.auto_connect_connections(name, self.loaded_catalog(), allowed),
+                'debounce': self.config.getfloat('SETTINGS', 'auto_connect_debounce', fallback=auto_connect_debounce)}
+
+    def install_auto_connect(self, name):
+        """
+        Has the helper install the auto-connect dispatcher script, built by the helper from the interfaces and the names
+        it validated
+        """
+        self.helper.call(self.auto_connect_op(name, self.setting('kill_switch')))
+        self.set_setting('auto_connect', True)
+
+    def remove_auto_connect(self):
+        self.helper.call({'op': 'remove', 'name': 'auto_connect'})
+        self.set_setting('auto_connect', False)
+
+    def kill_switch_endpoints(self, extra=()):
+        """
+        :param extra: names of further connections to let through, e.g. the candidates of a race
+        :return: list of [address, port, protocol] the kill switch lets through, the servers of the active connection
+                 and its standby together with the probe port of the health checks
+        """
+        endpoints = []
+        for name in (self.connection_name, self.standby_name) + tuple(extra):
+            if name is None:
+                continue
+            for address, port, protocol in self.connection_endpoints(name):
+                for endpoint in ([address, port, protocol], [address, probe_port, 'tcp']):
+                    if endpoint not in endpoints:
+                        endpoints.append(endpoint)
+        return endpoints
+
+    def connection_endpoints(self, name):
+        """
+        :return: list of (address, port, protocol) of the servers of the connection name, for a connection that was not
+                 imported or reused by this process, e.g. brought up by auto-connect, read from the stored ovpn files
+        """
+        if name not in self.endpoints:
+            connection = parse_connection_name(name)
+            server_index = self.loaded_catalog()
+            if connection is None or server_index is None or connection.server not in server_index.store.names:
+                raise NetworkManagerError('Servers of ' + name + ' are unknown')
+            domain = server_index.store.domains[server_index.store.names.index(connection.server)]
+            # the server type the connection was made for is not part of the name, it may use either config
+            server_types = [connection.type[0]] + (['Obfuscated Server'] if 'Obfuscated Server' in connection.type else [])
+            protocols = list(dict.fromkeys(config_protocol(server_type, connection.protocol) for server_type in server_types))
+            stored_paths = [path for path in (self.configs.get(domain, protocol) for protocol in protocols) if path]
+            endpoints = []
+            for stored_path in stored_paths or [self.get_config(domain, protocols[0])]:
+                endpoints += [endpoint for endpoint in ovpn_endpoints(stored_path) if endpoint not in endpoints]
+            self.endpoints[name] = endpoints
+        return self.endpoints[name]
+
+    def install_kill_switch(self, extra=()):
+        """
+        Loads the kill switch ruleset, which drops all traffic that neither goes through the tunnel nor to the servers
+        of kill_switch_endpoints(). It is in place before the tunnel goes down, nothing has to run when it does
+        Replaces the ruleset of an earlier call and the dispatcher script of older versions in one batch. With
+        auto-connect on its script is installed again in the same batch, limited to the connections let through
+
+        :param extra: see kill_switch_endpoints()
+        """
+        ops = [{'op': 'remove', 'name': 'kill_switch'},
+               {'op': 'kill_switch_on', 'endpoints': self.kill_switch_endpoints(extra)}]
+        if self.setting('auto_connect') and self.connection_name is not None and not extra:
+            ops.append(self.auto_connect_op(self.connection_name, True))
+        self.helper.call(*ops)
+        self.set_setting('kill_switch', True)
+
+    def remove_kill_switch(self):
+        self.helper.call({'op': 'remove', 'name': 'kill_switch'}, {'op': 'kill_switch_off'})
+        self.set_setting('kill_switch', False)
+
+    def set_ipv6(self, disable):
+        self.helper.call({'op': 'ipv6', 'disable': disable})
+
+    def connect(self, server, server_type, connection_type, username, password, auto_connect=False, kill_switch=False,
+                randomize_mac=False, alternatives=(), fastest=(), report=None):
+        """
+        Connects to server, stopping at the first step that fails
+        A connection kept from an earlier connect is brought up without downloading and importing it again
+
+        :param server: ServerInfo
+        :param server_type: entry of server_type_options the server was chosen for
+        :param connection_type: entry of connection_type_options
+        :param alternatives: ServerInfo raced against server, see race()
+        :param fastest: ServerInfo probed first, the one with the lowest latency replaces server if any answers
+        :param report: called with the name of each stage as it starts
+        :return: name of the NetworkManager connection
+        """
+        def stage(name):
+            if report:
+                report(name)
+            return self.stage(name)
+
+        connection_type = valid_connection_type(server_type, connection_type)
+        kill_switch_on = self.setting('kill_switch')
+        self.begin_trace('connect')
+        try:
+            if fastest:
+                with stage('find_fastest'):
+                    domain = self.prober.fastest([candidate.domain for candidate in fastest])
+                    if domain is None:
+                        self.stage_failed('no answer')
+                    else:
+                        chosen = next(candidate for candidate in fastest if candidate.domain == domain)
+                        alternatives = [candidate for candidate in [server] + list(alternatives)
+                                        if candidate.id != chosen.id][:len(alternatives)]
+                        server = chosen
+            name = connection_name(server, connection_type)
+            if randomize_mac:
+                with stage('randomize_mac'):
+                    self.randomize_mac()
+            with stage('disable_ipv6'):
+                self.set_ipv6(True)
+            protocol = config_protocol(server_type, connection_type)
+            # the ruleset letting the new servers through is loaded before they are brought up, a ruleset still loaded,
+            # e.g. restored at boot, would drop them
+            if alternatives:
+                candidates = [server] + list(alternatives)
+                if kill_switch:
+                    with stage('get_ovpn'):
+                        for candidate in candidates:
+                            self.endpoints[connection_name(candidate, connection_type)] = ovpn_endpoints(
+                                self.get_config(candidate.domain, protocol))
+                    with stage('set_kill_switch'):
+                        self.install_kill_switch(extra=[connection_name(candidate, connection_type)
+                                                        for candidate in candidates])
+                with stage('race'):
+                    name = self.race(candidates, server_type, connection_type, username, password)
+                if kill_switch:
+                    with stage('set_kill_switch'):
+                        self.install_kill_switch()  # only the winner and the standby
+            else:
+                if self.connection_kept(name, server.domain, protocol, username):
+                    self.connection_name = name
+                else:
+                    with stage('get_ovpn'):
+                        stored_path = self.get_config(server.domain, protocol)
+                    with stage('import_ovpn'):
+                        self.import_config(name, stored_path, username, password)
+                if kill_switch:
+                    with stage('set_kill_switch'):
+                        self.install_kill_switch()
+                with stage('enable_connection'):
+                    self.activate()
+            # installed after the race decided and limited to the servers the kill switch lets through
+            if auto_connect and not (kill_switch and self.setting('auto_connect')):  # else installed with the kill switch
+                with stage('set_auto_connect'):
+                    self.install_auto_connect(name)
+        except Exception:
+            if kill_switch and not kill_switch_on and self.setting('kill_switch'):
+                # turned on for this connect, the network is not left blocked without a connection
+                with contextlib.suppress(HelperError):
+                    self.remove_kill_switch()
+            self.finish_trace()
+            raise
+        self.finish_trace()
+        return name
+
+    def disconnect(self, name, report=None):
+        """
+        Disconnects the connection name and hands it to the profile cache, removing the kill switch and auto-connect
+        scripts first
+        Every step is attempted even if an earlier one failed, so that IPv6 comes back in any case
+
+        :param report: called with the name of each stage as it starts
+        :return: list of "stage: error" for the steps that failed
+        """
+        self.connection_name = name
+        steps = []
+        if self.setting('kill_switch'):
+            steps.append(('disable_kill_switch', self.remove_kill_switch))
+        if self.setting('auto_connect'):
+            steps.append(('disable_auto_connect', self.remove_auto_connect))
+        steps += [('disable_connection', self.deactivate), ('remove_connection', self.remove_connection)]
+        if self.standby_name is not None:
+            steps.append(('remove_standby', self.remove_standby))
+        steps.append(('enable_ipv6', lambda: self.set_ipv6(False)))
+        self.begin_trace('disconnect')
+        errors = []
+        for stage, step in steps:
+            if report:
+                report(stage)
+            try:
+                with self.stage(stage):
+                    step()
+            except (NetworkManagerError, HelperError) as ex:
+                errors.append(stage + ': ' + str(ex))
+        self.finish_trace()
+        return errors
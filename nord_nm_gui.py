@@ -2,50 +2,453 @@
 # NordVPN-NetworkManager-GUI a graphical frontend for both NordVPN and the Network Manager
 # Copyright (C) 2018 Vincent Foster-Mueller
 import sys
-import os
-import requests
-import shutil
-import time
-import prctl
-import keyring
-import subprocess
-import configparser
-from collections import namedtuple
+import bisect
+import contextvars
+import threading
+from array import array
 from PyQt5 import QtCore, QtGui, QtWidgets
 from PyQt5.QtWidgets import QSystemTrayIcon, QStyle, QAction, qApp,  QMenu, QCheckBox
 from PyQt5.QtGui import QIcon
+from nord_nm_core import (NordCore, DBusBackend, NetworkManagerError, HelperError, ServerView, SearchIndex, build_index,
+                          server_label, parse_connection_name, config_protocol, valid_connection_type,
+                          percentile, request_token, connection_type_options, server_type_options, probe_candidates,
+                          race_candidates, catalog_refresh_interval, health_interval, nm_bus_name, nm_path,
+                          nm_active_deactivating, nm_active_deactivated)
+try:
+    import dbus
+except ImportError:  # python-dbus is optional, NetworkManager is driven through nmcli without it
+    dbus = None
+# stage of NordCore.connect() or disconnect() -> status bar message while it runs and when it failed
+stage_messages = {
+    'find_fastest': "Finding fastest server...",
+    'randomize_mac': "Randomizing MAC Address",
+    'set_auto_connect': "Installing auto-connect script...",
+    'disable_ipv6': "Disabling IPV6...",
+    'race': "Connecting...",
+    'get_ovpn': "Fetching configuration...",
+    'import_ovpn': "Importing Connection...",
+    'enable_connection': "Connecting...",
+    'set_kill_switch': "Activating kill switch...",
+    'disable_kill_switch': "Disabling Killswitch...",
+    'disable_auto_connect': "Disabling auto-connect...",
+    'disable_connection': "Disconnecting...",
+}
+stage_errors = {
+    'find_fastest': "ERROR: Latency probe failed",
+    'randomize_mac': "ERROR: Randomizer failed",
+    'set_auto_connect': "ERROR installing auto-connect script",
+    'disable_ipv6': "ERROR: disabling IPV6 failed",
+    'race': "ERROR: Connection Failed",
+    'get_ovpn': "Error fetching configuration files",
+    'import_ovpn': "ERROR: Importing VPN configuration",
+    'enable_connection': "ERROR: Connection Failed",
+    'set_kill_switch': "ERROR activating kill switch",
+    'disable_kill_switch': "ERROR disabling kill switch",
+    'disable_auto_connect': "ERROR removing auto-connect script",
+    'disable_connection': "ERROR: Disconnection Failed",
+    'remove_connection': "ERROR: Failed to remove Connection",
+    'remove_standby': "ERROR: Failed to remove standby connection",
+    'enable_ipv6': "ERROR: Enabling IPV6 failed",
+}
+
+
+class WorkerSignals(QtCore.QObject):
+    """
+    Signals emitted by a Worker, delivered to slots on the GUI thread
+    """
+    progress = QtCore.pyqtSignal(object)
+    result = QtCore.pyqtSignal(object)
+    error = QtCore.pyqtSignal(str)
+    finished = QtCore.pyqtSignal()
+    returned = QtCore.pyqtSignal()  # the function returned, also emitted after a timeout
+
+
+class Worker(QtCore.QRunnable):
+    """
+    Runs a blocking function on the thread pool so network I/O never stalls the GUI thread
+    A worker that times out drops whatever its function returns, running() tells when the function is actually done
+    """
+    def __init__(self, fn, *args, **kwargs):
+        super(Worker, self).__init__()
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.signals = WorkerSignals()
+        self.done = False
+        self.returned = False
+        self.lock = threading.Lock()
+
+    def claim(self):
+        """
+        Marks the worker as done
+
+        :return: True if this call finished the worker, False if it was already finished or timed out
+        """
+        with self.lock:
+            if self.done:
+                return False
+            self.done = True
+            return True
+
+    def pending(self):
+        """
+        :return: True until the worker finished or timed out
+        """
+        return not self.done
+
+    def running(self):
+        """
+        :return: True until the function returned, which may be long after a timeout
+        """
+        return not self.returned
 
-connection_type_options = ['UDP', 'TCP']
-server_type_options = ['P2P', 'Standard', 'Double VPN', 'TOR over VPN', 'Dedicated IP'] # , 'Anti-DDoS', 'Obfuscated Server']
-api = "https://api.nordvpn.com/server"
-ServerInfo = namedtuple('ServerInfo', 'name, country, domain, type, load, categories')
+    def expire(self):
+        """
+        Called when the timeout elapses before the function returned
+        """
+        if self.claim():
+            self.signals.error.emit("Timed out")
+            self.signals.finished.emit()
+
+    def report(self, value):
+        """
+        Passed to the function as the report keyword to publish intermediate results
+        """
+        if not self.done:
+            self.signals.progress.emit(value)
+
+    def run(self):
+        try:
+            result = self.fn(*self.args, **self.kwargs)
+        except Exception as ex:
+            if self.claim():
+                self.signals.error.emit(str(ex))
+                self.signals.finished.emit()
+        else:
+            if self.claim():
+                self.signals.result.emit(result)
+                self.signals.finished.emit()
+        finally:
+            self.returned = True
+            self.signals.returned.emit()
+
+
+class ConnectionMonitor(QtCore.QObject):
+    """
+    In-memory model of the active NetworkManager connections, updated from pushed events instead of polling
+    Subscribes to NetworkManager signals on D-Bus, or follows a single long-lived nmcli monitor without python-dbus
+    """
+    changed = QtCore.pyqtSignal(object)
+
+    def __init__(self, backend, parent=None):
+        super(ConnectionMonitor, self).__init__(parent)
+        self.backend = backend
+        self.connections = []  # (type, name, uuid) of the active connections
+        self.names = {}  # D-Bus path -> name of the active connections seen changing state
+        self.reasons = {}  # name -> NMActiveConnectionStateReason of the connections that went down
+        self.process = None
+        self.refresh_timer = QtCore.QTimer(self)  # coalesces bursts of events into one query
+        self.refresh_timer.setSingleShot(True)
+        self.refresh_timer.setInterval(100)
+        self.refresh_timer.timeout.connect(self.refresh)
+        if not (isinstance(backend, DBusBackend) and self.subscribe_dbus()):
+            self.follow_nmcli()
+
+    def subscribe_dbus(self):
+        """
+        :return: True if the NetworkManager signals are delivered through the Qt event loop
+        """
+        try:
+            from dbus.mainloop.pyqt5 import DBusQtMainLoop
+            # the shared bus of the backend has no main loop and would never deliver the signals
+            self.bus = dbus.SystemBus(private=True, mainloop=DBusQtMainLoop())
+            self.bus.add_signal_receiver(self.state_changed, signal_name='StateChanged',
+                                         dbus_interface=nm_bus_name + '.Connection.Active', path_keyword='path')
+            self.bus.add_signal_receiver(self.properties_changed, signal_name='PropertiesChanged',
+                                         dbus_interface=dbus.PROPERTIES_IFACE, path=nm_path)
+            return True
+        except (ImportError, dbus.DBusException):
+            return False
+
+    def follow_nmcli(self):
+        self.process = QtCore.QProcess(self)
+        self.process.readyReadStandardOutput.connect(self.nmcli_output)
+        self.process.start('nmcli', ['monitor'])
+
+    def nmcli_output(self):
+        self.process.readAllStandardOutput()
+        self.schedule_refresh()
+
+    def state_changed(self, state, reason, path=None):
+        """
+        Records why an active connection goes down, the name is looked up while its object still exists
+        """
+        if path not in self.names:
+            try:
+                self.names[path] = str(self.backend.get_property(path, nm_bus_name + '.Connection.Active', 'Id'))
+            except dbus.DBusException:
+                pass
+        if state in (nm_active_deactivating, nm_active_deactivated) and path in self.names:
+            self.reasons[self.names[path]] = int(reason)
+            if state == nm_active_deactivated:
+                del self.names[path]
+        self.schedule_refresh()
+
+    def deactivation_reason(self, name):
+        """
+        :return: NMActiveConnectionStateReason the connection name last went down with, None if it is unknown as
+                 nmcli monitor does not report it, NordCore.connection_failed() then counts it as failed
+        """
+        return self.reasons.pop(name, None)
+
+    def properties_changed(self, interface, changed, invalidated=None):
+        if 'ActiveConnections' in changed:
+            self.schedule_refresh()
+
+    def schedule_refresh(self, *args):
+        self.refresh_timer.start()
+
+    def refresh(self):
+        """
+        Queries the active connections and emits changed if the Nord connections differ
+        """
+        try:
+            # outside of the stage that may be waiting for the event loop, its nmcli calls are not the stage's
+            connections = contextvars.Context().run(self.backend.active_connections)
+        except NetworkManagerError:
+            return
+        self.update(connections)
+
+    def update(self, connections):
+        """
+        Replaces the active connections and emits changed if the Nord connections differ
+
+        :param connections: list of (type, name, uuid) as returned by the backend
+        """
+        previous = self.nord_connections()
+        self.connections = connections
+        if self.nord_connections() != previous:
+            self.changed.emit(self.nord_connections())
+
+    def vpn_connections(self):
+        return [name for connection_type, name, _ in self.connections if connection_type == 'vpn']
+
+    def nord_connections(self):
+        """
+        :return: names of the active connections created by this application
+        """
+        return [name for name in self.vpn_connections() if parse_connection_name(name)]
+
+    def stop(self):
+        if self.process is not None:
+            self.process.kill()
+            self.process.waitForFinished(1000)
+
+
+class ServerListModel(QtCore.QAbstractListModel):
+    """
+    Servers of the current filter as a list model, ServerInfo is only built for the rows the view asks for
+    Rows carry the server id so selections survive a change of filter or catalog
+    """
+    IdRole = QtCore.Qt.UserRole
+    InfoRole = QtCore.Qt.UserRole + 1
+
+    def __init__(self, parent=None):
+        super(ServerListModel, self).__init__(parent)
+        self.servers = ServerView()
+
+    def set_servers(self, servers):
+        """
+        :param servers: ServerView replacing the rows of the model
+        """
+        self.beginResetModel()
+        self.servers = servers
+        self.endResetModel()
+
+    def update_servers(self, servers, changed=None):
+        """
+        Moves the model to servers by removing, inserting and moving rows matched by server id instead of a reset,
+        so the view keeps its selection, current index and scroll position
+
+        :param servers: ServerView replacing the rows of the model, may be over a different store
+        :param changed: ids of the servers whose details changed, None if any may have
+        """
+        old_ids = [self.servers.store.ids[row] for row in self.servers.rows] if self.servers.store is not None else []
+        new_ids = [servers.store.ids[row] for row in servers.rows]
+        positions = {server_id: i for i, server_id in enumerate(new_ids)}
+        rows = array('I', self.servers.rows)
+        self.servers = ServerView(self.servers.store, rows)
+        end = len(old_ids)
+        while end:  # removes runs of rows that left the filter, last run first
+            if old_ids[end - 1] in positions:
+                end -= 1
+                continue
+            start = end - 1
+            while start and old_ids[start - 1] not in positions:
+                start -= 1
+            self.beginRemoveRows(QtCore.QModelIndex(), start, end - 1)
+            del rows[start:end]
+            del old_ids[start:end]
+            self.endRemoveRows()
+            end = start
+
+        row_lookup = servers.store.row_lookup
+        self.servers = ServerView(servers.store, array('I', (row_lookup[server_id] for server_id in old_ids)))
+        kept = set(old_ids)
+        added = [server_id for server_id in new_ids if server_id not in kept]
+        if added:
+            self.beginInsertRows(QtCore.QModelIndex(), len(old_ids), len(old_ids) + len(added) - 1)
+            self.servers.rows.extend(row_lookup[server_id] for server_id in added)
+            old_ids.extend(added)
+            self.endInsertRows()
+
+        if old_ids != new_ids:  # loads changed the order
+            self.layoutAboutToBeChanged.emit()
+            for index in self.persistentIndexList():
+                self.changePersistentIndex(index, self.index(positions[old_ids[index.row()]]))
+            self.servers = servers
+            self.layoutChanged.emit()
+        else:
+            self.servers = servers
+        rows = range(len(new_ids)) if changed is None else [positions[i] for i in changed if i in positions]
+        if rows:
+            self.dataChanged.emit(self.index(min(rows)), self.index(max(rows)))
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.servers)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid() or index.row() >= len(self.servers):
+            return None
+        if role == self.IdRole:
+            return self.servers.store.ids[self.servers.rows[index.row()]]
+        if role == self.InfoRole:
+            return self.servers[index.row()]
+        if role in (QtCore.Qt.DisplayRole, QtCore.Qt.ToolTipRole, QtCore.Qt.AccessibleTextRole):
+            return server_label(self.servers[index.row()])
+        return None
+
+    def index_of(self, server_id):
+        """
+        :return: QModelIndex of the server with server_id, invalid if it is not in the current filter
+        """
+        row = self.servers.index_of(server_id)
+        return QtCore.QModelIndex() if row is None else self.index(row)
+
+
+class ServerDelegate(QtWidgets.QStyledItemDelegate):
+    """
+    Paints a server as its name and load over a line with domain, city and categories
+    Every row has the same height so the view only lays out and paints the visible rows
+    """
+    margin = 4
+
+    def paint(self, painter, option, index):
+        server = index.data(ServerListModel.InfoRole)
+        option = QtWidgets.QStyleOptionViewItem(option)
+        self.initStyleOption(option, index)
+        option.text = ''
+        style = option.widget.style() if option.widget else QtWidgets.QApplication.style()
+        style.drawControl(QtWidgets.QStyle.CE_ItemViewItem, option, painter, option.widget)
+        if server is None:
+            return
+
+        painter.save()
+        if option.state & QtWidgets.QStyle.State_Selected:
+            painter.setPen(option.palette.color(QtGui.QPalette.HighlightedText))
+        rect = option.rect.adjusted(self.margin, self.margin, -self.margin, -self.margin)
+        line_height = option.fontMetrics.height()
+        top = QtCore.QRect(rect.left(), rect.top(), rect.width(), line_height)
+        bottom = top.translated(0, line_height)
+        bold = QtGui.QFont(option.font)
+        bold.setBold(True)
+        painter.setFont(bold)
+        painter.drawText(top, QtCore.Qt.AlignLeft | QtCore.Qt.AlignVCenter, server.name)
+        painter.setFont(option.font)
+        painter.drawText(top, QtCore.Qt.AlignRight | QtCore.Qt.AlignVCenter, 'Load: ' + str(server.load) + '%')
+        details = '   '.join(detail for detail in (server.domain, server.city, server.categories) if detail)
+        details = option.fontMetrics.elidedText(details, QtCore.Qt.ElideRight, bottom.width())
+        painter.drawText(bottom, QtCore.Qt.AlignLeft | QtCore.Qt.AlignVCenter, details)
+        painter.restore()
+
+    def sizeHint(self, option, index):
+        return QtCore.QSize(option.rect.width(), option.fontMetrics.height() * 2 + self.margin * 2)
 
 
 class MainWindow(QtWidgets.QMainWindow):
     def __init__(self):
         """
         Initialize Global Variables and login GUI
-        Declare directories and paths
+        Settings, catalog, configs and NetworkManager are handled by the NordCore
         """
         super(MainWindow, self).__init__()
         self.setObjectName("MainWindowObject")
         self.setWindowIcon(QtGui.QIcon('nordvpnicon.png'))
-        self.base_dir = os.path.join(os.path.abspath(os.path.expanduser('~')), '.nordnmconfigs')  # /home/username/.nordnmconfigs
-        self.config_path = os.path.join(os.path.abspath(self.base_dir), '.configs')
-        self.scripts_path = os.path.join(os.path.abspath(self.base_dir), '.scripts')
-        self.network_manager_path = '/etc/NetworkManager/dispatcher.d/'
-        self.conf_path = os.path.join(self.config_path, 'nord_settings.conf')
-        self.config = configparser.ConfigParser()
-        self.api_data = self.get_api_data()
+        self.core = NordCore()  # /home/username/.nordnmconfigs
+        self.server_index = build_index([])
+        self.search_index = SearchIndex()
+        self.streamed_countries = []
+        self.catalog_refresh = None  # Worker of the running catalog download
+        self.watched = None  # (name, domain) of the active connection whose server is probed
+        self.failed_servers = set()  # names of the servers failed over from since the last connect
+        self.health_check = None  # Workers of the running probe, standby import and failover
+        self.standby_import = None
+        self.failover_worker = None
+        self.connect_worker = None  # Workers of the running connect and disconnect
+        self.disconnect_worker = None
+        self.kill_switch_worker = None  # Workers of the running kill switch and auto-connect toggles
+        self.auto_connect_worker = None
+        self.authorization = None  # (text, on_authorized, on_denied) while the helper is being started
+        self.connect_stage = None  # stage the running connect or disconnect reported last
         self.username = None
         self.password = None
-        self.sudo_password = None
-        self.connection_name = None
         self.connected_server = None
-        self.domain_list = []
-        self.server_info_list = []
+        self.server_info_list = ServerView()
+        self.workers = set()
+        # Qt converts images on the global pool while the GUI thread holds the GIL, python workers there would deadlock it
+        self.pool = QtCore.QThreadPool(self)
+        self.pool.setMaxThreadCount(max(4, self.pool.maxThreadCount()))  # workers mostly wait for the network or nmcli
+        self.country_list = None
+        self.monitor = None
         self.login_ui()
-
+        self.show()
+        QtCore.QTimer.singleShot(500, self.start_services)  # in case the window is never exposed, e.g. on another desktop
+
+    def paintEvent(self, event):
+        """
+        Starts the services once the login form was painted for the first time
+        """
+        super(MainWindow, self).paintEvent(event)
+        if self.monitor is None:
+            QtCore.QTimer.singleShot(0, self.start_services)
+
+    def start_services(self):
+        """
+        Starts what the login form does not need
+        Keyring, catalog, NetworkManager query and config archive check run on the thread pool, they would still delay
+        the first paint if they started earlier as their imports hold the GIL
+        """
+        if self.monitor is not None:
+            return
+        if self.username:
+            self.get_credentials()
+        self.get_api_data()
+        self.catalog_timer = QtCore.QTimer(self)  # keeps the loads in the server_list current
+        self.catalog_timer.timeout.connect(self.refresh_api_data)
+        self.catalog_timer.start(catalog_refresh_interval * 1000)
+        self.health_timer = QtCore.QTimer(self)  # probes the server of the watched connection
+        self.health_timer.setInterval(health_interval * 1000)
+        self.health_timer.timeout.connect(self.check_health)
+        self.run_in_background(self.core.http.open_session)  # ready for the login unless the catalog needed it first
+        self.tray_ui()
+        self.monitor = ConnectionMonitor(self.core.backend, self)
+        self.monitor.changed.connect(self.vpn_state_changed)
+        self.run_in_background(self.core.backend.active_connections, on_result=self.monitor.update)
+        self.run_in_background(self.core.collect_profiles)  # connections left behind by a crash
+        if self.core.configs.is_stale():
+            self.run_in_background(self.core.configs.refresh, on_error=self.configs_failed, timeout=600)
+
+    def tray_ui(self):
         """
         Initialize System Tray Icon
         """
@@ -55,29 +458,29 @@ class MainWindow(QtWidgets.QMainWindow):
         show_action = QAction("Show NordVPN Network Manager", self)
         quit_action = QAction("Exit", self)
         hide_action = QAction("Minimized", self)
+        diagnostics_action = QAction("Diagnostics", self)
         show_action.triggered.connect(self.show)
         hide_action.triggered.connect(self.hide)
+        diagnostics_action.triggered.connect(self.show_diagnostics)
         quit_action.triggered.connect(self.quitAppEvent)
         self.tray_icon.activated.connect(self.resume)
         tray_menu = QMenu()
         tray_menu.addAction(show_action)
         tray_menu.addAction(hide_action)
+        tray_menu.addAction(diagnostics_action)
         tray_menu.addAction(quit_action)
         self.tray_icon.setToolTip("NordVPN")
         self.tray_icon.setContextMenu(tray_menu)
         self.tray_icon.show()
 
-        """
-        Initialize GUI
-        """
-
-
-        self.show()
-
     def quitAppEvent(self):
         """
         Quit GUI from system tray
         """
+        self.monitor.stop()
+        self.stop_watching()
+        self.remove_standby()
+        self.core.helper.stop()
         qApp.quit()
 
     def closeEvent(self, event):
@@ -100,6 +503,34 @@ class MainWindow(QtWidgets.QMainWindow):
         if activation_reason == 3:
             self.show()
 
+    def show_diagnostics(self):
+        """
+        Shows the percentile summary of the recent connects, disconnects and HTTP requests
+        """
+        lines = ['{:<11}{:<21}{:>6}{:>9}{:>9}{:>9}{:>7}'.format('operation', 'stage', 'count', 'p50', 'p90', 'p99', 'fail')]
+        for operation, stage, count, p50, p90, p99, failures in self.core.timing_log.summary():
+            lines.append('{:<11}{:<21}{:>6}{:>8.3f}s{:>8.3f}s{:>8.3f}s{:>7}'.format(operation, stage, count, p50, p90, p99, failures))
+        if len(lines) == 1:
+            lines.append('No connects recorded yet')
+        seconds = [timing.seconds for timing in self.core.http.timings]
+        if seconds:
+            lines.append('')
+            lines.append('{:<32}{:>6}{:>8.3f}s{:>8.3f}s{:>8.3f}s'.format(
+                'http requests', len(seconds), percentile(seconds, 50), percentile(seconds, 90), percentile(seconds, 99)))
+        lines.append('')
+        lines.append('Log: ' + self.core.timing_log.path)
+
+        dialog = QtWidgets.QDialog(self)
+        dialog.setWindowTitle("Diagnostics")
+        dialog.resize(620, 400)
+        text = QtWidgets.QPlainTextEdit(dialog)
+        text.setReadOnly(True)
+        text.setFont(QtGui.QFontDatabase.systemFont(QtGui.QFontDatabase.FixedFont))
+        text.setPlainText('\n'.join(lines))
+        layout = QtWidgets.QVBoxLayout(dialog)
+        layout.addWidget(text)
+        dialog.show()
+
     def main_ui(self):
         """
         QT form for the main GUI interface
@@ -165,6 +596,12 @@ class MainWindow(QtWidgets.QMainWindow):
         self.mac_changer_box = QtWidgets.QCheckBox(self.centralwidget)
         self.mac_changer_box.setObjectName("mac_changer_box")
         self.verticalLayout.addWidget(self.mac_changer_box)
+        self.fastest_box = QtWidgets.QCheckBox(self.centralwidget)
+        self.fastest_box.setObjectName("fastest_box")
+        self.verticalLayout.addWidget(self.fastest_box)
+        self.race_box = QtWidgets.QCheckBox(self.centralwidget)
+        self.race_box.setObjectName("race_box")
+        self.verticalLayout.addWidget(self.race_box)
         self.killswitch_btn = QtWidgets.QCheckBox(self.centralwidget)
         self.killswitch_btn.setObjectName("killswitch_btn")
         self.verticalLayout.addWidget(self.killswitch_btn)
@@ -227,8 +664,17 @@ class MainWindow(QtWidgets.QMainWindow):
         self.line_2.setFrameShadow(QtWidgets.QFrame.Sunken)
         self.line_2.setObjectName("line_2")
         self.verticalLayout_4.addWidget(self.line_2)
-        self.server_list = QtWidgets.QListWidget(self.centralwidget)
+        self.search_input = QtWidgets.QLineEdit(self.centralwidget)
+        self.search_input.setClearButtonEnabled(True)
+        self.search_input.setObjectName("search_input")
+        self.verticalLayout_4.addWidget(self.search_input)
+        self.server_list = QtWidgets.QListView(self.centralwidget)
         self.server_list.setObjectName("server_list")
+        self.server_model = ServerListModel(self.server_list)
+        self.server_list.setModel(self.server_model)
+        self.server_list.setItemDelegate(ServerDelegate(self.server_list))
+        self.server_list.setUniformItemSizes(True)
+        self.server_list.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
         self.verticalLayout_4.addWidget(self.server_list)
         self.gridLayout.addLayout(self.verticalLayout_4, 1, 1, 1, 1)
         self.title_label.raise_()
@@ -236,6 +682,8 @@ class MainWindow(QtWidgets.QMainWindow):
         self.country_list.raise_()
         self.auto_connect_box.raise_()
         self.mac_changer_box.raise_()
+        self.fastest_box.raise_()
+        self.race_box.raise_()
         self.server_type_select.raise_()
         self.connection_type_select.raise_()
         self.country_list_label.raise_()
@@ -249,12 +697,14 @@ class MainWindow(QtWidgets.QMainWindow):
         self.setStatusBar(self.statusbar)
 
         # Begin of UI logic
-        server_country_list = self.get_country_list(self.api_data)
+        server_country_list = self.get_country_list()
         self.connection_type_select.addItems(connection_type_options)
         self.server_type_select.addItems(server_type_options)
         self.country_list.addItems(server_country_list)
-        self.country_list.itemClicked.connect(self.get_server_list)
+        self.country_list.itemClicked.connect(self.country_selected)
+        self.search_input.textChanged.connect(self.get_server_list)
         self.server_type_select.currentTextChanged.connect(self.get_server_list)
+        self.connection_type_select.currentTextChanged.connect(self.prefetch_configs)
 
         # Button functionality here
         self.connect_btn.clicked.connect(self.connect)
@@ -264,7 +714,8 @@ class MainWindow(QtWidgets.QMainWindow):
 
         self.parse_conf()
         self.repaint()
-        self.get_active_vpn()
+        if self.get_active_vpn():
+            self.watch_connection()
         self.center_on_screen()
         self.retranslateUi()
         QtCore.QMetaObject.connectSlotsByName(self)
@@ -370,395 +821,485 @@ class MainWindow(QtWidgets.QMainWindow):
     def check_configs(self):
         """
         Checks if config directories and files exist and creates them if they do not
-        If username is found in config execute get_credentials()
+        If username is found in config start_services() executes get_credentials()
         """
         try:
-            if not os.path.isdir(self.base_dir):
-                os.mkdir(self.base_dir)
-            if not os.path.isdir(self.config_path):
-                os.mkdir(self.config_path)
-            if not os.path.isdir(self.scripts_path):
-                os.mkdir(self.scripts_path)
-            if not os.path.isfile(self.conf_path):
-                self.config['USER'] = {
-                    'USER_NAME': 'None'}
-                self.config['SETTINGS'] = {
-                    'MAC_RANDOMIZER': 'False',
-                    'KILL_SWITCH': 'False',
-                    'AUTO_CONNECT': 'False'}
-                self.write_conf()
-
-            self.config.read(self.conf_path)
-            if (self.config.has_option('USER', 'USER_NAME') and
-                    self.config.get('USER', 'USER_NAME') != 'None'):
-                self.statusbar.showMessage("Fetching Saved Credentials", 1000)
-                self.username = self.config.get('USER', 'USER_NAME')
-                self.remember_checkBox.setChecked(True)
-                self.user_input.setText(self.username)
-                self.get_credentials()
-
+            self.core.setup()
         except PermissionError:
             self.statusbar.showMessage("Insufficient Permissions to create config folder", 2000)
+            return
+        username = self.core.saved_username()
+        if username:
+            self.statusbar.showMessage("Fetching Saved Credentials", 1000)
+            self.username = username
+            self.remember_checkBox.setChecked(True)
+            self.user_input.setText(self.username)
 
     def get_credentials(self):
-        try:
-            keyring.get_keyring()
-            password = keyring.get_password('NordVPN', self.username)
-            self.password_input.setText(password)
-        except Exception as ex:
-            self.statusbar.showMessage("Error fetching keyring", 1000)
-
-    def write_conf(self):
         """
-        Writes config file
+        Fetches the saved password in the background, loading a keyring backend can take longer than the whole window
         """
-        with open(self.conf_path, 'w') as configfile:
-            self.config.write(configfile)
+        self.run_in_background(self.core.saved_password, self.username, on_result=self.credentials_fetched,
+                               on_error=self.credentials_failed, timeout=30)
+
+    def credentials_fetched(self, password):
+        if password and not self.password_input.text() and self.user_input.text() == self.username:
+            self.password_input.setText(password)
 
-        configfile.close()
+    def credentials_failed(self, error):
+        self.statusbar.showMessage("Error fetching keyring", 1000)
 
     def parse_conf(self):
         """
         Parses config and manipulates UI to match
         """
-        self.config.read(self.conf_path)
-        if self.config.getboolean('SETTINGS', 'mac_randomizer'):
+        self.core.config.read(self.core.conf_path)
+        if self.core.setting('mac_randomizer'):
             self.mac_changer_box.setChecked(True)
-        if self.config.getboolean('SETTINGS', 'kill_switch'):
+        if self.core.setting('fastest'):
+            self.fastest_box.setChecked(True)
+        if self.core.setting('race'):
+            self.race_box.setChecked(True)
+        if self.core.setting('kill_switch'):
             self.killswitch_btn.setChecked(True)
-        if self.config.getboolean('SETTINGS', 'auto_connect'):
+        if self.core.setting('auto_connect'):
             self.auto_connect_box.setChecked(True)
 
+    def run_in_background(self, fn, *args, on_result=None, on_error=None, on_progress=None, timeout=None, **kwargs):
+        """
+        Runs fn(*args, **kwargs) on the thread pool and delivers its outcome to the given slots
+
+        :param on_progress: slot for intermediate results, fn is passed the keyword report to publish them
+        :param timeout: seconds after which the worker is abandoned and on_error receives "Timed out"
+        :return: the Worker
+        """
+        worker = Worker(fn, *args, **kwargs)
+        if on_progress:
+            worker.kwargs['report'] = worker.report
+            worker.signals.progress.connect(on_progress)
+        if on_result:
+            worker.signals.result.connect(on_result)
+        if on_error:
+            worker.signals.error.connect(on_error)
+        worker.signals.returned.connect(lambda: self.workers.discard(worker))
+        self.workers.add(worker)  # keep the signals alive until the function returns
+        if timeout:
+            QtCore.QTimer.singleShot(int(timeout * 1000), worker.expire)
+        self.pool.start(worker)
+        return worker
+
     def verify_credentials(self):
         """
         Requests a token from NordApi by sending the email and password in json format
-        Verifies responses and updates GUI
+        The request runs in the background and login_response() updates the GUI
         """
         if self.user_input.text() and self.password_input.text():
             self.username = self.user_input.text()
             self.password = self.password_input.text()
-
         else:
             self.statusbar.showMessage('Username or password field cannot be empty', 2000)
-        try:
+            return
+
+        self.login_btn.setEnabled(False)
+        self.statusbar.showMessage('Logging in...')
+        self.run_in_background(request_token, self.core.http, self.username, self.password,
+                               on_result=self.login_response, on_error=self.login_failed, timeout=10)
+
+    def login_response(self, status_code):
+        """
+        Handles the token response from NordApi
+        Saves or deletes credentials and switches to the main GUI on success
+
+        :param status_code: HTTP status returned by the token endpoint
+        """
+        self.login_btn.setEnabled(True)
+        if status_code == 201:
+            # check whether credentials should be saved
+            if self.remember_checkBox.isChecked():
+                try:
+                    self.core.remember(self.username, self.password)
+                except Exception as ex:
+                    self.statusbar.showMessage("Error accessing keyring", 1000)
 
-            # post username and password to api endpoint
-            json_data = {'username': self.username, 'password': self.password}
-            resp = requests.post('https://api.nordvpn.com/v1/users/tokens', json=json_data, timeout=5)
-            if resp.status_code == 201:
-                # check whether credentials should be saved
-                if self.remember_checkBox.isChecked():
-                    try:
-                        keyring.set_password("NordVPN", self.username, self.password)
-                        self.config['USER']['USER_NAME'] = self.username
-                        self.write_conf()
-                    except Exception as ex:
-                        self.statusbar.showMessage("Error accessing keyring", 1000)
-                        time.sleep(1)
-
-                # Delete credentials if found
-                else:
-                    try:
-                        keyring.delete_password("NordVPN", self.username)
-                        self.config['USER']['USER_NAME'] = 'None'
-                        self.write_conf()
-                    except Exception as ex:
-                        self.statusbar.showMessage("No saved credentials to delete", 1000)
-                        time.sleep(0.5)
-
-                self.statusbar.showMessage('Login Success', 2000)
-                self.repaint()
-                time.sleep(0.5)
-                self.hide()
-                self.main_ui()
+            # Delete credentials if found
             else:
-                self.statusbar.showMessage('Invalid Username or Password', 2000)
+                try:
+                    self.core.forget(self.username)
+                except Exception as ex:
+                    self.statusbar.showMessage("No saved credentials to delete", 1000)
 
-        except Exception as ex:
-            self.statusbar.showMessage("API Error: could not fetch token", 2000)
-            self.get_api_data()
+            self.statusbar.showMessage('Login Success', 2000)
+            self.hide()
+            self.main_ui()
+        else:
+            self.statusbar.showMessage('Invalid Username or Password', 2000)
+
+    def login_failed(self, error):
+        """
+        Called when the token request raised or timed out
+        """
+        self.login_btn.setEnabled(True)
+        self.statusbar.showMessage("API Error: could not fetch token", 2000)
+        if not len(self.server_index.store):
+            self.refresh_api_data()
 
     def get_api_data(self):
         """
-        Gets json file containing server information
+        Loads the cached catalog in the background, the login form does not need it
+        A missing or stale catalog is revalidated alongside, ahead of the config archives on the thread pool
+        """
+        self.run_in_background(self.core.catalog.load, on_result=self.cached_api_data, on_error=self.api_data_failed)
+        if self.core.catalog.is_stale():
+            self.refresh_api_data()
 
-        :return: server information in json format
+    def cached_api_data(self, server_index):
         """
-        try:
-            resp = requests.get(api, timeout=5)
-            if resp.status_code == requests.codes.ok:
-                return resp.json()
-            else:
-                self.statusbar.showMessage("Get API failed", 2000)
-        except Exception as ex:
-            self.statusbar.showMessage("Get API failed", 2000)
+        Shows the cached catalog unless a download finished first
+
+        :param server_index: ServerIndex or None if no catalog is cached
+        """
+        if server_index is not None and not len(self.server_index.store):
+            self.api_data_refreshed(server_index)
+
+    def refresh_api_data(self):
+        """
+        Revalidates the cached catalog against the API in the background
+        Countries are streamed to country_streamed() while the first catalog downloads, later downloads are applied
+        to the loaded one as changes
+        """
+        if self.catalog_refresh is not None and self.catalog_refresh.pending():
+            return
+        self.streamed_countries = []
+        self.catalog_refresh = self.run_in_background(
+            self.core.catalog.refresh, server_index=self.server_index, on_result=self.api_data_refreshed,
+            on_error=self.api_data_failed, on_progress=self.country_streamed, timeout=30)
+
+    def country_streamed(self, country):
+        """
+        Adds a country to the country_list as soon as the download reaches it
+        Only used while no catalog is loaded, otherwise the list is replaced once the download completes
+        """
+        if len(self.server_index.store):
+            return
+        bisect.insort(self.streamed_countries, country)
+        if self.country_list is not None:
+            self.country_list.insertItem(self.streamed_countries.index(country), country)
+
+    def api_data_refreshed(self, server_index):
+        """
+        Replaces the server index once a changed catalog was downloaded
+
+        :param server_index: ServerIndex or None if the cached copy is still current
+        """
+        if server_index is None:
+            return
+        self.set_server_index(server_index)
+        if self.country_list is None:
+            return
+        countries = self.get_country_list()
+        if countries != [self.country_list.item(row).text() for row in range(self.country_list.count())]:
+            current = self.country_list.currentItem()
+            current = current.text() if current else None
+            self.country_list.clear()
+            self.country_list.addItems(countries)
+            if current:
+                items = self.country_list.findItems(current, QtCore.Qt.MatchExactly)
+                if items:
+                    self.country_list.setCurrentItem(items[0])
+        if not self.search_input.text():  # search results follow once the search index caught up
+            self.refresh_server_list(server_index.changed)
+
+    def set_server_index(self, server_index):
+        """
+        Replaces the server store and index, the search index follows in the background
+        Only the servers that changed are reindexed if the search index is over the store server_index was derived from
+        """
+        self.server_index = server_index
+        self.core.server_index = server_index  # ranks the auto-connect candidates without parsing the catalog again
+        changed = server_index.changed if self.search_index.store is server_index.base else None
+        self.run_in_background(self.search_index.updated, server_index.store, changed, on_result=self.search_index_ready)
+
+    def search_index_ready(self, search_index):
+        """
+        Replaces the search index unless the catalog changed again meanwhile
 
-    def get_country_list(self, api_data):
+        :param search_index: SearchIndex
         """
-        Parses json file for countries with servers available and displays them in the server_country_list box of the UI
+        if search_index.store is not self.server_index.store:
+            return
+        self.search_index = search_index
+        if self.country_list is not None and self.search_input.text():
+            self.refresh_server_list()
+
+    def api_data_failed(self, error):
+        self.statusbar.showMessage("Get API failed", 2000)
+
+    def get_country_list(self):
+        """
+        Lists the countries with servers available for the server_country_list box of the UI
 
-        :param api_data: server information in json format
         :return: list of countries sorted alphabetically
         """
-        server_country_list = []
-        for server in api_data:
-            country = server['country']
-            if country not in server_country_list:
-                server_country_list.append(country)
-        return sorted(server_country_list)
+        if not len(self.server_index.store):  # first download still running
+            return list(self.streamed_countries)
+        return self.server_index.countries
 
     def get_server_list(self):
         """
         Displays server information in the server_list based on the given filter
-        (server_type, connection_type, current_country)
-        TODO: Rework this into a class
-        """
-        filtered = self.country_list.currentItem().text(), self.server_type_select.currentText(), self.connection_type_select.currentText()
-        server_name_list = []
-        self.server_list.clear()
-        self.domain_list.clear()
-        self.server_info_list.clear()
-        for server in self.api_data:
-            name       = server['name']
-            load       = server['load']
-            domain     = server['domain']
-            country    = server['country']
-            categories = server['categories']
-
-            server_categories = ''
-            server_category_list = []
-            for category in categories:
-                if category['name'] == 'Standard VPN servers':
-                    server_categories += 'Standard '
-                    server_category_list.append('Standard')
-                elif category['name'] == 'P2P':
-                    server_categories += category['name'] + ' '
-                    server_category_list.append('P2P')
-                elif category['name'] == 'Anti-DDoS':
-                    server_categories += category['name'] + ' '
-                    server_category_list.append('Anti-DDoS')
-                elif category['name'] == 'Obfuscated Servers':
-                    server_categories += 'Obfuscated'
-                    server_category_list.append('Obfuscated Server')
-                elif category['name'] == 'Dedicated IP':
-                    server_categories += category['name'] + ' '
-                    server_category_list.append('Dedicated IP')
-                elif category['name'] == 'Double VPN':
-                    server_categories += category['name'] + ' '
-                    server_category_list.append('Double VPN')
-                elif category['name'] == 'Onion Over VPN':
-                    server_categories += category['name'] + ' '
-                    server_category_list.append('TOR over VPN')
-                else:
-                    server_categories += category['name'] + ' '
-            if (name not in server_name_list) and (country == filtered[0]) and (filtered[1] in server_category_list):
-                server_name_list.append(name + '\n' + 'Load: ' + str(load) + '%\n' + "Domain: " + domain + '\n' + "Categories: " + server_categories)
-                self.domain_list.append(domain)
-                server = ServerInfo(name=name, country=country, domain=domain, type=server_category_list, load=load, categories=server_categories)
-                self.server_info_list.append(server)
-
-        if server_name_list:
-            # sorts lists to be in the same order
-            server_name_list, self.domain_list, self.server_info_list = (list(x) for x in zip(*sorted(zip(server_name_list, self.domain_list, self.server_info_list), key=lambda x: x[2].load)))
-            self.server_list.addItems(server_name_list)
+        (server_type, connection_type, current_country) or the servers matching the text of the search_input
+        """
+        servers = self.filtered_servers()
+        if servers is None:
+            return
+        query = self.search_input.text()
+        selected = self.selected_server()
+        self.server_info_list = servers
+        self.server_model.set_servers(servers)
+
+        if servers:
+            if selected:  # keeps the server selected if it is part of the new filter
+                self.select_server(selected.id)
+            if not query:  # search results change with every keystroke
+                self.prefetch_configs()
         else:
-            self.server_list.addItem("No Servers Found")
+            self.statusbar.showMessage("No Servers Found", 2000)
         QtWidgets.QApplication.processEvents()
         self.retranslateUi()
 
-    def get_ovpn(self):
-        """
-        Gets ovpn file from nord servers and saves it to a temporary location
-        """
-        # https://downloads.nordcdn.com/configs/files/ovpn_udp/servers/sg173.nordvpn.com.udp.ovpn
-        self.ovpn_path = None
-        ovpn_url = None
-        udp_url = 'https://downloads.nordcdn.com/configs/files/ovpn_udp/servers/'
-        tcp_url = 'https://downloads.nordcdn.com/configs/files/ovpn_tcp/servers/'
-        udp_xor_url = 'https://downloads.nordcdn.com/configs/files/ovpn_xor_udp/servers/'
-        tcp_xor_url = 'https://downloads.nordcdn.com/configs/files/ovpn_xor_tcp/servers/'
-
-        if (self.server_type_select.currentText() == 'Obfuscated Server') and (self.connection_type_select.currentText() == 'UDP'):
-            ovpn_url = udp_xor_url
-        elif (self.server_type_select.currentText() == 'Obfuscated Server') and (self.connection_type_select.currentText() == 'TCP'):
-            ovpn_url = tcp_xor_url
-        elif (self.server_type_select.currentText() != 'Obfuscated Server') and (self.connection_type_select.currentText() == 'UDP'):
-            ovpn_url = udp_url
-        elif (self.server_type_select.currentText() != 'Obfuscated Server') and (self.connection_type_select.currentText() == 'TCP'):
-            ovpn_url = tcp_url
-
-        if self.connection_type_select.currentText() == 'UDP':
-            filename = self.domain_list[self.server_list.currentRow()] + '.udp.ovpn'
-            ovpn_file = requests.get(ovpn_url + filename, stream=True)
-            if ovpn_file.status_code == requests.codes.ok:
-                self.ovpn_path = os.path.join(self.config_path, filename)
-                with open(self.ovpn_path, 'wb') as out_file:
-                    shutil.copyfileobj(ovpn_file.raw, out_file)
-            else: self.statusbar.showMessage('Error fetching configuration files', 2000)
-
-        elif self.connection_type_select.currentText() == 'TCP':
-            filename = self.domain_list[self.server_list.currentRow()] + '.tcp.ovpn'
-            ovpn_file = requests.get(ovpn_url + filename, stream=True)
-            if ovpn_file.status_code == requests.codes.ok:
-                self.ovpn_path = os.path.join(self.config_path, filename)
-                with open(self.ovpn_path, 'wb') as out_file:
-                    shutil.copyfileobj(ovpn_file.raw, out_file)
-            else: self.statusbar.showMessage('Error fetching configuration files', 2000)
+    def filtered_servers(self):
+        """
+        :return: ServerView of the search results or of the servers of the selected country, None without either
+        """
+        query = self.search_input.text()
+        country = self.country_list.currentItem()
+        if query:
+            return self.search_index.search(query, self.server_type_select.currentText())
+        if country is not None:
+            return self.server_index.lookup(country.text(), self.server_type_select.currentText())
+        return None
 
-        self.server_list.setFocus()
+    def refresh_server_list(self, changed=None):
+        """
+        Brings the server_list up to date with a refreshed catalog, keeping its selection and scroll position
 
-    def import_ovpn(self):
+        :param changed: ids of the servers that changed, None if any may have
         """
-        Renames and imports the ovpn to the Network Manager
-        Cleans up the temporary files
+        servers = self.filtered_servers()
+        if servers is None:
+            return
+        self.server_info_list = servers
+        self.server_model.update_servers(servers, changed)
+
+    def country_selected(self):
         """
-        try:
-            self.statusbar.showMessage("Importing Connection...")
-            self.repaint()
-            self.connection_name = self.generate_connection_name()
-            ovpn_file = self.connection_name + '.ovpn'
-            path = os.path.join(self.config_path, ovpn_file) #changes name from default
-            shutil.copy(self.ovpn_path, path)
-            os.remove(self.ovpn_path)
-            output = subprocess.run(['nmcli', 'connection', 'import', 'type', 'openvpn', 'file', path])
-            output.check_returncode()
-            os.remove(path)
+        Leaves the search results for the servers of the clicked country
+        """
+        self.search_input.clear()
+        self.get_server_list()
 
-        except subprocess.CalledProcessError:
-            self.statusbar.showMessage("ERROR: Importing VPN configuration")
+    def selected_server(self):
+        """
+        :return: ServerInfo of the server selected in the server_list or None
+        """
+        index = self.server_list.currentIndex()
+        return index.data(ServerListModel.InfoRole) if index.isValid() else None
 
-    def add_secrets(self):
+    def select_server(self, server_id):
         """
-        Adds the username and Password to the configuration
+        Selects and scrolls to the server with server_id in the server_list
+
+        :return: True if the server is part of the current filter
         """
-        try:
-            self.statusbar.showMessage("Adding Secrets...", 1000)
-            self.repaint()
-            password_flag = subprocess.run(['nmcli', 'connection', 'modify', self.connection_name, '+vpn.data', 'password-flags=0'])
-            password_flag.check_returncode()
-            secrets = subprocess.run(['nmcli', 'connection', 'modify', self.connection_name, '+vpn.secrets', 'password='+self.password])
-            secrets.check_returncode()
-            user_secret = subprocess.run(['nmcli', 'connection', 'modify', self.connection_name, '+vpn.data', 'username='+self.username])
-            user_secret.check_returncode()
-            disable_ipv6 = subprocess.run(['nmcli', 'connection', 'modify', self.connection_name, '+ipv6.method', 'ignore'])
-            disable_ipv6.check_returncode()
-            password_flag = subprocess.run(['nmcli', 'connection', 'modify', self.connection_name, '+vpn.data', 'password-flags=0'])
-            password_flag.check_returncode()
-        except subprocess.CalledProcessError:
-            self.statusbar.showMessage("ERROR: Secrets could not be added", 2000)
-
-    def generate_connection_name(self):
-        """
-        Generates the name of the ovpn file
-        """
-        server = self.server_info_list[self.server_list.currentRow()]
-        category_name = ''
-        for i, category in enumerate(server.type):
-            if i > 0:
-                category_name += ' | ' + category
-            else:
-                category_name = category
+        index = self.server_model.index_of(server_id)
+        if not index.isValid():
+            return False
+        self.server_list.setCurrentIndex(index)
+        self.server_list.scrollTo(index)
+        return True
+
+    def selected_protocol(self):
+        """
+        :return: config store protocol of the current server type and connection type
+        """
+        return config_protocol(self.server_type_select.currentText(), self.connection_type_select.currentText())
+
+    def prefetch_configs(self):
+        """
+        Downloads the configs of the lowest load servers of the current filter in the background
+        so that connecting to them skips the download
+        """
+        domains = [server.domain for server in self.server_info_list[:self.core.prefetcher.count]]
+        generation = self.core.prefetcher.start()
+        self.run_in_background(self.core.prefetcher.prefetch, generation, domains, self.selected_protocol(), timeout=60)
 
-        connection_name = server.name + ' [' + category_name + '] [' + self.connection_type_select.currentText() + ']'
-        return connection_name
+    def configs_failed(self, error):
+        self.statusbar.showMessage('Configuration archive update failed, configs are downloaded on connect', 2000)
 
     def get_active_vpn(self):
         """
-        Queries the Network Manager for the current connection.
+        Looks up the current Nord connection in the connection monitor, no query is sent to the Network Manager
         If a current Nord connection it will set the UI to the appropriate state
+
+        :return: True if a Nord connection is active
+        """
+        connections = self.monitor.nord_connections()
+        if self.core.connection_name in connections:  # both are up while a failover removes the failed connection
+            connections = [self.core.connection_name]
+        for name in connections:
+            connection = parse_connection_name(name)
+            self.core.connection_name = name
+            self.connected_server = connection.server
+            selected = self.selected_server()
+            if selected is None or selected.name != connection.server:  # existing Nordvpn connection found
+                self.statusbar.showMessage("Fetching Active Server...", 2000)
+                self.show_server(connection)
+            self.connect_btn.hide()
+            self.disconnect_btn.show()
+            return True
+
+        if self.monitor.vpn_connections():
+            self.statusbar.showMessage("Warning! Unknown VPN connection found", 2000)
+        return False
+
+    def show_server(self, connection):
         """
+        Selects the country, server type, protocol and server of a connection in the UI
+
+        :param connection: ConnectionName
+        """
+        store = self.server_index.store
         try:
-            output = subprocess.run(['nmcli', '--mode', 'tabular', '--terse', '--fields', 'TYPE,NAME', 'connection', 'show', '--active'],
-                                   stdout=subprocess.PIPE)
-            output.check_returncode()
-            lines = output.stdout.decode('utf-8').split('\n')
-
-            for line in lines:
-                if line:
-                    elements = line.strip().split(':')
-
-                    if elements[0] == 'vpn':
-                        connection_info = elements[1].split()
-                        connection_name = elements[1]
-                        country = connection_info[0]
-                        print(connection_info)
-                        if ('[Standard' in connection_info or
-                                '[Standard]' in connection_info):  # Normal servers
-                            server_name = connection_info[0] + ' ' + connection_info[1]
-                        elif '[Double' in connection_info:  # Double VPN server
-                            server_name = connection_info[0] + ' ' + '- ' + connection_info[2] + ' ' + connection_info[3]
-                        elif '[TOR' in connection_info:  # Onion Over VPN
-                            server_name = connection_info[0] + ' ' + connection_info[1] + ' ' + connection_info[2]
-                        elif '[Dedicated' in connection_info:  # Dedicated IP
-                            server_name = connection_info[0] + ' ' + connection_info[1]
-                        if self.server_info_list:  # vpn connected successfully
-                            for server in self.server_info_list:
-                                if server_name == server.name:
-                                    self.connected_server = server.name
-                                    return True
-                        elif not self.server_info_list:  # existing Nordvpn connection found
-                            self.connect_btn.hide()
-                            self.disconnect_btn.show()
-                            self.statusbar.showMessage("Fetching Active Server...", 2000)
-                            self.repaint()
-                            item = self.country_list.findItems(country, QtCore.Qt.MatchExactly)
-                            self.country_list.setCurrentItem(item[0])
-                            if ('[Standard' in connection_info or
-                                    '[Standard]' in connection_info):
-                                self.server_type_select.setCurrentIndex(1)
-                            if "[Double" in connection_info:
-                                self.server_type_select.setCurrentIndex(2)
-                            if "[TOR" in connection_info:
-                                self.server_type_select.setCurrentIndex(3)
-                            if "[Dedicated" in connection_info:
-                                self.server_type_select.setCurrentIndex(4)
-                            if "[TCP]" in connection_info:
-                                self.connection_type_select.setCurrentIndex(1)
-                            self.get_server_list()
-                            for server in self.server_info_list:
-                                if server_name == server.name:
-                                    server_list_item = self.server_list.findItems(server_name + '\n' + 'Load: ' + str(server.load) + '%\n' + "Domain: " + server.domain + '\n' + "Categories: " + server.categories, QtCore.Qt.MatchExactly)
-                                    self.server_list.setCurrentItem(server_list_item[0])
-                                    self.server_list.setFocus()
-                                    self.connection_name = connection_name
-                                    self.connected_server = server.name
-                                    return False
-                        else:
-                            self.statusbar.showMessage("Warning! Unknown VPN connection found", 2000)
-                            self.repaint()
-                            return False
-
-        except subprocess.CalledProcessError:
-            self.statusbar.showMessage("ERROR: Network Manager query error", 2000)
-            self.repaint()
-
-    def randomize_mac(self):
-        """
-        Takes down network interface and brings it back with a new MAC Address
+            row = store.names.index(connection.server)
+        except ValueError:  # server no longer in the catalog
+            return
+        if not self.select_server(store.ids[row]):  # not part of the current filter
+            self.search_input.clear()
+            item = self.country_list.findItems(store.countries[store.country_ids[row]], QtCore.Qt.MatchExactly)
+            if item:
+                self.country_list.setCurrentItem(item[0])
+            self.server_type_select.setCurrentText(connection.type[0])
+            self.connection_type_select.setCurrentText(connection.protocol)
+            self.get_server_list()
+            self.select_server(store.ids[row])
+        self.server_list.setFocus()
+
+    def vpn_state_changed(self, connections):
         """
+        Updates the UI and tray icon when the connection monitor reports a change
+
+        :param connections: names of the active Nord connections
+        """
+        if connections:
+            self.tray_icon.setToolTip("NordVPN: " + parse_connection_name(connections[0]).server)
+        else:
+            self.tray_icon.setToolTip("NordVPN: Disconnected")
+        if any(worker is not None and worker.pending() for worker in (self.connect_worker, self.disconnect_worker)):
+            return  # connected() and disconnected() take over once the core is done
+        if self.watched is not None and self.watched[0] not in connections:  # went down without disconnect_vpn()
+            if self.core.connection_failed(self.monitor.deactivation_reason(self.watched[0])):
+                self.fail_over("Connection lost")
+            else:  # taken down on purpose, e.g. from nm-applet
+                self.stop_watching()
+                self.remove_standby()
+        if self.country_list is None:  # still on the login screen
+            return
+        if not self.get_active_vpn():
+            self.disconnect_btn.hide()
+            self.connect_btn.show()
+        else:
+            self.watch_connection()
+        self.retranslateUi()
+
+    def watch_connection(self):
+        """
+        Starts probing the server of the active connection and imports the next best server of the current filter as
+        its standby, unless the connection is already watched
+        """
+        name = self.core.connection_name
+        if self.watched is not None and self.watched[0] == name:
+            return
+        if self.failover_worker is not None and self.failover_worker.pending():  # failed_over() watches the new one
+            return
+        store = self.server_index.store
+        server = parse_connection_name(name).server
+        domain = store.domains[store.names.index(server)] if server in store.names else None
+        self.watched = (name, domain)
+        self.core.profiles.mark(name, False)  # in use again, e.g. brought up by auto-connect after a disconnect
+        self.core.health.reset()
+        if domain is not None:  # servers that left the catalog are only watched for going down
+            self.health_timer.start()
+        standby = next((candidate for candidate in self.server_info_list
+                        if candidate.name != server and candidate.name not in self.failed_servers), None)
+        if standby is not None and self.password is not None:
+            self.standby_import = self.run_in_background(
+                self.core.prepare_standby, standby, self.server_type_select.currentText(), parse_connection_name(name).protocol,
+                self.username, self.password, on_result=self.standby_ready, on_error=self.standby_failed, timeout=60)
+
+    def stop_watching(self):
+        self.health_timer.stop()
+        self.watched = None
+
+    def standby_ready(self, name):
+        """
+        Removes the standby again if the connection was disconnected while it was imported
+        """
+        if self.watched is None:
+            self.remove_standby()
+
+    def standby_failed(self, error):
+        self.statusbar.showMessage("ERROR: Importing standby server failed", 2000)
+
+    def remove_standby(self):
         try:
-            self.statusbar.showMessage("Randomizing MAC Address", 2000)
-            self.repaint()
-            output = subprocess.run(['nmcli', '--mode', 'tabular', '--terse', '--fields', 'TYPE,UUID', 'connection', 'show', '--active'], stdout=subprocess.PIPE)
-            output.check_returncode()
-            lines = output.stdout.decode('utf-8').split('\n')
-
-            for line in lines:
-                if line:
-                    elements = line.strip().split(':')
-                    uuid = elements[1]
-                    connection_type = elements[0]
-                    if type != 'vpn':
-                        subprocess.run(['nmcli', 'connection', 'down', uuid])
-                        subprocess.run(['nmcli', 'connection', 'modify', '--temporary', uuid, connection_type+'.cloned-mac-address', 'random'])
-                        subprocess.run(['nmcli', 'connection', 'up', uuid])
-
-            self.statusbar.showMessage("Random MAC Address assigned", 2000)
-            self.write_conf()
-            self.repaint()
-        except subprocess.CalledProcessError:
-            self.statusbar.showMessage("ERROR: Randomizer failed", 2000)
-            self.repaint()
+            self.core.remove_standby()
+        except (NetworkManagerError, HelperError):
+            self.statusbar.showMessage("ERROR: Failed to remove standby connection", 2000)
+
+    def check_health(self):
+        """
+        Probes the server of the watched connection in the background, called by the health_timer
+        """
+        if self.watched is None or self.health_check is not None and self.health_check.pending():
+            return
+        self.health_check = self.run_in_background(self.core.health.check, self.watched[1], on_result=self.health_checked)
+
+    def health_checked(self, failed):
+        """
+        :param failed: True once enough probes in a row failed
+        """
+        if failed and self.watched is not None:
+            self.fail_over("Server not responding")
+
+    def fail_over(self, reason):
+        """
+        Switches to the standby connection in the background
+        """
+        if self.failover_worker is not None and self.failover_worker.running():
+            return
+        self.stop_watching()
+        if self.core.standby_name is None or self.standby_import is not None and self.standby_import.pending():
+            self.statusbar.showMessage("ERROR: " + reason + ", no standby server ready")
+            return
+        self.failed_servers.add(parse_connection_name(self.core.connection_name).server)
+        self.statusbar.showMessage(reason + ", switching to " + parse_connection_name(self.core.standby_name).server + "...")
+        self.failover_worker = self.run_in_background(self.core.failover, on_result=self.failed_over,
+                                                      on_error=self.failover_failed, timeout=30)
+
+    def failed_over(self, name):
+        """
+        :param name: connection that is now active
+        """
+        self.statusbar.showMessage("Switched to " + parse_connection_name(name).server, 5000)
+        self.core.connection_name = name
+        if self.country_list is not None:
+            self.watch_connection()
+
+    def failover_failed(self, error):
+        if self.core.setting('kill_switch'):
+            self.statusbar.showMessage("ERROR: Switching to the standby server failed, kill switch engaged")
+        else:
+            self.statusbar.showMessage("ERROR: Switching to the standby server failed")
 
     def get_sudo(self):
         """
@@ -815,412 +1356,275 @@ class MainWindow(QtWidgets.QMainWindow):
         QtCore.QMetaObject.connectSlotsByName(sudo_dialog)
         return sudo_dialog
 
-    def close_sudo_dialog(self):  # added to clear sudo password when cancel is pressed
-        self.sudo_password = None
-        self.sudo_dialog.close()
+    def close_sudo_dialog(self):
+        self.sudo_dialog.reject()
 
     def check_sudo(self):
         """
-        Checks validity of sudo password
-
-        :return: True if valid False if invalid
-        """
-        self.sudo_password = self.sudo_dialog.sudo_password.text()
-        try:
-            p1 = subprocess.Popen(['echo', self.sudo_password], stdout=subprocess.PIPE, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
-            p2 = subprocess.Popen(['sudo', '-S', 'whoami'], stdin=p1.stdout, stdout=subprocess.PIPE, encoding='utf-8', stderr=subprocess.PIPE)
-            p1.stdout.close()
-            output = p2.communicate()[0].strip()
-            p2.stdout.close()
-
-            if "root" in output:
-                self.sudo_dialog.close()
-                print('True')
-                return True
-            else:
-                error = QtWidgets.QErrorMessage(self.sudo_dialog)
-                error.showMessage("Invalid Password")
-                return False
-        except Exception as ex:
-            print('failed', ex)
-            self.sudo_password = None
+        Starts the privileged helper with the sudo password in the background, the password itself is not kept
+        """
+        self.sudo_dialog.accept_box.setEnabled(False)
+        self.run_in_background(self.core.helper.start, self.sudo_dialog.sudo_password.text(), 15, timeout=20,
+                               on_result=self.sudo_checked, on_error=lambda _: self.sudo_checked(False))
+
+    def sudo_checked(self, started):
+        if not self.sudo_dialog.isVisible():  # cancelled meanwhile
+            return
+        if started:
+            self.sudo_dialog.accept()
+            return
+        self.sudo_dialog.accept_box.setEnabled(True)
+        error = QtWidgets.QErrorMessage(self.sudo_dialog)
+        error.showMessage("Invalid Password")
+
+    def authorize(self, text, on_authorized, on_denied=None):
+        """
+        Makes sure the privileged helper runs, starting it in the background through polkit or, failing that, the sudo
+        dialog. The controls needing it stay disabled until authentication is done
+
+        :param text: explanation shown in the sudo dialog
+        :param on_authorized: called once the helper runs
+        :param on_denied: called if authentication failed or was cancelled
+        """
+        if self.core.helper.running():
+            on_authorized()
+            return
+        if self.authorization is not None:  # already asking, e.g. from the tray menu
+            if on_denied:
+                on_denied()
+            return
+        self.authorization = (text, on_authorized, on_denied)
+        self.update_controls()
+        self.run_in_background(self.core.helper.start, timeout=130, on_result=self.helper_started,
+                               on_error=lambda _: self.helper_started(False))
+
+    def helper_started(self, started):
+        """
+        Falls back to the sudo dialog if polkit could not start the helper
+        """
+        if started:
+            self.authorized(True)
+            return
+        self.sudo_dialog = self.get_sudo()
+        self.sudo_dialog.text_label.setText(self.authorization[0])
+        self.sudo_dialog.accepted.connect(lambda: self.authorized(True))
+        self.sudo_dialog.rejected.connect(lambda: self.authorized(False))
+        self.sudo_dialog.open()
+
+    def authorized(self, started):
+        if self.authorization is None:
+            return
+        _, on_authorized, on_denied = self.authorization
+        self.authorization = None
+        self.update_controls()
+        if started:
+            on_authorized()
+        elif on_denied:
+            on_denied()
+
+    def update_controls(self):
+        """
+        Enables the connection controls whose last action returned, none of them while the helper is being authorized
+        """
+        idle = self.authorization is None
+        for control, worker in ((self.connect_btn, self.connect_worker), (self.disconnect_btn, self.disconnect_worker),
+                                (self.killswitch_btn, self.kill_switch_worker),
+                                (self.auto_connect_box, self.auto_connect_worker)):
+            control.setEnabled(idle and (worker is None or not worker.running()))
+
+    def run_control(self, fn, *args, **kwargs):
+        """
+        run_in_background() for the action of a connection control, which stays disabled until fn has returned, even
+        after a timeout, so a second click never runs alongside an abandoned connect
+
+        :return: the Worker
+        """
+        worker = self.run_in_background(fn, *args, **kwargs)
+        worker.signals.returned.connect(self.update_controls)
+        return worker
 
-    def get_interfaces(self):
+    def set_auto_connect(self):
         """
-        Gets current Network interfaces
-
-        :return: List of Network interfaces
+        Installs the auto_connect script for the selected server in the NetworkManager dispatcher directory
         """
-        try:
-            output = subprocess.run(['nmcli', '--mode', 'tabular', '--terse', '--fields', 'TYPE,DEVICE', 'device', 'status'], stdout=subprocess.PIPE)
-            output.check_returncode()
-
-            lines = output.stdout.decode('utf-8').split('\n')
-            interfaces = []
-
-            for line in lines:
-                if line:
-                    elements = line.strip().split(':')
+        self.auto_connect_worker = self.run_control(
+            self.core.install_auto_connect, self.core.connection_name, timeout=60,
+            on_result=lambda _: self.toggled(None),
+            on_error=lambda _: self.toggle_failed(self.auto_connect_box, 'auto_connect', 'set_auto_connect'))
+        self.update_controls()
 
-                    if (elements[0] == 'wifi') or (elements[0] == 'ethernet'):
-                        interfaces.append(elements[1])
-
-            return interfaces
-
-        except subprocess.CalledProcessError:
-            self.statusbar.showMessage("ERROR Fetching interfaces")
-
-    def set_auto_connect(self):
-        """
-        Generates auto_connect bash script and moves it to the NetworkManager
-        """
-        self.config.read(self.conf_path)
-        interfaces = self.get_interfaces()
-        if interfaces:
-            interface_string = '|'.join(interfaces)
-            script =(
-            '#!/bin/bash\n\n'
-            'if [[ "$1" =~ ' + interface_string + ' ]] && [[ "$2" =~ up|connectivity-change ]]; then\n'
-            '  nmcli con up id "' + self.generate_connection_name() + '"\n'
-            'fi\n'
-            )
-        try:
-            with open(os.path.join(self.scripts_path, 'auto_connect'), 'w') as auto_connect:
-                print(script, file=auto_connect)
-        except Exception as ex:
-            print(ex)
-            self.statusbar.showMessage("ERROR building script file")
-        try:
-            p1 = subprocess.Popen(['echo', self.sudo_password], stdout=subprocess.PIPE, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
-            p2 = subprocess.Popen(['sudo', '-S', 'mv', self.scripts_path + '/auto_connect', self.network_manager_path + 'auto_connect'], stdin=p1.stdout, stdout=subprocess.PIPE)
-            p1.stdout.close()
-            p2.stdout.close()
-            p3 = subprocess.Popen(['echo', self.sudo_password], stdout=subprocess.PIPE, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
-            p4 = subprocess.Popen(['sudo', '-S', 'chown', 'root:root', self.network_manager_path + 'auto_connect'], stdin=p3.stdout, stdout=subprocess.PIPE)
-            p3.stdout.close()
-            p4.stdout.close()
-            p5 = subprocess.Popen(['echo', self.sudo_password], stdout=subprocess.PIPE, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
-            p6 = subprocess.Popen(['sudo', '-S', 'chmod', '744', self.network_manager_path + 'auto_connect'], stdin=p5.stdout, stdout=subprocess.PIPE)
-            p5.stdout.close()
-            p6.stdout.close()
-            self.config['SETTINGS']['auto_connect'] = 'True'
-            self.write_conf()
-        except Exception as ex:
-            print(ex)
+    def remove_auto_connect(self):
+        self.auto_connect_worker = self.run_control(
+            self.core.remove_auto_connect, timeout=60,
+            on_result=lambda _: self.toggled(None),
+            on_error=lambda _: self.toggle_failed(self.auto_connect_box, 'auto_connect', 'disable_auto_connect'))
+        self.update_controls()
 
     def disable_auto_connect(self):
         """
         Handles the enabling and disabling of auto-connect depending on UI state
         Called everytime the auto-connect box is clicked
         """
-        self.config.read(self.conf_path)
+        self.core.config.read(self.core.conf_path)
+        if not self.auto_connect_box.isChecked() and self.core.setting('auto_connect'):
+            self.authorize("<html><head/><body><p>VPN Network Manager requires <span style=\" font-weight:600;\">sudo</span> permissions in order to remove the auto-connect script from the Network Manager directory. Please input the <span style=\" font-weight:600;\">sudo</span> Password or run the program with elevated priveledges.</p></body></html>",
+                           self.remove_auto_connect, lambda: self.auto_connect_box.setChecked(True))
 
-        if not self.auto_connect_box.isChecked() and not self.sudo_password and self.config.getboolean('SETTINGS', 'auto_connect'):
-            self.sudo_dialog = self.get_sudo()
-            self.sudo_dialog.text_label.setText("<html><head/><body><p>VPN Network Manager requires <span style=\" font-weight:600;\">sudo</span> permissions in order to remove the auto-connect script from the Network Manager directory. Please input the <span style=\" font-weight:600;\">sudo</span> Password or run the program with elevated priveledges.</p></body></html>")
-            self.sudo_dialog.exec_()
-            if not self.sudo_password:  # dialog was canceled
-                return False
-            try:
-                p1 = subprocess.Popen(['echo', self.sudo_password], stdout=subprocess.PIPE, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
-                p2 = subprocess.Popen(['sudo', '-S', 'rm', self.network_manager_path + 'auto_connect'], stdin=p1.stdout, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                p1.stdout.close()
-                p2.stdout.close()
-                self.config['SETTINGS']['auto_connect'] = 'False'
-                self.write_conf()
-            except Exception as ex:
-                print(ex)
-
-        elif not self.auto_connect_box.isChecked() and self.sudo_password and self.config.getboolean('SETTINGS', 'auto_connect'):
-
-            try:
-                p1 = subprocess.Popen(['echo', self.sudo_password], stdout=subprocess.PIPE, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
-                p2 = subprocess.Popen(['sudo', '-S', 'rm', self.network_manager_path + 'auto_connect'], stdin=p1.stdout, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                p1.stdout.close()
-                p2.stdout.close()
-                self.config['SETTINGS']['auto_connect'] = 'False'
-                self.write_conf()
-            except Exception as ex:
-                print(ex)
-
-        elif self.auto_connect_box.isChecked() and self.get_active_vpn() and self.sudo_password:
-            self.set_auto_connect()
-
-        elif self.auto_connect_box.isChecked() and self.get_active_vpn() and not self.sudo_password:
-            self.sudo_dialog = self.get_sudo()
-            self.sudo_dialog.exec_()
-            if self.sudo_password:
-                self.set_auto_connect()
-            else:
-                self.auto_connect_box.setChecked(False)
-                return False
+        elif self.auto_connect_box.isChecked() and self.get_active_vpn():
+            self.authorize("<html><head/><body><p>VPN Network Manager requires <span style=\" font-weight:600;\">sudo</span> permissions in order to move the auto-connect script to the Network Manager directory. Please input the <span style=\" font-weight:600;\">sudo</span> Password or run the program with elevated priveledges.</p></body></html>",
+                           self.set_auto_connect, lambda: self.auto_connect_box.setChecked(False))
 
     def set_kill_switch(self):
         """
-        Generates bash killswitch script and moves it to the NetworkManager
-        """
-        script = (
-            '#!/bin/bash\n'
-            'PERSISTENCE_FILE=' + os.path.join(self.scripts_path, '.killswitch_data') + '\n\n'
-            'case $2 in'
-            '  vpn-up)\n'
-            '    nmcli -f type,device connection | awk \'$1~/^vpn$/ && $2~/[^\-][^\-]/ { print $2; }\' > "${PERSISTENCE_FILE}"\n'
-            '  ;;\n'
-            '  vpn-down)\n'
-            '    xargs -n 1 -a "${PERSISTENCE_FILE}" nmcli device disconnect\n'
-            '  ;;\n'
-            'esac\n'
-        )
-
-        try:
-            with open(os.path.join(self.scripts_path, 'kill_switch'), 'w') as kill_switch:
-                print(script, file=kill_switch)
-
-            p1 = subprocess.Popen(['echo', self.sudo_password], stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.PIPE)
-            p2 = subprocess.Popen(['sudo', '-S', 'mv', self.scripts_path + '/kill_switch', self.network_manager_path + 'kill_switch'], stdin=p1.stdout, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            p1.stdout.close()
-            p2.stdout.close()
-            time.sleep(0.5)
-            p3 = subprocess.Popen(['echo', self.sudo_password], stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.PIPE)
-            p4 = subprocess.Popen(['sudo', '-S', 'chown', 'root:root', self.network_manager_path + 'kill_switch'], stdin=p3.stdout, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            time.sleep(0.5)
-            p3.stdout.close()
-            p4.stdout.close()
-            p5 = subprocess.Popen(['echo', self.sudo_password], stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.PIPE)
-            p6 = subprocess.Popen(['sudo', '-S', 'chmod', '744', self.network_manager_path + 'kill_switch'], stdin=p5.stdout, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            p5.stdout.close()
-            p6.stdout.close()
-            self.config['SETTINGS']['kill_switch'] = 'True'
-            self.write_conf()
-
-            self.statusbar.showMessage('Kill switch activated', 2000)
-            self.repaint()
-        except Exception as ex:
-            print(ex)
-
-    def disable_kill_switch(self):
+        Loads the kill switch ruleset letting only the tunnel and the VPN servers through, in the background as the
+        servers of a connection made elsewhere may have to be looked up or downloaded first
         """
-        Enables or disables Killswitch depending on UI state
-        Called everytime the Killswitch button is pressed
-        """
-        if not self.killswitch_btn.isChecked() and not self.sudo_password and self.config.getboolean('SETTINGS', 'kill_switch'):
-            self.sudo_dialog = self.get_sudo()
-            self.sudo_dialog.text_label.setText("<html><head/><body><p>VPN Network Manager requires <span style=\" font-weight:600;\">sudo</span> permissions in order to remove the kill switch script from the Network Manager directory. Please input the <span style=\" font-weight:600;\">sudo</span> Password or run the program with elevated priveledges.</p></body></html>")
-            self.sudo_dialog.exec_()
-
-            if not self.sudo_password:  # dialog was canceled
-                self.killswitch_btn.setChecked(False)
-                return False
-            try:
-                p1 = subprocess.Popen(['echo', self.sudo_password], stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.PIPE)
-                p2 = subprocess.Popen(['sudo', '-S', 'rm', self.network_manager_path + 'kill_switch'], stdin=p1.stdout, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                p1.stdout.close()
-                p2.stdout.close()
-                self.statusbar.showMessage('Kill switch disabled', 2000)
-                self.repaint()
-                self.config['SETTINGS']['kill_switch'] = 'False'
-                self.write_conf()
+        self.kill_switch_worker = self.run_control(
+            self.core.install_kill_switch, timeout=60,
+            on_result=lambda _: self.toggled('Kill switch activated'),
+            on_error=lambda _: self.toggle_failed(self.killswitch_btn, 'kill_switch', 'set_kill_switch'))
+        self.update_controls()
 
-            except subprocess.CalledProcessError:
-                self.statusbar.showMessage('ERROR disabling kill switch', 2000)
-                self.repaint()
+    def remove_kill_switch(self):
+        self.kill_switch_worker = self.run_control(
+            self.core.remove_kill_switch, timeout=60,
+            on_result=lambda _: self.toggled('Kill switch disabled'),
+            on_error=lambda _: self.toggle_failed(self.killswitch_btn, 'kill_switch', 'disable_kill_switch'))
+        self.update_controls()
 
-        elif not self.killswitch_btn.isChecked() and self.sudo_password and self.config.getboolean('SETTINGS', 'kill_switch'):
+    def toggled(self, message):
+        self.update_controls()
+        if message:
+            self.statusbar.showMessage(message, 2000)
 
-            try:
-                p1 = subprocess.Popen(['echo', self.sudo_password], stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.PIPE)
-                p2 = subprocess.Popen(['sudo', '-S', 'rm', self.network_manager_path + 'kill_switch'], stdin=p1.stdout, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                p1.stdout.close()
-                p2.stdout.close()
-                self.statusbar.showMessage('Kill switch disabled', 2000)
-                self.repaint()
-                self.config['SETTINGS']['kill_switch'] = 'False'
-                self.write_conf()
-
-            except subprocess.CalledProcessError:
-                self.statusbar.showMessage('ERROR disabling kill switch', 2000)
-                self.repaint()
-
-        elif self.killswitch_btn.isChecked() and self.get_active_vpn() and self.sudo_password:
-            self.set_kill_switch()
-
-        elif self.killswitch_btn.isChecked() and self.get_active_vpn() and not self.sudo_password:
-            self.sudo_dialog = self.get_sudo()
-            self.sudo_dialog.text_label.setText("<html><head/><body><p>VPN Network Manager requires <span style=\" font-weight:600;\">sudo</span> permissions in order to move the kill switch script to the Network Manager directory. Please input the <span style=\" font-weight:600;\">sudo</span> Password or run the program with elevated priveledges.</p></body></html>")
-            self.sudo_dialog.exec_()
-            if self.sudo_password:
-                self.set_kill_switch()
-            else:
-                self.killswitch_btn.setChecked(False)
-                return False
-
-    def disable_ipv6(self):
-        """
-        Disables IPV6 system wide
+    def toggle_failed(self, control, setting, stage):
         """
-        if self.sudo_password:
-            try:
-                p1 = subprocess.Popen(['echo', self.sudo_password], stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.PIPE)
-                p2 = subprocess.Popen(['sudo', '-S', 'sysctl', '-w', 'net.ipv6.conf.all.disable_ipv6=1', '&&', 'sysctl', '-w', 'net.ipv6.conf.default.disable_ipv6=1'], stdin=p1.stdout, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                p1.stdout.close()
-                p2.stdout.close()
-            except subprocess.CalledProcessError:
-                self.statusbar.showMessage("ERROR: disabling IPV6 failed", 2000)
-        else:
-            self.sudo_dialog = self.get_sudo()
-            self.sudo_dialog.text_label.setText("<html><head/><body><p>VPN Network Manager requires <span style=\" font-weight:600;\">sudo</span> permissions in order to disable IPV6. Please input the <span style=\" font-weight:600;\">sudo</span> Password or run the program with elevated priveledges.</p></body></html>")
-            self.sudo_dialog.exec_()
+        Shows the state the kill switch or auto-connect is left in
 
-            if self.sudo_password:
-                try:
-                    p1 = subprocess.Popen(['echo', self.sudo_password], stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.PIPE)
-                    p2 = subprocess.Popen(['sudo', '-S', 'sysctl', '-w', 'net.ipv6.conf.all.disable_ipv6=1', '&&', 'sysctl', '-w', 'net.ipv6.conf.default.disable_ipv6=0'], stdin=p1.stdout, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                    p1.stdout.close()
-                    p2.stdout.close()
-                except subprocess.CalledProcessError:
-                    self.statusbar.showMessage("ERROR: disabling IPV6 failed", 2000)
+        :param stage: stage of NordCore.connect() whose error message applies
+        """
+        self.update_controls()
+        control.setChecked(self.core.setting(setting))
+        self.statusbar.showMessage(stage_errors[stage], 2000)
 
-    def enable_ipv6(self):
+    def disable_kill_switch(self):
         """
-        Re-enables ipv6 system wide
+        Enables or disables Killswitch depending on UI state
+        Called everytime the Killswitch button is pressed
         """
-        if self.sudo_password:
-            try:
-                p1 = subprocess.Popen(['echo', self.sudo_password], stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.PIPE)
-                p2 = subprocess.Popen(['sudo', '-S', 'sysctl', '-w', 'net.ipv6.conf.all.disable_ipv6=0', '&&', 'sysctl', '-w', 'net.ipv6.conf.default.disable_ipv6=0'], stdin=p1.stdout, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                p1.stdout.close()
-                p2.stdout.close()
-            except subprocess.CalledProcessError:
-                self.statusbar.showMessage("ERROR: disabling IPV6 failed", 2000)
-        else:
-            self.sudo_dialog = self.get_sudo()
-            self.sudo_dialog.text_label.setText("<html><head/><body><p>VPN Network Manager requires <span style=\" font-weight:600;\">sudo</span> permissions in order to enable IPV6. Please input the <span style=\" font-weight:600;\">sudo</span> Password or run the program with elevated priveledges.</p></body></html>")
-            self.sudo_dialog.exec_()
+        if not self.killswitch_btn.isChecked() and self.core.setting('kill_switch'):
+            self.authorize("<html><head/><body><p>VPN Network Manager requires <span style=\" font-weight:600;\">sudo</span> permissions in order to remove the kill switch firewall rules. Please input the <span style=\" font-weight:600;\">sudo</span> Password or run the program with elevated priveledges.</p></body></html>",
+                           self.remove_kill_switch, lambda: self.killswitch_btn.setChecked(True))
 
-            if self.sudo_password:
-                try:
-                    p1 = subprocess.Popen(['echo', self.sudo_password], stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.PIPE)
-                    p2 = subprocess.Popen(['sudo', '-S', 'sysctl', '-w', 'net.ipv6.conf.all.disable_ipv6=0', '&&', 'sysctl', '-w', 'net.ipv6.conf.default.disable_ipv6=0'], stdin=p1.stdout, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                    p1.stdout.close()
-                    p2.stdout.close()
-                except subprocess.CalledProcessError:
-                    self.statusbar.showMessage("ERROR: Enabling IPV6 failed", 2000)
+        elif self.killswitch_btn.isChecked() and self.get_active_vpn():
+            self.authorize("<html><head/><body><p>VPN Network Manager requires <span style=\" font-weight:600;\">sudo</span> permissions in order to load the kill switch firewall rules. Please input the <span style=\" font-weight:600;\">sudo</span> Password or run the program with elevated priveledges.</p></body></html>",
+                           self.set_kill_switch, lambda: self.killswitch_btn.setChecked(False))
 
     def check_connection_validity(self):
         """
         Checks if connection is a double_vpn and forces the connection to TCP
         """
-        if self.server_type_select.currentText() == 'Double VPN':  # perhaps add pop up to give user the choice
-            self.connection_type_select.setCurrentIndex(1)  # set to TCP
+        server_type = self.server_type_select.currentText()
+        # perhaps add pop up to give user the choice
+        self.connection_type_select.setCurrentText(valid_connection_type(server_type, self.connection_type_select.currentText()))
 
-    def enable_connection(self):
-        """
-        Enable vpn connection in NetworkManager
+    def connect(self):
         """
-        try:
-            self.statusbar.showMessage("Connecting...", 1000)
-            self.repaint()
-            connection = subprocess.run(['nmcli', 'connection', 'up', self.connection_name])
-            connection.check_returncode()
-        except subprocess.CalledProcessError:
-            self.statusbar.showMessage("ERROR: Connection Failed", 2000)
+        Connects to the server selected in the server_list in the background, see NordCore.connect()
+        With "Fastest server" checked the lowest latency server of the current filter is connected to instead, with
+        "Race" the next best servers of the current filter are raced against it
+        """
+        server = self.selected_server()
+        if server is None:
+            self.statusbar.showMessage("No server selected", 2000)
+            return False
+        self.failed_servers.clear()
+        self.core.set_setting('fastest', self.fastest_box.isChecked())
+        self.core.set_setting('race', self.race_box.isChecked())
+        self.core.set_setting('mac_randomizer', self.mac_changer_box.isChecked())
+        self.check_connection_validity()
+        fastest = list(self.server_info_list[:probe_candidates]) if self.fastest_box.isChecked() else []
+        alternatives = []
+        if self.race_box.isChecked():
+            alternatives = [candidate for candidate in self.server_info_list[:race_candidates] if candidate.id != server.id]
+        self.authorize("<html><head/><body><p>VPN Network Manager requires <span style=\" font-weight:600;\">sudo</span> permissions in order to disable IPV6, install the auto-connect script and load the kill switch firewall rules. Please input the <span style=\" font-weight:600;\">sudo</span> Password or run the program with elevated priveledges.</p></body></html>",
+                       lambda: self.start_connect(server, fastest, alternatives[:race_candidates - 1]),
+                       lambda: self.statusbar.showMessage("Connection cancelled", 2000))
+
+    def start_connect(self, server, fastest, alternatives):
+        self.connect_stage = None
+        self.connect_worker = self.run_control(
+            self.core.connect, server, self.server_type_select.currentText(), self.connection_type_select.currentText(),
+            self.username, self.password, auto_connect=self.auto_connect_box.isChecked(),
+            kill_switch=self.killswitch_btn.isChecked(), randomize_mac=self.mac_changer_box.isChecked(),
+            alternatives=alternatives, fastest=fastest,
+            on_result=self.connected, on_error=self.connect_failed, on_progress=self.stage_started, timeout=120)
+        self.update_controls()
+        self.server_list.setFocus()
 
-    def disable_connection(self):
+    def stage_started(self, stage):
         """
-        Disconnect vpn connection in NetworkManager
+        :param stage: stage of NordCore.connect() or disconnect() that started
         """
-        try:
-            self.statusbar.showMessage("Disconnecting...", 1000)
-            self.repaint()
-            connection = subprocess.run(['nmcli', 'connection', 'down', self.connection_name])
-            connection.check_returncode()
-        except subprocess.CalledProcessError:
-            self.statusbar.showMessage("ERROR: Disconnection Failed", 2000)
+        self.connect_stage = stage
+        if stage in stage_messages:
+            self.statusbar.showMessage(stage_messages[stage])
 
-    def remove_connection(self):
+    def connected(self, name):
         """
-        Remove connection from network manager
+        Selects the server connected to, which the fastest server or a race may have chosen, and updates the UI
         """
-        try:
-            connection = subprocess.run(['nmcli', 'connection', 'delete', self.connection_name])
-            connection.check_returncode()
-        except subprocess.CalledProcessError:
-            self.statusbar.showMessage("ERROR: Failed to remove Connection", 2000)
+        self.update_controls()
+        self.statusbar.clearMessage()
+        server = parse_connection_name(name).server
+        for candidate in self.server_info_list[:max(probe_candidates, race_candidates)]:
+            if candidate.name == server:
+                self.select_server(candidate.id)
+                break
+        self.monitor.refresh()
+        self.vpn_state_changed(self.monitor.nord_connections())  # reports during the connect were skipped
+
+    def connect_failed(self, error):
+        self.update_controls()
+        self.statusbar.showMessage(stage_errors.get(self.connect_stage, "ERROR: Connection Failed"), 2000)
+        self.monitor.refresh()
+        self.vpn_state_changed(self.monitor.nord_connections())
 
-    def connect(self):
+    def disconnect_vpn(self):
         """
-        Steps through all of the UI Logic for connecting to VPN
+        Disconnects in the background, see NordCore.disconnect()
         """
-        if self.mac_changer_box.isChecked():
-            self.randomize_mac()
-            self.config['SETTINGS']['mac_randomizer'] = 'True'
-            self.write_conf()
-        else:
-            self.config['SETTINGS']['mac_randomizer'] = 'False'
-            self.write_conf()
-
-        if self.auto_connect_box.isChecked() and not self.sudo_password:  # prompt for sudo password
-            self.sudo_dialog = self.get_sudo()
-            self.sudo_dialog.exec_()
-
-            if self.sudo_password: #valid password exists
-                self.set_auto_connect()
-            else:
-                self.auto_connect_box.setChecked(False)
-                return False
-        elif self.auto_connect_box.isChecked() and self.sudo_password:  # sudo password exists in memory
-            self.set_auto_connect()
-        self.check_connection_validity()
-        self.disable_ipv6()
-        self.get_ovpn()
-        self.import_ovpn()
-        self.add_secrets()
-        self.enable_connection()
-        self.statusbar.clearMessage()
-        self.repaint()
-
-        if self.killswitch_btn.isChecked() and not self.sudo_password:
-            self.sudo_dialog = self.get_sudo()
-            self.sudo_dialog.text_label.setText("<html><head/><body><p>VPN Network Manager requires <span style=\" font-weight:600;\">sudo</span> permissions in order to move the kill switch script to the Network Manager directory. Please input the <span style=\" font-weight:600;\">sudo</span> Password or run the program with elevated priveledges.</p></body></html>")
-            self.sudo_dialog.exec_()
-            if not self.sudo_password:  # dialog was closed
-                self.killswitch_btn.setChecked(False)
-                return False
-            self.set_kill_switch()
+        self.stop_watching()
+        self.killswitch_btn.setChecked(False)
+        self.auto_connect_box.setChecked(False)
+        # without the helper only the kill switch, auto-connect and IPV6 steps fail, the connection still goes down
+        self.authorize("<html><head/><body><p>VPN Network Manager requires <span style=\" font-weight:600;\">sudo</span> permissions in order to remove the kill switch firewall rules and the auto-connect script and to enable IPV6. Please input the <span style=\" font-weight:600;\">sudo</span> Password or run the program with elevated priveledges.</p></body></html>",
+                       self.start_disconnect, self.start_disconnect)
 
-        elif self.killswitch_btn.isChecked() and self.sudo_password:
-            self.set_kill_switch()
+    def start_disconnect(self):
+        self.connect_stage = None
+        self.disconnect_worker = self.run_control(
+            self.core.disconnect, self.core.connection_name,
+            on_result=self.disconnected, on_error=self.disconnect_failed, on_progress=self.stage_started, timeout=60)
+        self.update_controls()
 
-        # UI changes here
-        if self.get_active_vpn():  # if connection successful
-            self.connect_btn.hide()
-            self.disconnect_btn.show()
-            self.retranslateUi()
-
-    def disconnect_vpn(self):
+    def disconnected(self, errors):
         """
-        Steps through all of the UI logic to disconnect VPN
-        """
-        if self.killswitch_btn.isChecked():
-            self.killswitch_btn.setChecked(False)
-            self.statusbar.showMessage("Disabling Killswitch...", 5000)
-            self.repaint()
-            self.disable_kill_switch()
-            time.sleep(5)  # sleep time to mitigate NetworkManager still killing connection
-        if self.auto_connect_box.isChecked():
-            self.auto_connect_box.setChecked(False)
-            self.statusbar.showMessage("Disabling auto-connect...", 1000)
-            self.disable_auto_connect()
-        self.disable_connection()
-        self.remove_connection()
-        self.enable_ipv6()
-        self.statusbar.clearMessage()
-        self.repaint()
+        :param errors: "stage: error" of the steps that failed
+        """
+        self.update_controls()
+        if errors:
+            self.statusbar.showMessage(stage_errors.get(errors[0].split(':')[0], "ERROR: Disconnection Failed"), 2000)
+        else:
+            self.statusbar.clearMessage()
+        self.monitor.refresh()
+        self.vpn_state_changed(self.monitor.nord_connections())  # reports during the disconnect were skipped
 
-        # UI changes here
-        self.disconnect_btn.hide()
-        self.connect_btn.show()
-        self.retranslateUi()
+    def disconnect_failed(self, error):
+        self.update_controls()
+        self.statusbar.showMessage(stage_errors.get(self.connect_stage, "ERROR: Disconnection Failed"), 2000)
+        self.monitor.refresh()
+        self.vpn_state_changed(self.monitor.nord_connections())
 
     def center_on_screen(self):
         """
@@ -1238,6 +1642,10 @@ class MainWindow(QtWidgets.QMainWindow):
         self.auto_connect_box.setText(_translate("MainWindow", "Auto connect"))
         self.mac_changer_box.setStatusTip(_translate("MainWindow", "Randomize MAC address"))
         self.mac_changer_box.setText(_translate("MainWindow", "Randomize MAC"))
+        self.fastest_box.setStatusTip(_translate("MainWindow", "Connect to the lowest latency server of the current selection"))
+        self.fastest_box.setText(_translate("MainWindow", "Fastest server"))
+        self.race_box.setStatusTip(_translate("MainWindow", "Connect to whichever of the best servers of the current selection comes up first"))
+        self.race_box.setText(_translate("MainWindow", "Race servers"))
         self.killswitch_btn.setStatusTip(_translate("MainWindow", "Disables internet connection if VPN connectivity is lost"))
         self.killswitch_btn.setText(_translate("MainWindow", "Kill Switch"))
         self.server_type_select.setStatusTip(_translate("MainWindow", "Select Server Type"))
@@ -1245,6 +1653,8 @@ class MainWindow(QtWidgets.QMainWindow):
         self.connect_btn.setText(_translate("MainWindow", "Connect"))
         self.disconnect_btn.setText(_translate("MainWindow", "Disconnect"))
         self.label.setText(_translate("MainWindow", "Servers"))
+        self.search_input.setPlaceholderText(_translate("MainWindow", "Search name, domain or city"))
+        self.search_input.setStatusTip(_translate("MainWindow", "Search servers in all countries"))
 
     def retranslate_login_ui(self):
         _translate = QtCore.QCoreApplication.translate
@@ -1259,6 +1669,7 @@ class MainWindow(QtWidgets.QMainWindow):
 
 if __name__ == '__main__':
     app_name = "NordVPN"
+    import prctl
     prctl.set_name(app_name)
     prctl.set_proctitle(app_name)
     app = QtWidgets.QApplication(sys.argv)
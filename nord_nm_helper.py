@@ -0,0 +1,379 @@
+# -*- coding: utf-8 -*-
+# NordVPN-NetworkManager-GUI privileged helper, started once per session through pkexec or sudo
+# Copyright (C) 2018 Vincent Foster-Mueller
+import argparse
+import contextlib
+import ipaddress
+import json
+import os
+import re
+import shlex
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+
+dispatcher_dir = '/etc/NetworkManager/dispatcher.d'
+ipv6_settings = ['/proc/sys/net/ipv6/conf/all/disable_ipv6', '/proc/sys/net/ipv6/conf/default/disable_ipv6']
+script_names = ('auto_connect', 'kill_switch')  # kill_switch: the dispatcher script of older versions, only removed
+interface_pattern = re.compile(r'^[A-Za-z0-9][A-Za-z0-9_.:@-]{0,14}$')  # at most IFNAMSIZ - 1 characters
+connection_name_pattern = re.compile(r'^(?P<server>.+) \[(?P<type>[^\]]+)\] \[(?P<protocol>UDP|TCP)\]$')
+max_connection_name = 128
+max_interfaces = 16
+max_connections = 8  # connections the auto-connect script tries in turn
+max_debounce = 60
+auto_connect_run_dir = '/run/nord-nm'  # event counter and locks of the auto-connect script
+max_request_size = 256 * 1024
+poll_interval = 2  # seconds between checks whether the GUI is still running
+nft_table = 'inet nord_nm_kill_switch'
+nft_path = '/run/nord-nm/kill_switch.nft'  # where the ruleset is written instead of loaded when running against --root
+nft_saved_path = '/var/lib/nord-nm/kill_switch.nft'  # ruleset of the kill switch that is on, loaded again after a reboot
+tunnel_interfaces = 'tun*'  # NetworkManager names the OpenVPN devices tun0, tun1, ...
+dhcp_ports = (68, 67)  # client and server port, leases of the physical devices are renewed while the switch is on
+max_endpoints = 64
+
+
+class RequestError(Exception):
+    pass
+
+
+def kill_switch_ruleset(endpoints):
+    """
+    Builds the kill switch: an nftables table dropping every packet that neither passes a tunnel interface nor is
+    exchanged with one of the VPN servers. Once the tunnel is gone nothing leaks, without anything running at that time
+    The script replaces an earlier kill switch table in the same transaction
+
+    :param endpoints: list of (address, port, protocol) of the VPN servers, protocol is udp or tcp
+    :return: nft script
+    """
+    input_rules = ['iifname "lo" accept', 'iifname "%s" accept' % tunnel_interfaces,
+                   'udp sport %d udp dport %d accept' % dhcp_ports[::-1]]
+    output_rules = ['oifname "lo" accept', 'oifname "%s" accept' % tunnel_interfaces,
+                    'udp sport %d udp dport %d accept' % dhcp_ports]
+    for address, port, protocol in endpoints:
+        family = 'ip' if ipaddress.ip_address(address).version == 4 else 'ip6'
+        rule = '%s saddr %s accept' % (family, address)  # including ICMP errors of the path to the server
+        if rule not in input_rules:
+            input_rules.append(rule)
+        output_rules.append('%s daddr %s %s dport %d accept' % (family, address, protocol, port))
+    lines = ['table %s' % nft_table, 'delete table %s' % nft_table, 'table %s {' % nft_table]
+    for chain, hook, rules in (('input', 'input', input_rules), ('output', 'output', output_rules)):
+        lines.append('\tchain %s {' % chain)
+        lines.append('\t\ttype filter hook %s priority 0; policy drop;' % hook)
+        lines.extend('\t\t' + rule for rule in rules)
+        lines.append('\t}')
+    lines.append('}')
+    return '\n'.join(lines) + '\n'
+
+
+def kill_switch_removal():
+    """
+    :return: nft script deleting the kill switch table, whether it exists or not
+    """
+    return 'table %s\ndelete table %s\n' % (nft_table, nft_table)
+
+
+def valid_endpoint(endpoint):
+    """
+    :return: (address, port, protocol) of a [address, port, protocol] list from a request
+    """
+    if not isinstance(endpoint, list) or len(endpoint) != 3:
+        raise RequestError('endpoint must be [address, port, protocol]')
+    address, port, protocol = endpoint
+    try:
+        address = str(ipaddress.ip_address(address))
+    except (TypeError, ValueError):
+        raise RequestError('invalid endpoint address ' + str(address)[:40])
+    if not isinstance(port, int) or isinstance(port, bool) or not 0 < port < 65536:
+        raise RequestError('invalid endpoint port')
+    if protocol not in ('udp', 'tcp'):
+        raise RequestError('invalid endpoint protocol')
+    return address, port, protocol
+
+
+def valid_interfaces(interfaces):
+    """
+    :return: list of interface names from a request
+    """
+    if not isinstance(interfaces, list) or not 0 < len(interfaces) <= max_interfaces:
+        raise RequestError('interfaces must be a list of 1 to %d names' % max_interfaces)
+    for interface in interfaces:
+        if not isinstance(interface, str) or not interface_pattern.match(interface):
+            raise RequestError('invalid interface ' + str(interface)[:40])
+    return interfaces
+
+
+def valid_connection_name(name):
+    """
+    :return: name of a Nord connection from a request
+    """
+    if (not isinstance(name, str) or len(name) > max_connection_name or not name.isprintable() or
+            not connection_name_pattern.match(name)):
+        raise RequestError('invalid connection name ' + str(name)[:40])
+    return name
+
+
+def valid_connections(names):
+    """
+    :return: names of the Nord connections from a request
+    """
+    if not isinstance(names, list) or not 0 < len(names) <= max_connections:
+        raise RequestError('connections must be a list of 1 to %d names' % max_connections)
+    return [valid_connection_name(name) for name in names]
+
+
+def valid_debounce(debounce):
+    """
+    :return: seconds from a request, as the argument of sleep
+    """
+    if isinstance(debounce, bool) or not isinstance(debounce, (int, float)) or not 0 <= debounce <= max_debounce:
+        raise RequestError('debounce must be 0 to %d seconds' % max_debounce)
+    return '%g' % round(debounce, 3)
+
+
+def auto_connect_script(interfaces, connections, debounce, run_dir=auto_connect_run_dir, ruleset_path=nft_saved_path):
+    """
+    Builds the dispatcher script bringing a Nord connection up once one of interfaces comes up
+    NetworkManager runs the dispatcher scripts one event after another, so each event is only counted and an attempt
+    started in the background. An attempt waits debounce seconds and gives up if a later event came meanwhile, e.g. of
+    flapping wifi, or if a Nord connection is active or activating. Otherwise it tries connections in turn, the first one
+    NetworkManager brings up is kept. The kill switch, which a reboot or NetworkManager restart drops, is loaded again from
+    ruleset_path on every event if it is on. Nothing of the request ends up in the script unquoted
+
+    :param debounce: seconds of valid_debounce()
+    :return: bash script
+    """
+    counter, counter_lock, lock = (shlex.quote(os.path.join(run_dir, name))
+                                   for name in ('auto_connect.events', 'auto_connect.events.lock', 'auto_connect.lock'))
+    return (
+        '#!/bin/bash\n'
+        '# Built by nord_nm_helper.py\n\n'
+        'connections=(' + ' '.join(shlex.quote(name) for name in connections) + ')\n\n'
+        'events() {  # adds $1 to the event counter and prints it\n'
+        '  mkdir -p -m 0700 ' + shlex.quote(run_dir) + ' || return 1\n'
+        '  {\n'
+        '    flock 9\n'
+        '    count=$(cat ' + counter + ' 2> /dev/null)\n'
+        '    [[ "$count" =~ ^[0-9]+$ ]] || count=0\n'
+        '    if (( $1 )); then\n'
+        '      count=$((count + $1))\n'
+        '      echo "$count" > ' + counter + '\n'
+        '    fi\n'
+        '    echo "$count"\n'
+        '  } 9> ' + counter_lock + '\n'
+        '}\n\n'
+        'if [ "$1" = --attempt ]; then\n'
+        '  sleep ' + shlex.quote(debounce) + '\n'
+        '  [ "$(events 0)" = "$2" ] || exit 0  # a later event makes the attempt\n'
+        '  exec 8> ' + lock + '\n'
+        '  flock 8\n'
+        '  [ "$(events 0)" = "$2" ] || exit 0\n'
+        '  if nmcli -t -f TYPE,NAME connection show --active | grep -qE \'^vpn:.* \\[[^]]+\\] \\[(UDP|TCP)\\](:|$)\'; then\n'
+        '    exit 0  # a Nord connection is active or activating\n'
+        '  fi\n'
+        '  for name in "${connections[@]}"; do\n'
+        '    nmcli connection up id "$name" && exit 0\n'
+        '  done\n'
+        '  exit 1\n'
+        'fi\n\n'
+        'case "$1" in\n'
+        '  ' + '|'.join(shlex.quote(interface) for interface in interfaces) + ')\n'
+        '    if [[ "$2" =~ ^(up|connectivity-change)$ ]]; then\n'
+        '      if [ -f ' + shlex.quote(ruleset_path) + ' ]; then\n'
+        '        nft -f ' + shlex.quote(ruleset_path) + '\n'
+        '      fi\n'
+        '      event=$(events 1) || exit 1\n'
+        '      setsid /bin/bash "$0" --attempt "$event" < /dev/null > /dev/null 2>&1 &\n'
+        '    fi\n'
+        '    ;;\n'
+        'esac\n'
+    )
+
+
+def peer_uid(conn):
+    """
+    :return: uid of the process on the other end of the unix socket
+    """
+    pid, uid, gid = struct.unpack('3i', conn.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i')))
+    return uid
+
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Helper:
+    """
+    Applies batches of validated operations on behalf of a single unprivileged user
+    A batch is only applied once every operation in it passed validation
+
+    :param root: directory standing in for / so the helper can run unprivileged against a scratch tree
+    """
+    def __init__(self, uid, root='/'):
+        self.uid = uid
+        self.root = root
+
+    def path(self, path):
+        path = os.path.join(self.root, path.lstrip('/'))
+        if self.root != '/':
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    def validate(self, op):
+        """
+        :return: (method, arguments) applying op
+        """
+        if not isinstance(op, dict):
+            raise RequestError('operation must be an object')
+        name = op.get('op')
+        if name in ('ping', 'quit') and len(op) == 1:
+            return None, ()
+        if (name == 'install' and set(op) == {'op', 'name', 'interfaces', 'connections', 'debounce'} and
+                op['name'] == 'auto_connect'):
+            script = auto_connect_script(valid_interfaces(op['interfaces']), valid_connections(op['connections']),
+                                         valid_debounce(op['debounce']), self.path(auto_connect_run_dir + '/').rstrip('/'),
+                                         self.path(nft_saved_path))
+            return self.install, (op['name'], script)
+        if name == 'remove' and set(op) == {'op', 'name'}:
+            if op['name'] not in script_names:
+                raise RequestError('unknown script ' + str(op['name']))
+            return self.remove, (op['name'],)
+        if name == 'ipv6' and set(op) == {'op', 'disable'} and isinstance(op['disable'], bool):
+            return self.ipv6, (op['disable'],)
+        if name == 'kill_switch_on' and set(op) == {'op', 'endpoints'} and isinstance(op['endpoints'], list):
+            if len(op['endpoints']) > max_endpoints:
+                raise RequestError('too many endpoints')
+            return self.kill_switch, (kill_switch_ruleset([valid_endpoint(endpoint) for endpoint in op['endpoints']]),)
+        if name == 'kill_switch_off' and len(op) == 1:
+            return self.kill_switch, (None,)
+        raise RequestError('invalid operation ' + json.dumps(op)[:80])
+
+    def write(self, path, content, mode):
+        """
+        Atomically replaces the root owned file path
+        """
+        directory, name = os.path.split(path)
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.' + name)
+        try:
+            with os.fdopen(fd, 'w') as out_file:
+                out_file.write(content)
+                os.fchmod(out_file.fileno(), mode)
+                if os.geteuid() == 0:
+                    os.fchown(out_file.fileno(), 0, 0)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+    def install(self, name, content):
+        """
+        Atomically replaces the dispatcher script name with content built by the helper, NetworkManager only runs root
+        owned scripts
+        """
+        self.write(os.path.join(self.path(dispatcher_dir + '/'), name), content, 0o744)
+
+    def remove(self, name):
+        try:
+            os.remove(os.path.join(self.path(dispatcher_dir + '/'), name))
+        except FileNotFoundError:
+            pass
+
+    def ipv6(self, disable):
+        for setting in ipv6_settings:
+            with open(self.path(setting), 'w') as value:
+                value.write('1\n' if disable else '0\n')
+
+    def kill_switch(self, ruleset):
+        """
+        Loads the kill switch ruleset and keeps it for the auto-connect script, None removes the kill switch
+
+        :param ruleset: nft script of kill_switch_ruleset()
+        """
+        saved_path = self.path(nft_saved_path)
+        if ruleset is None:
+            self.load_ruleset(kill_switch_removal())
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(saved_path)
+            return
+        self.load_ruleset(ruleset)
+        os.makedirs(os.path.dirname(saved_path), 0o700, exist_ok=True)
+        self.write(saved_path, ruleset, 0o600)
+
+    def load_ruleset(self, ruleset):
+        """
+        Applies an nft script as one transaction, against a scratch root it is written to nft_path instead
+        """
+        if self.root != '/':
+            with open(self.path(nft_path), 'w') as ruleset_file:
+                ruleset_file.write(ruleset)
+            return
+        output = subprocess.run(['nft', '-f', '-'], input=ruleset.encode('utf-8'), stdout=subprocess.DEVNULL,
+                                stderr=subprocess.PIPE)
+        if output.returncode != 0:
+            raise RequestError('nft: ' + output.stderr.decode('utf-8', 'replace').strip()[:200])
+
+    def handle(self, line):
+        """
+        :param line: JSON request {"ops": [operation, ...]}
+        :return: response dictionary
+        """
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict) or not isinstance(request.get('ops'), list):
+                raise RequestError('request must be {"ops": [...]}')
+            actions = [self.validate(op) for op in request['ops']]
+            for method, args in actions:
+                if method:
+                    method(*args)
+        except (ValueError, RequestError, OSError) as ex:
+            return {'ok': False, 'error': str(ex)}
+        return {'ok': True}
+
+    def serve(self, name, parent=None):
+        """
+        Answers requests on the abstract unix socket name until asked to quit or the parent process exits
+        """
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind('\0' + name)
+        server.listen(4)
+        server.settimeout(poll_interval)
+        with server:
+            while parent is None or process_alive(parent):
+                try:
+                    conn, address = server.accept()
+                except socket.timeout:
+                    continue
+                with conn:
+                    conn.settimeout(5)
+                    try:
+                        if peer_uid(conn) != self.uid:
+                            continue
+                        with conn.makefile('rb') as reader:
+                            line = reader.readline(max_request_size)
+                        response = self.handle(line)
+                        conn.sendall(json.dumps(response).encode('utf-8') + b'\n')
+                    except OSError:
+                        continue
+                if response['ok'] and any(op.get('op') == 'quit' for op in json.loads(line)['ops']):
+                    break
+
+
+def main(argv):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--uid', type=int, required=True, help='only requests from this user are answered')
+    parser.add_argument('--name', required=True, help='abstract unix socket name')
+    parser.add_argument('--parent', type=int, help='exit once this process is gone')
+    parser.add_argument('--root', default='/', help='directory standing in for /, for unprivileged testing')
+    args = parser.parse_args(argv)
+    Helper(args.uid, args.root).serve(args.name, args.parent)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+# Shared stand-ins of the test suite, run with: python -m pytest tests
+import os
+import sys
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+tests_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(tests_dir))
+sys.path.insert(0, os.path.join(os.path.dirname(tests_dir), 'benchmarks'))  # synthetic catalogs of catalog.py
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', 'slow: runs for seconds, deselect with -m "not slow"')
+
+
+@pytest.fixture
+def serve():
+    """
+    Starts local HTTP servers on a free port of 127.0.0.1, they are shut down after the test
+
+    :return: function taking a BaseHTTPRequestHandler class and returning the running server
+    """
+    servers = []
+
+    def start(handler, server_class=ThreadingHTTPServer):
+        server = server_class(('127.0.0.1', 0), handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+# In-process stand-in for python-dbus and the NetworkManager objects DBusBackend talks to
+# The module takes the place of the dbus module, FakeNetworkManager the place of the system bus
+import itertools
+import types
+
+PROPERTIES_IFACE = 'org.freedesktop.DBus.Properties'
+nm = 'org.freedesktop.NetworkManager'
+
+
+class DBusException(Exception):
+    def get_dbus_message(self):
+        return str(self)
+
+
+def Dictionary(mapping, signature=None):
+    return dict(mapping)
+
+
+def Interface(obj, dbus_interface):
+    return obj
+
+
+shared_bus = None
+
+
+def SystemBus(private=False, mainloop=None):
+    """
+    Like python-dbus, the shared bus is created by the first call and later calls get it as it is, whatever main loop
+    they pass. Only a private bus uses the main loop it is given
+    """
+    global shared_bus
+    if private:
+        return FakeNetworkManager(mainloop=mainloop)
+    if shared_bus is None:
+        shared_bus = FakeNetworkManager(mainloop=mainloop)
+    return shared_bus
+
+
+mainloop = types.ModuleType('dbus.mainloop')
+mainloop.pyqt5 = types.ModuleType('dbus.mainloop.pyqt5')
+mainloop.pyqt5.DBusQtMainLoop = lambda: 'qt main loop'
+
+
+class FakeNetworkManager:
+    """
+    Saved and active connections of a NetworkManager, answering the calls DBusBackend makes
+    An activation stays activating for activation_polls reads of its State, then it is activated or, for the names in
+    fail, removed as NetworkManager does with a failed activation
+
+    :param devices: list of (device type number, interface)
+    """
+    def __init__(self, devices=((1, 'eth0'), (2, 'wlan0'), (14, 'lo')), activation_polls=2, mainloop=None):
+        self.connections = {}  # path -> settings
+        self.active = {}  # path -> properties of org.freedesktop.NetworkManager.Connection.Active
+        self.devices = {'/org/freedesktop/NetworkManager/Devices/%d' % i: device for i, device in enumerate(devices)}
+        self.activation_polls = activation_polls
+        self.fail = set()
+        self.calls = []  # (method, path) in call order
+        self.ids = itertools.count(1)
+        self.mainloop = mainloop
+        self.receivers = []  # (handler, signal name, path keyword)
+
+    def add_signal_receiver(self, handler, signal_name=None, dbus_interface=None, path=None, path_keyword=None):
+        self.receivers.append((handler, signal_name, path_keyword))
+
+    def emit(self, signal_name, path, *args):
+        """
+        Delivers a signal of the object at path to the receivers, only a bus with a main loop dispatches signals
+        """
+        if self.mainloop is None:
+            return
+        for handler, name, path_keyword in self.receivers:
+            if name == signal_name:
+                handler(*args, **({path_keyword: path} if path_keyword else {}))
+
+    def get_object(self, bus_name, path):
+        if bus_name != nm:
+            raise DBusException('The name ' + bus_name + ' was not provided by any .service files')
+        return FakeObject(self, path)
+
+    def saved(self, name):
+        """
+        :return: settings of the saved connection called name or None
+        """
+        return next((settings for settings in self.connections.values() if settings['connection']['id'] == name), None)
+
+    def active_names(self):
+        return [properties['Id'] for properties in self.active.values()]
+
+
+class FakeObject:
+    """
+    Object at path on the bus, every method call is recorded in the calls of the FakeNetworkManager
+    """
+    def __init__(self, manager, path):
+        self.manager = manager
+        self.path = path
+
+    def __getattr__(self, method):
+        def call(*args, **kwargs):
+            self.manager.calls.append((method, self.path))
+            return getattr(self, 'do_' + method)(*args)
+        return call
+
+    def do_AddConnection(self, settings):
+        if settings['connection']['id'] in [s['connection']['id'] for s in self.manager.connections.values()]:
+            raise DBusException('A connection with this id exists')
+        path = '/org/freedesktop/NetworkManager/Settings/%d' % next(self.manager.ids)
+        self.manager.connections[path] = settings
+        return path
+
+    def do_ListConnections(self):
+        return list(self.manager.connections)
+
+    def do_GetSettings(self):
+        try:
+            return self.manager.connections[self.path]
+        except KeyError:
+            raise DBusException('Object does not exist at path ' + self.path)
+
+    def do_GetSecrets(self, setting_name):
+        return {setting_name: {}}
+
+    def do_UpdateUnsaved(self, settings):
+        self.manager.connections[self.path] = settings
+
+    def do_Delete(self):
+        if self.manager.connections.pop(self.path, None) is None:
+            raise DBusException('Object does not exist at path ' + self.path)
+
+    def do_ActivateConnection(self, connection, device, specific_object):
+        if connection not in self.manager.connections:
+            raise DBusException('Connection ' + connection + ' does not exist')
+        settings = self.manager.connections[connection]['connection']
+        path = '/org/freedesktop/NetworkManager/ActiveConnection/%d' % next(self.manager.ids)
+        self.manager.active[path] = {'Id': settings['id'], 'Type': settings['type'], 'Uuid': settings['uuid'],
+                                     'Connection': connection, 'Devices': [], 'State': 1, 'polls': 0}
+        return path
+
+    def do_DeactivateConnection(self, path):
+        if self.manager.active.pop(path, None) is None:
+            raise DBusException('The active connection was not found')
+
+    def do_GetDevices(self):
+        return list(self.manager.devices)
+
+    def do_Get(self, interface, name):
+        if name == 'ActiveConnections':
+            return list(self.manager.active)
+        if self.path in self.manager.devices:
+            return dict(zip(('DeviceType', 'Interface'), self.manager.devices[self.path]))[name]
+        properties = self.do_GetAll(interface)
+        if name == 'State' and properties['State'] == 1:
+            properties['polls'] += 1
+            if properties['polls'] > self.manager.activation_polls:
+                if properties['Id'] in self.manager.fail:
+                    del self.manager.active[self.path]
+                    raise DBusException('Object does not exist at path ' + self.path)
+                properties['State'] = 2
+        return properties[name]
+
+    def do_GetAll(self, interface):
+        try:
+            return self.manager.active[self.path]
+        except KeyError:
+            raise DBusException('Object does not exist at path ' + self.path)
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+# Connections the auto-connect script is installed with, ranked by the cached probes and loads among the kept ones
+import json
+import os
+import time
+import types
+
+import pytest
+
+import catalog
+import cdn
+from nord_nm_core import NmcliBackend, NordCore, Probe, build_index, connection_name
+from nord_nm_helper import Helper
+
+shims = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks', 'shims')
+api_data = catalog.generate(200)
+server_index = build_index(api_data)
+country = server_index.store.countries[0]
+servers = server_index.lookup(country, 'Standard')[:5]
+abroad = next(server for other in server_index.store.countries[1:] for server in server_index.lookup(other, 'Standard'))
+
+
+@pytest.fixture
+def core(monkeypatch, tmp_path):
+    monkeypatch.setenv('PATH', shims + os.pathsep + os.environ['PATH'])
+    monkeypatch.setenv('FAKE_NM_STATE', str(tmp_path / 'nm_state.json'))
+    core = NordCore(str(tmp_path / 'config'))
+    core.setup()
+    core.backend = NmcliBackend()
+    core.server_index = server_index  # loaded by the GUI or the command
+    core.catalog = types.SimpleNamespace(load=lambda: pytest.fail('the catalog is parsed again'))
+    return core
+
+
+def keep(core, *names):
+    with open(os.environ['FAKE_NM_STATE'], 'w') as state_file:
+        json.dump({'connections': list(names), 'active': []}, state_file)
+    for name in names:
+        core.profiles.add(name, 'user')
+
+
+def probed(core, *rtts):
+    core.prober.results = {server.domain: Probe(rtt=rtt, loss=0.0, measured_at=time.time())
+                           for server, rtt in zip(servers, rtts) if rtt is not None}
+
+
+def test_fastest_first(core):
+    names = [connection_name(server, 'UDP') for server in servers[:4]]
+    keep(core, *names)
+    probed(core, 0.05, 0.08, 0.02, None)
+    assert core.auto_connect_connections(names[0], server_index) == [names[2], names[0], names[1]]
+    assert core.auto_connect_connections(names[0], server_index, count=4) == [names[2], names[0], names[1], names[3]]
+
+
+def test_preferred_always_tried(core):
+    names = [connection_name(server, 'UDP') for server in servers[:4]]
+    keep(core, *names)
+    probed(core, 0.02, 0.03, 0.04, 0.09)
+    assert core.auto_connect_connections(names[3], server_index) == [names[0], names[1], names[3]]
+    assert core.auto_connect_connections(names[3], server_index, count=1) == [names[3]]
+
+
+def test_country_and_protocol_of_preferred(core):
+    preferred = connection_name(servers[0], 'UDP')
+    keep(core, preferred, connection_name(servers[1], 'TCP'), connection_name(abroad, 'UDP'))
+    probed(core, 0.05, 0.01)
+    core.prober.results[abroad.domain] = Probe(rtt=0.01, loss=0.0, measured_at=time.time())
+    assert core.auto_connect_connections(preferred, server_index) == [preferred]
+
+
+def test_only_connections_kept_in_network_manager(core):
+    names = [connection_name(server, 'UDP') for server in servers[:3]]
+    keep(core, *names)
+    with open(os.environ['FAKE_NM_STATE'], 'w') as state_file:  # deleted meanwhile, e.g. with nmcli
+        json.dump({'connections': names[:2], 'active': []}, state_file)
+    probed(core, 0.05, 0.04, 0.01)
+    assert core.auto_connect_connections(names[0], server_index) == [names[1], names[0]]
+
+
+class ScratchHelper:
+    """
+    Applies the batches of the core with a Helper against a scratch root, keeping the last operation of each kind
+    """
+    def __init__(self, root):
+        self.helper = Helper(os.getuid(), root)
+        self.last = {}
+
+    def call(self, *ops):
+        assert self.helper.handle(json.dumps({'ops': list(ops)})) == {'ok': True}
+        for op in ops:
+            self.last[op['op']] = op
+
+
+def test_candidates_let_through_the_kill_switch(core, tmp_path):
+    names = [connection_name(server, 'UDP') for server in servers[:4]]
+    keep(core, *names)
+    for server in servers[:4]:
+        core.configs.add(server.domain, 'udp', cdn.ovpn(next(data for data in api_data if data['id'] == server.id), 'udp'))
+    probed(core, 0.05, 0.08, 0.04, 0.01)
+    core.helper = ScratchHelper(str(tmp_path / 'root'))
+    core.connection_name, core.standby_name = names[0], names[1]
+
+    def reachable():
+        endpoints = core.helper.last['kill_switch_on']['endpoints']
+        candidates = core.helper.last['install']['connections']
+        assert names[0] in candidates
+        for name in candidates:
+            assert all(list(endpoint) in endpoints for endpoint in core.connection_endpoints(name)), name
+
+    core.install_auto_connect(names[0])
+    assert core.helper.last['install']['connections'] == [names[3], names[2], names[0]]  # the fastest kept ones
+    core.install_kill_switch()  # turned on later, the script is installed again with the servers let through
+    reachable()
+    assert core.helper.last['install']['connections'] == [names[0], names[1]]
+    core.install_auto_connect(names[0])  # turned on again while the kill switch is on
+    reachable()
+    core.standby_name = names[2]  # a new standby, as prepare_standby() reloads the kill switch for
+    core.install_kill_switch()
+    reachable()
+    assert core.helper.last['install']['connections'] == [names[2], names[0]]
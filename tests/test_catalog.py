@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+# Incremental catalog parsing and the catalog cache against a local stand-in for the API
+import json
+import os
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+import catalog
+import nord_nm_core
+from nord_nm_core import CatalogCache, HttpClient, iter_json_array
+
+
+class CatalogHandler(BaseHTTPRequestHandler):
+    """
+    Serves server.body as the catalog in small writes, so the client receives it in many pieces
+    Revalidations sending the current ETag are answered with 304, with server.cut the connection is closed after that
+    many bytes of the body
+    """
+    def do_GET(self):
+        if self.headers.get('If-None-Match') == self.server.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('ETag', self.server.etag)
+        self.send_header('Content-Length', str(len(self.server.body)))
+        self.end_headers()
+        body = self.server.body[:self.server.cut]
+        for start in range(0, len(body), 4093):
+            self.wfile.write(body[start:start + 4093])
+        self.close_connection = True
+
+    def log_message(self, *args):
+        pass
+
+
+def synthetic_catalog(size):
+    """
+    :return: catalog of size servers, every tenth one in a city with a name outside of ASCII
+    """
+    servers = catalog.generate(size)
+    for server in servers[::10]:
+        server['locations'][0]['country']['city']['name'] = 'Zürich 東京 🙂'
+    return servers
+
+
+@pytest.fixture
+def api(serve, monkeypatch):
+    """
+    :return: running stand-in for the catalog API, its body and etag can be replaced by the test
+    """
+    server = serve(CatalogHandler)
+    server.body = json.dumps(synthetic_catalog(20000), ensure_ascii=False).encode('utf-8')
+    server.etag = '"first"'
+    server.cut = None
+    monkeypatch.setattr(nord_nm_core, 'api', 'http://127.0.0.1:%d/server' % server.server_port)
+    return server
+
+
+sample = [{'id': 1, 'city': 'Zürich', 'load': 12345, 'ratio': -1.5e3, 'tags': ['東京', '🙂']}, 7, -0.25, 1e-7,
+          'ünïcode', [[], {}], None, True]
+sample_bytes = json.dumps(sample, ensure_ascii=False).encode('utf-8')
+
+
+@pytest.mark.parametrize('split', range(1, len(sample_bytes)))
+def test_split_anywhere(split):
+    """
+    A chunk boundary inside a multibyte character, a number or a literal does not change the result
+    """
+    assert list(iter_json_array([sample_bytes[:split], sample_bytes[split:]])) == sample
+
+
+def test_single_byte_chunks():
+    assert list(iter_json_array(sample_bytes[i:i + 1] for i in range(len(sample_bytes)))) == sample
+
+
+def test_number_at_chunk_end_is_not_cut():
+    assert list(iter_json_array([b'[12', b'34', b'5, 6', b'.5]'])) == [12345, 6.5]
+
+
+@pytest.mark.parametrize('cut', range(len(sample_bytes)))
+def test_truncated(cut):
+    with pytest.raises(ValueError):
+        list(iter_json_array([sample_bytes[:cut]]))
+
+
+def test_not_an_array():
+    with pytest.raises(ValueError):
+        list(iter_json_array([b'{"servers": []}']))
+
+
+def test_refresh_large_catalog(api, tmp_path):
+    cache = CatalogCache(str(tmp_path), HttpClient())
+    countries = []
+    server_index = cache.refresh(report=countries.append)
+    assert len(server_index.store) == 20000
+    assert sorted(countries) == sorted(server_index.store.countries)
+    assert 'Zürich 東京 🙂' in server_index.store.cities
+    with open(cache.data_path, 'rb') as data_file:
+        assert data_file.read() == api.body
+    assert cache.meta['etag'] == '"first"'
+    assert len(cache.load().store) == 20000
+
+    assert cache.refresh() is None  # revalidated with the stored ETag
+
+
+def test_truncated_download_keeps_cache(api, tmp_path):
+    cache = CatalogCache(str(tmp_path), HttpClient())
+    cache.refresh()
+    meta = dict(cache.meta)
+    old = api.body
+    api.body, api.etag = old[:len(old) // 2], '"second"'
+    with pytest.raises(ValueError):
+        cache.refresh()
+    with open(cache.data_path, 'rb') as data_file:
+        assert data_file.read() == old
+    assert cache.meta == meta
+    assert CatalogCache(str(tmp_path), HttpClient()).meta == meta
+
+
+def test_dropped_connection_keeps_cache(api, tmp_path):
+    cache = CatalogCache(str(tmp_path), HttpClient(retries=0))
+    cache.refresh()
+    meta = dict(cache.meta)
+    api.etag, api.cut = '"second"', len(api.body) // 2
+    with pytest.raises(OSError):  # requests.RequestException
+        cache.refresh()
+    with open(cache.data_path, 'rb') as data_file:
+        assert data_file.read() == api.body
+    assert cache.meta == meta
+
+
+def test_cache_replaced_after_parse(api, tmp_path):
+    """
+    The cached catalog stays the old one while the new one is parsed, it is only replaced once the parse completed
+    """
+    cache = CatalogCache(str(tmp_path), HttpClient())
+    cache.refresh()
+    with open(cache.data_path, 'rb') as data_file:
+        old = data_file.read()
+    api.body, api.etag = json.dumps(synthetic_catalog(500)).encode('utf-8'), '"second"'
+    seen = []
+
+    def report(country):
+        with open(cache.data_path, 'rb') as data_file:
+            seen.append(data_file.read() == old)
+
+    assert len(cache.refresh(report=report).store) == 500
+    assert seen and all(seen)
+    with open(cache.data_path, 'rb') as data_file:
+        assert data_file.read() == api.body
+    assert not os.path.exists(cache.data_path + '.tmp')
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+# Config store and prefetcher against a local stand-in for the CDN
+import copy
+import os
+import threading
+import time
+import types
+
+import pytest
+
+import catalog
+import cdn
+import nord_nm_core
+from nord_nm_core import ConfigPrefetcher, ConfigStore, HttpClient, ProfileCache
+
+servers = catalog.generate(20)
+
+
+@pytest.fixture
+def cdn_server(monkeypatch):
+    server = cdn.CDN(servers)
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()  # shut down without a long poll
+    monkeypatch.setattr(nord_nm_core, 'cdn', server.url)
+    monkeypatch.setattr(nord_nm_core, 'config_archives', [server.url + '/archives/servers/ovpn.zip'])
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def store(cdn_server, tmp_path):
+    return ConfigStore(str(tmp_path / 'configs'), HttpClient())
+
+
+def publish(cdn_server, updated):
+    cdn_server.archive = cdn.archive(updated)
+    cdn_server.etag = '"%d"' % id(updated)
+
+
+def backdate(store, seconds):
+    for path in store.index.values():
+        os.utime(path, (time.time() - seconds,) * 2)
+
+
+def test_archive_ingested(cdn_server, store):
+    assert store.is_stale()
+    assert store.refresh() == 2 * len(servers)
+    assert not store.is_stale()
+    for server in servers:
+        for protocol in ('udp', 'tcp'):
+            with open(store.get(server['domain'], protocol), 'rb') as ovpn_file:
+                assert ovpn_file.read() == cdn.ovpn(server, protocol)
+    reopened = ConfigStore(store.store_dir, HttpClient())  # indexed from the files and the saved ETag
+    assert reopened.get(servers[0]['domain'], 'udp') == store.get(servers[0]['domain'], 'udp')
+    assert reopened.meta == store.meta and not reopened.is_stale()
+
+
+def test_not_modified_keeps_files(cdn_server, store):
+    store.refresh()
+    backdate(store, 100)
+    mtimes = {key: os.path.getmtime(path) for key, path in store.index.items()}
+    store.meta[nord_nm_core.config_archives[0]]['fetched_at'] = 0  # expired
+    assert store.is_stale()
+    requests = cdn_server.requests
+    assert store.refresh() == 0  # answered with 304
+    assert cdn_server.requests == requests + 1
+    assert {key: os.path.getmtime(path) for key, path in store.index.items()} == mtimes
+    assert not store.is_stale()
+
+
+def test_single_file_fetched(cdn_server, store):
+    path = store.fetch(servers[0]['domain'], 'tcp')
+    assert store.get(servers[0]['domain'], 'tcp') == path and store.get(servers[0]['domain'], 'udp') is None
+    with open(path, 'rb') as ovpn_file:
+        assert ovpn_file.read() == cdn.ovpn(servers[0], 'tcp')
+
+
+def test_updated_archive_only_rewrites_changed_files(cdn_server, store):
+    assert store.refresh() == 2 * len(servers)
+    backdate(store, 100)
+    mtimes = {key: os.path.getmtime(path) for key, path in store.index.items()}
+    updated = copy.deepcopy(servers)
+    updated[3]['ip_address'] = '192.0.2.1'
+    publish(cdn_server, updated)
+    store.refresh()
+    changed = {key for key, path in store.index.items() if os.path.getmtime(path) != mtimes[key]}
+    assert changed == {(servers[3]['domain'], 'udp'), (servers[3]['domain'], 'tcp')}
+    with open(store.get(servers[3]['domain'], 'udp'), 'rb') as ovpn_file:
+        assert b'remote 192.0.2.1 1194' in ovpn_file.read()
+
+
+def test_kept_profiles_survive_an_archive_update(cdn_server, store, tmp_path):
+    deleted = []
+    profiles = ProfileCache(types.SimpleNamespace(delete=deleted.append), str(tmp_path / 'profiles.json'))
+    store.refresh()
+    backdate(store, 100)
+    for server in servers[:2]:
+        profiles.add(server['name'], 'user')
+    profiles.write({name: (username, imported_at - 10, released)  # imported a while ago
+                    for name, (username, imported_at, released) in profiles.read().items()})
+    updated = copy.deepcopy(servers)
+    updated[1]['ip_address'] = '192.0.2.1'
+    publish(cdn_server, updated)
+    store.refresh()
+
+    def kept(server):
+        return profiles.get(server['name'], 'user', os.path.getmtime(store.get(server['domain'], 'udp')))
+    assert kept(servers[0])
+    assert not kept(servers[1]) and deleted == [servers[1]['name']]  # imported from the outdated file
+
+
+domains = [server['domain'] for server in servers]
+
+
+def test_prefetch(cdn_server, store):
+    prefetcher = ConfigPrefetcher(store, count=3, rate=10 ** 9)
+    store.fetch(domains[1], 'udp')
+    assert prefetcher.prefetch(prefetcher.start(), domains, 'udp') == 2  # the stored one is skipped
+    assert all(store.get(domain, 'udp') for domain in domains[:3]) and store.get(domains[3], 'udp') is None
+
+
+def test_prefetch_of_an_older_filter_stops(cdn_server, store, monkeypatch):
+    prefetcher = ConfigPrefetcher(store, count=5, rate=10 ** 9)
+    stale = prefetcher.start()
+    prefetcher.start()  # the filter changed before the prefetch ran
+    assert prefetcher.prefetch(stale, domains, 'udp') == 0
+    assert store.get(domains[0], 'udp') is None
+    fetch = store.fetch
+    monkeypatch.setattr(store, 'fetch', lambda *args: (fetch(*args), prefetcher.start())[0])  # changed meanwhile
+    assert prefetcher.prefetch(prefetcher.generation, domains[10:], 'udp') == 1
+    assert store.get(domains[11], 'udp') is None
+
+
+def test_prefetch_rate_limited(cdn_server, store):
+    size = len(cdn.ovpn(servers[0], 'udp'))
+    prefetcher = ConfigPrefetcher(store, count=3, rate=size * 20)  # 50 ms per file
+    start = time.monotonic()
+    assert prefetcher.prefetch(prefetcher.start(), domains, 'udp') == 3
+    assert time.monotonic() - start >= 3 * 0.05
+
+
+def test_prefetched_files_capped(cdn_server, store):
+    prefetcher = ConfigPrefetcher(store, count=2, rate=10 ** 9, max_files=3)
+    prefetcher.prefetch(prefetcher.start(), domains[:2], 'udp')
+    prefetcher.used(domains[0], 'udp')  # connected to, no longer a prefetched file
+    prefetcher.prefetch(prefetcher.start(), domains[2:4], 'udp')
+    prefetcher.prefetch(prefetcher.start(), domains[4:6], 'udp')
+    assert [domain for domain in domains[:6] if store.get(domain, 'udp')] == [domains[0]] + domains[3:6]
+    assert len(prefetcher.prefetched) == 3
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+# DBusBackend against the in-process NetworkManager of fakedbus
+import os
+
+import pytest
+
+import cdn
+import fakedbus
+import nord_nm_core
+from nord_nm_core import DBusBackend, NetworkManagerError, cert_path, parse_ovpn
+
+server = {'ip_address': '10.0.0.1', 'domain': 'de1.nordvpn.com'}
+name = 'Germany #1 [Standard] [UDP]'
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    monkeypatch.setattr(nord_nm_core, 'dbus', fakedbus)
+    return fakedbus.FakeNetworkManager()
+
+
+@pytest.fixture
+def backend(manager, tmp_path):
+    (tmp_path / 'certs').mkdir()
+    return DBusBackend(str(tmp_path / 'certs'), bus=manager, activation_timeout=2)
+
+
+@pytest.fixture
+def ovpn_path(tmp_path):
+    path = tmp_path / 'de1.nordvpn.com.udp.ovpn'
+    path.write_bytes(cdn.ovpn(server, 'udp'))
+    return str(path)
+
+
+def test_add_vpn(backend, manager, ovpn_path):
+    backend.add_vpn(name, ovpn_path, 'user@example.com', 'secret')
+    settings = manager.saved(name)
+    assert settings['connection']['type'] == 'vpn' and settings['connection']['autoconnect'] is False
+    assert settings['vpn']['service-type'] == 'org.freedesktop.NetworkManager.openvpn'
+    data = settings['vpn']['data']
+    assert data['remote'] == '10.0.0.1:1194'
+    assert 'proto-tcp' not in data
+    assert data['username'] == 'user@example.com' and data['password-flags'] == '0'
+    assert data['connection-type'] == 'password' and data['cipher'] == 'AES-256-CBC' and data['ta-dir'] == '1'
+    assert data['verify-x509-name'] == 'subject:CN=de1.nordvpn.com'  # the server certificate stays pinned
+    assert settings['vpn']['secrets'] == {'password': 'secret'}
+    assert settings['ipv6'] == {'method': 'ignore'}
+    for key, block in (('ca', 'ca'), ('ta', 'tls-auth')):
+        assert data[key] == cert_path(backend.cert_dir, name, block)
+        with open(data[key]) as cert_file:
+            assert cert_file.read().startswith('-----BEGIN')
+        assert os.stat(data[key]).st_mode & 0o077 == 0
+    assert [method for method, path in manager.calls] == ['AddConnection']  # a single call, secrets included
+
+
+def test_add_vpn_tcp(backend, manager, tmp_path):
+    path = tmp_path / 'de1.nordvpn.com.tcp.ovpn'
+    path.write_bytes(cdn.ovpn(server, 'tcp'))
+    backend.add_vpn(name, str(path), 'user@example.com', 'secret')
+    data = manager.saved(name)['vpn']['data']
+    assert data['remote'] == '10.0.0.1:443' and data['proto-tcp'] == 'yes'
+
+
+@pytest.mark.parametrize('line, value', [
+    ('verify-x509-name de1.nordvpn.com name', 'name:de1.nordvpn.com'),
+    ("verify-x509-name 'C=PA, O=NordVPN, CN=de1.nordvpn.com'", 'subject:C=PA, O=NordVPN, CN=de1.nordvpn.com'),
+])
+def test_verify_x509_name_type(tmp_path, line, value):
+    path = tmp_path / 'de1.nordvpn.com.udp.ovpn'
+    path.write_text(cdn.ovpn(server, 'udp').decode().replace('verify-x509-name CN=de1.nordvpn.com', line))
+    assert parse_ovpn(str(path), str(tmp_path), name)['verify-x509-name'] == value
+
+
+def test_unknown_options_logged(tmp_path, caplog):
+    path = tmp_path / 'de1.nordvpn.com.udp.ovpn'
+    path.write_text(cdn.ovpn(server, 'udp').decode() + 'persist-key\nsndbuf 524288\nscript-security 2\n')
+    parse_ovpn(str(path), str(tmp_path), name)
+    assert [record.getMessage() for record in caplog.records] == [
+        'Options of de1.nordvpn.com.udp.ovpn not passed to NetworkManager: sndbuf, script-security']
+
+
+def test_add_vpn_rejected(backend, ovpn_path):
+    backend.add_vpn(name, ovpn_path, 'user@example.com', 'secret')
+    with pytest.raises(NetworkManagerError):
+        backend.add_vpn(name, ovpn_path, 'user@example.com', 'secret')
+
+
+def test_activate(backend, manager, ovpn_path):
+    backend.add_vpn(name, ovpn_path, 'user@example.com', 'secret')
+    backend.activate(name)
+    assert backend.is_active(name)
+    assert ('vpn', name) in [(connection_type, active) for connection_type, active, uuid in backend.active_connections()]
+
+
+def test_activate_failed(backend, manager, ovpn_path):
+    backend.add_vpn(name, ovpn_path, 'user@example.com', 'wrong')
+    manager.fail.add(name)
+    with pytest.raises(NetworkManagerError):
+        backend.activate(name)
+    assert not backend.is_active(name)
+
+
+def test_activate_timeout(backend, manager, ovpn_path):
+    backend.add_vpn(name, ovpn_path, 'user@example.com', 'secret')
+    manager.activation_polls = 1000
+    backend.activation_timeout = 0.3
+    with pytest.raises(NetworkManagerError):
+        backend.activate(name)
+
+
+def test_activate_unknown(backend):
+    with pytest.raises(NetworkManagerError):
+        backend.activate(name)
+
+
+def test_deactivate(backend, manager, ovpn_path):
+    backend.add_vpn(name, ovpn_path, 'user@example.com', 'secret')
+    backend.activate(name)
+    backend.deactivate(name)
+    assert not backend.is_active(name)
+    assert manager.saved(name) is not None
+    with pytest.raises(NetworkManagerError):
+        backend.deactivate(name)
+
+
+def test_delete(backend, manager, ovpn_path):
+    backend.add_vpn(name, ovpn_path, 'user@example.com', 'secret')
+    backend.delete(name)
+    assert manager.saved(name) is None
+    assert not [entry for entry in os.listdir(backend.cert_dir)]
+    with pytest.raises(NetworkManagerError):
+        backend.delete(name)
+
+
+def test_delete_all(backend, manager, ovpn_path):
+    backend.add_vpn(name, ovpn_path, 'user@example.com', 'secret')
+    with pytest.raises(NetworkManagerError):
+        backend.delete_all([name, 'missing [Standard] [UDP]'])
+    assert manager.saved(name) is None  # deleted although the other one is missing
+
+
+def test_listing(backend, ovpn_path):
+    backend.add_vpn(name, ovpn_path, 'user@example.com', 'secret')
+    assert backend.saved_connections() == [('vpn', name)]
+    assert backend.devices() == [('ethernet', 'eth0'), ('wifi', 'wlan0'), ('14', 'lo')]
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+# Disconnects waiting for NetworkManager to take the connection down instead of sleeping a fixed time
+import json
+import os
+import time
+import types
+
+import pytest
+
+import catalog
+import cdn
+from nord_nm_core import NetworkManagerBackend, NetworkManagerError, NmcliBackend, NordCore, build_index, connection_name, wait_until
+
+shims = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks', 'shims')
+servers = catalog.generate(20)
+server = build_index(servers).store.info(0)
+name = connection_name(server, 'UDP')
+
+
+class Clock:
+    """
+    Stands in for time.monotonic and time.sleep, sleeping only advances the clock
+    """
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(time, 'monotonic', clock.monotonic)
+    return clock
+
+
+def test_wait_until(clock):
+    polls = iter([None, 0, 'done'])
+    assert wait_until(lambda: next(polls), 10, sleep=clock.sleep) == 'done'
+    assert clock.sleeps == [0.05, 0.05]
+
+
+def test_wait_until_times_out(clock):
+    assert wait_until(lambda: False, 1, interval=0.25, sleep=clock.sleep) is False
+    assert clock.sleeps == [0.25] * 4
+
+
+class LingeringBackend(NetworkManagerBackend):
+    """
+    Like NetworkManager over D-Bus, a deactivation returns before the connection left the active ones
+    """
+    def __init__(self, polls):
+        self.polls = polls  # checks of the active connections that still list it after the deactivation
+        self.deactivated = []
+
+    def deactivate(self, name):
+        self.deactivated.append(name)
+
+    def active_connections(self):
+        if not self.deactivated:
+            return [('vpn', name, 'uuid')]
+        self.polls -= 1
+        return [('vpn', name, 'uuid')] if self.polls >= 0 else []
+
+
+@pytest.fixture
+def core(tmp_path):
+    core = NordCore(str(tmp_path / 'config'))
+    core.setup()
+    core.connection_name = name
+    return core
+
+
+def test_deactivate_waits_for_the_connection(core, clock):
+    core.backend = core.profiles.backend = LingeringBackend(polls=3)
+    core.deactivate(sleep=clock.sleep)
+    assert core.backend.deactivated == [name] and len(clock.sleeps) == 3
+
+
+def test_deactivate_times_out(core, clock):
+    core.backend = core.profiles.backend = LingeringBackend(polls=10 ** 6)
+    with pytest.raises(NetworkManagerError):
+        core.deactivate(sleep=clock.sleep)
+    assert sum(clock.sleeps) == pytest.approx(10, abs=0.1)
+
+
+def test_deactivate_marks_the_connection_released(core, clock):
+    core.backend = core.profiles.backend = LingeringBackend(polls=0)
+    core.profiles.add(name, 'user')
+    core.deactivate(sleep=clock.sleep)
+    assert core.profiles.released(name) and clock.sleeps == []
+
+
+def test_disconnect(core, monkeypatch, tmp_path):
+    monkeypatch.setenv('PATH', shims + os.pathsep + os.environ['PATH'])
+    monkeypatch.setenv('FAKE_NM_STATE', str(tmp_path / 'nm_state.json'))
+    core.backend = core.profiles.backend = NmcliBackend()
+    core.helper = types.SimpleNamespace(call=lambda *ops: None)  # IPv6 is turned off and on again
+    core.configs.add(servers[0]['domain'], 'udp', cdn.ovpn(servers[0], 'udp'))
+    core.connect(server, 'Standard', 'UDP', 'user', 'secret')
+    stages = []
+    start = time.perf_counter()
+    errors = core.disconnect(name, report=stages.append)
+    assert time.perf_counter() - start < 5  # no fixed sleep
+    assert errors == [] and stages == ['disable_connection', 'remove_connection', 'enable_ipv6']
+    with open(os.environ['FAKE_NM_STATE']) as state_file:
+        assert json.load(state_file)['active'] == []
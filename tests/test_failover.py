@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+# Standby connections kept imported next to the active one and the failover to them, against the nmcli shim
+import json
+import os
+
+import pytest
+
+import catalog
+import cdn
+from nord_nm_core import NetworkManagerError, NmcliBackend, NordCore, build_index, connection_name
+
+shims = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks', 'shims')
+servers = catalog.generate(50)
+server_index = build_index(servers)
+infos = [server_index.store.info(row) for row in range(3)]
+names = [connection_name(server, 'UDP') for server in infos]
+
+
+def state():
+    with open(os.environ['FAKE_NM_STATE']) as state_file:
+        return json.load(state_file)
+
+
+class RecordingHelper:
+    """
+    Stand-in for the privileged helper recording the endpoints of every kill switch ruleset loaded
+    """
+    def __init__(self):
+        self.rulesets = []
+
+    def call(self, *ops):
+        self.rulesets.extend(op['endpoints'] for op in ops if op['op'] == 'kill_switch_on')
+
+
+@pytest.fixture
+def core(monkeypatch, tmp_path):
+    monkeypatch.setenv('PATH', shims + os.pathsep + os.environ['PATH'])
+    monkeypatch.setenv('FAKE_NM_STATE', str(tmp_path / 'nm_state.json'))
+    core = NordCore(str(tmp_path / 'config'))
+    core.setup()
+    core.backend = core.profiles.backend = NmcliBackend()
+    core.server_index = server_index
+    core.helper = RecordingHelper()
+    for server in servers[:3]:
+        core.configs.add(server['domain'], 'udp', cdn.ovpn(server, 'udp'))
+    core.connect(infos[0], 'Standard', 'UDP', 'user', 'secret')
+    return core
+
+
+def allowed(endpoints, index):
+    return [servers[index]['ip_address'], 1194, 'udp'] in endpoints
+
+
+def test_prepare_standby(core):
+    assert core.prepare_standby(infos[1], 'Standard', 'UDP', 'user', 'secret') == names[1] == core.standby_name
+    assert names[1] in state()['connections'] and state()['active'] == [names[0]]
+    assert core.prepare_standby(infos[1], 'Standard', 'UDP', 'user', 'secret') == names[1]  # already prepared
+    assert state()['connections'].count(names[1]) == 1
+
+
+def test_standby_replaced(core):
+    core.profiles.limit = 0  # released connections are deleted right away
+    core.prepare_standby(infos[1], 'Standard', 'UDP', 'user', 'secret')
+    core.prepare_standby(infos[2], 'Standard', 'UDP', 'user', 'secret')
+    assert core.standby_name == names[2]
+    assert names[1] not in state()['connections'] and names[2] in state()['connections']
+
+
+def test_standby_is_not_the_active_connection(core):
+    with pytest.raises(NetworkManagerError):
+        core.prepare_standby(infos[0], 'Standard', 'UDP', 'user', 'secret')
+    assert core.standby_name is None
+
+
+def test_standby_let_through_the_kill_switch(core):
+    core.set_setting('kill_switch', True)
+    core.prepare_standby(infos[1], 'Standard', 'UDP', 'user', 'secret')
+    assert allowed(core.helper.rulesets[-1], 0) and allowed(core.helper.rulesets[-1], 1)
+    core.remove_standby()
+    assert allowed(core.helper.rulesets[-1], 0) and not allowed(core.helper.rulesets[-1], 1)
+
+
+def test_failover(core):
+    core.prepare_standby(infos[1], 'Standard', 'UDP', 'user', 'secret')
+    assert core.failover() == names[1] == core.connection_name
+    assert core.standby_name is None
+    assert state()['active'] == [names[1]]
+    assert names[0] not in state()['connections']  # the failed connection is removed
+
+
+def test_failover_with_kill_switch(core):
+    core.set_setting('kill_switch', True)
+    core.prepare_standby(infos[1], 'Standard', 'UDP', 'user', 'secret')
+    core.failover()
+    assert not allowed(core.helper.rulesets[-1], 0) and allowed(core.helper.rulesets[-1], 1)
+
+
+def test_failover_without_standby(core):
+    with pytest.raises(NetworkManagerError):
+        core.failover()
+    assert core.connection_name == names[0]
+
+
+def test_standby_that_fails_to_come_up(core, monkeypatch):
+    core.prepare_standby(infos[1], 'Standard', 'UDP', 'user', 'secret')
+
+    def refuse(name):
+        raise NetworkManagerError(name + ' timed out')
+    monkeypatch.setattr(core.backend, 'activate', refuse)
+    with pytest.raises(NetworkManagerError):
+        core.failover()
+    assert core.connection_name == names[0] and core.standby_name == names[1]
+
+
+@pytest.mark.parametrize('reason, failed', [
+    (None, True),  # unknown with the nmcli monitor fallback
+    (5, True),  # NM_ACTIVE_CONNECTION_STATE_REASON_CONNECT_TIMEOUT
+    (2, False),  # NM_ACTIVE_CONNECTION_STATE_REASON_USER_DISCONNECTED, e.g. from nm-applet
+])
+def test_connection_failed(core, reason, failed):
+    assert core.connection_failed(reason) is failed
+
+
+def test_released_connection_not_failed(core):
+    core.profiles.mark(core.connection_name, True)  # as nord-nm disconnect does
+    assert not core.connection_failed(None)
+    assert not core.connection_failed(5)
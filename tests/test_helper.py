@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+# Requests of the privileged helper, run unprivileged against a scratch root, and the kill switch rulesets it loads
+import json
+import os
+import shutil
+import subprocess
+import time
+import types
+
+import pytest
+
+from nord_nm_helper import (Helper, RequestError, dispatcher_dir, kill_switch_removal, kill_switch_ruleset, max_endpoints,
+                             nft_path, nft_saved_path, nft_table, valid_endpoint)
+
+name = 'Germany #1 [Standard] [UDP]'
+
+
+@pytest.fixture
+def helper(tmp_path):
+    return Helper(os.getuid(), str(tmp_path))
+
+
+def request(helper, *ops):
+    return helper.handle(json.dumps({'ops': list(ops)}))
+
+
+def installed(helper, script):
+    path = os.path.join(helper.root, dispatcher_dir.lstrip('/'), script)
+    return os.path.exists(path) and open(path).read()
+
+
+def install_op(**changes):
+    op = {'op': 'install', 'name': 'auto_connect', 'interfaces': ['eth0'], 'connections': [name], 'debounce': 5}
+    op.update(changes)
+    return op
+
+
+@pytest.mark.parametrize('op', [
+    {'op': 'install', 'name': 'auto_connect', 'content': '#!/bin/sh\nid > /tmp/pwned\n'},
+    install_op(content='#!/bin/sh\n'),
+    install_op(name='kill_switch'),
+    install_op(name='../auto_connect'),
+    {'op': 'install', 'name': 'auto_connect', 'interfaces': ['eth0'], 'connection': name},
+    install_op(interfaces=[]),
+    install_op(interfaces='eth0'),
+    install_op(interfaces=['eth0;id']),
+    install_op(interfaces=['$(id)']),
+    install_op(interfaces=['a' * 16]),
+    install_op(interfaces=[1]),
+    install_op(connections=[]),
+    install_op(connections=name),
+    install_op(connections=[name] * 9),
+    install_op(connections=['Germany #1']),
+    install_op(connections=[name, 'x\nid [Standard] [UDP]']),
+    install_op(connections=['x' * 200 + ' [Standard] [UDP]']),
+    install_op(connections=[None]),
+    install_op(debounce=-1),
+    install_op(debounce=61),
+    install_op(debounce='5; id'),
+    install_op(debounce=True),
+    install_op(debounce=float('nan')),
+    install_op(debounce=None),
+    {'op': 'remove', 'name': 'other'},
+])
+def test_install_rejected(helper, op):
+    response = request(helper, op)
+    assert response['ok'] is False
+    assert not installed(helper, 'auto_connect') and not installed(helper, 'kill_switch')
+
+
+def test_batch_rejected_as_a_whole(helper):
+    response = request(helper, install_op(), {'op': 'install', 'name': 'auto_connect', 'content': '#!/bin/sh\n'})
+    assert response['ok'] is False and not installed(helper, 'auto_connect')
+
+
+@pytest.fixture
+def nm(tmp_path):
+    """
+    Stand-ins for nmcli and nft recording their calls, one per line, in the file nm.calls
+    NM_ACTIVE: output of nmcli connection show --active, NM_MISSING: connection whose connection up fails
+    """
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    (bin_dir / 'nmcli').write_text(
+        '#!/bin/bash\n'
+        'if [ "$5" = show ]; then printf "%s" "$NM_ACTIVE"; exit 0; fi\n'
+        'echo nmcli "$@" >> "$CALLS"\n'
+        '[ "$4" != "$NM_MISSING" ] || exit 10\n')
+    (bin_dir / 'nft').write_text('#!/bin/sh\necho nft "$@" >> "$CALLS"\n')
+    for command in ('nmcli', 'nft'):
+        (bin_dir / command).chmod(0o755)
+    nm = types.SimpleNamespace(calls=tmp_path / 'calls', env=dict(
+        os.environ, PATH=str(bin_dir) + os.pathsep + os.environ['PATH'], CALLS=str(tmp_path / 'calls'), NM_ACTIVE=''))
+
+    def run(script, *args, **env):
+        subprocess.run(['bash', script] + list(args), env=dict(nm.env, **env), cwd=str(tmp_path), check=True)
+    nm.run = run
+    return nm
+
+
+def calls(nm, count=0, timeout=5):
+    """
+    :return: calls recorded once there are count of them, at most timeout seconds later, or once no attempt is running
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        recorded = nm.calls.read_text().splitlines() if nm.calls.exists() else []
+        if len(recorded) >= count if count else not attempts_running(nm):
+            return recorded
+        time.sleep(0.02)
+    raise AssertionError('the auto-connect attempts did not finish')
+
+
+def attempts_running(nm):
+    for pid in filter(str.isdigit, os.listdir('/proc')):
+        try:
+            with open('/proc/%s/cmdline' % pid, 'rb') as cmdline:
+                args = cmdline.read().split(b'\0')
+        except OSError:
+            continue
+        if b'--attempt' in args and any(arg.startswith(str(nm.calls.parent).encode()) for arg in args):
+            return True
+    return False
+
+
+def test_install_quotes_the_request(helper, nm, tmp_path):
+    connection = "Germany's $(touch pwned) `id` #1 [Standard] [UDP]"
+    assert request(helper, install_op(interfaces=['eth0', 'wlp2s0'], connections=[connection], debounce=0)) == {'ok': True}
+    script = installed(helper, 'auto_connect')
+    assert script.startswith('#!/bin/bash\n')
+    path = os.path.join(helper.root, dispatcher_dir.lstrip('/'), 'auto_connect')
+    assert os.stat(path).st_mode & 0o777 == 0o744
+
+    for interface, action in (('eth1', 'up'), ('wlp2s0', 'down'), ('wlp2s0', 'vpn-up')):
+        nm.run(path, interface, action)
+        assert calls(nm) == []
+    nm.run(path, 'wlp2s0', 'up')
+    assert calls(nm, 1) == ['nmcli connection up id ' + connection]
+    assert not (tmp_path / 'pwned').exists()
+
+
+def test_event_storm(helper, nm):
+    request(helper, install_op(debounce=0.5))
+    path = os.path.join(helper.root, dispatcher_dir.lstrip('/'), 'auto_connect')
+    for event in range(10):  # flapping wifi, NetworkManager runs the script for each event after the previous one
+        time.sleep(0.05)
+        last = time.monotonic()
+        nm.run(path, 'eth0', 'up' if event % 2 else 'connectivity-change')
+    assert calls(nm, 1) == ['nmcli connection up id ' + name]
+    assert time.monotonic() - last >= 0.5
+    assert calls(nm) == ['nmcli connection up id ' + name]
+
+
+def test_nord_connection_active(helper, nm):
+    request(helper, install_op(debounce=0))
+    path = os.path.join(helper.root, dispatcher_dir.lstrip('/'), 'auto_connect')
+    nm.run(path, 'eth0', 'up', NM_ACTIVE='ethernet:Wired connection 1\nvpn:Sweden #3 [Standard] [TCP]\n')
+    assert calls(nm) == []
+    nm.run(path, 'eth0', 'up', NM_ACTIVE='ethernet:Wired connection 1\nvpn:Office\n')  # not a Nord connection
+    assert calls(nm, 1) == ['nmcli connection up id ' + name]
+
+
+def test_connections_tried_in_turn(helper, nm):
+    other, last = 'Germany #2 [Standard] [UDP]', 'Germany #3 [Standard] [UDP]'
+    request(helper, install_op(connections=[name, other, last], debounce=0))
+    path = os.path.join(helper.root, dispatcher_dir.lstrip('/'), 'auto_connect')
+    nm.run(path, 'eth0', 'up', NM_MISSING=name)  # evicted from NetworkManager since the script was installed
+    assert calls(nm, 2) == ['nmcli connection up id ' + name, 'nmcli connection up id ' + other]
+    assert calls(nm) == ['nmcli connection up id ' + name, 'nmcli connection up id ' + other]
+
+
+def test_remove(helper):
+    request(helper, install_op())
+    for script in ('auto_connect', 'kill_switch'):
+        assert request(helper, {'op': 'remove', 'name': script}) == {'ok': True}
+    assert not installed(helper, 'auto_connect')
+
+
+def test_script_syntax(helper):
+    request(helper, install_op(interfaces=['eth0', 'br-1.2'], connections=[name, 'Sweden #3 [P2P] [TCP]']))
+    path = os.path.join(helper.root, dispatcher_dir.lstrip('/'), 'auto_connect')
+    subprocess.run(['bash', '-n', path], check=True)
+
+
+def test_kill_switch_kept_for_auto_connect(helper, nm):
+    saved_path = os.path.join(helper.root, nft_saved_path.lstrip('/'))
+    assert request(helper, {'op': 'kill_switch_on', 'endpoints': [['10.0.0.1', 1194, 'udp']]},
+                   install_op(debounce=0)) == {'ok': True}
+    assert 'ip daddr 10.0.0.1 udp dport 1194 accept' in open(saved_path).read()
+    assert os.stat(saved_path).st_mode & 0o777 == 0o600
+
+    script = os.path.join(helper.root, dispatcher_dir.lstrip('/'), 'auto_connect')
+    nm.run(script, 'eth0', 'up')
+    assert calls(nm, 2) == ['nft -f ' + saved_path, 'nmcli connection up id ' + name]
+
+    assert request(helper, {'op': 'kill_switch_off'}) == {'ok': True}
+    assert not os.path.exists(saved_path)
+    nm.calls.unlink()
+    nm.run(script, 'eth0', 'up')
+    assert calls(nm, 1) == ['nmcli connection up id ' + name]
+
+def chain(ruleset, name):
+    """
+    :return: rules of the chain name in an nft script of kill_switch_ruleset()
+    """
+    lines = [line.strip() for line in ruleset.splitlines()]
+    start = lines.index('chain %s {' % name)
+    return lines[start + 2:lines.index('}', start)]
+
+
+def test_ruleset_replaces_the_table():
+    ruleset = kill_switch_ruleset([])
+    assert ruleset.splitlines()[:3] == ['table ' + nft_table, 'delete table ' + nft_table, 'table %s {' % nft_table]
+    assert ruleset.endswith('}\n')
+    for name in ('input', 'output'):
+        lines = [line.strip() for line in ruleset.splitlines()]
+        assert lines[lines.index('chain %s {' % name) + 1] == 'type filter hook %s priority 0; policy drop;' % name
+
+
+def test_ruleset_without_endpoints():
+    ruleset = kill_switch_ruleset([])
+    assert chain(ruleset, 'input') == ['iifname "lo" accept', 'iifname "tun*" accept', 'udp sport 67 udp dport 68 accept']
+    assert chain(ruleset, 'output') == ['oifname "lo" accept', 'oifname "tun*" accept', 'udp sport 68 udp dport 67 accept']
+
+
+def test_ruleset_families_and_ports():
+    ruleset = kill_switch_ruleset([('10.0.0.1', 1194, 'udp'), ('2001:db8::1', 443, 'tcp')])
+    assert chain(ruleset, 'input')[3:] == ['ip saddr 10.0.0.1 accept', 'ip6 saddr 2001:db8::1 accept']
+    assert chain(ruleset, 'output')[3:] == ['ip daddr 10.0.0.1 udp dport 1194 accept',
+                                            'ip6 daddr 2001:db8::1 tcp dport 443 accept']
+
+
+def test_ruleset_dedup():
+    # a server allowed for its tunnel port and the probe port is let in once
+    ruleset = kill_switch_ruleset([('10.0.0.1', 1194, 'udp'), ('10.0.0.1', 443, 'tcp'), ('10.0.0.2', 1194, 'udp')])
+    assert chain(ruleset, 'input')[3:] == ['ip saddr 10.0.0.1 accept', 'ip saddr 10.0.0.2 accept']
+    assert chain(ruleset, 'output')[3:] == ['ip daddr 10.0.0.1 udp dport 1194 accept',
+                                            'ip daddr 10.0.0.1 tcp dport 443 accept',
+                                            'ip daddr 10.0.0.2 udp dport 1194 accept']
+
+
+def test_removal():
+    assert kill_switch_removal() == 'table %s\ndelete table %s\n' % (nft_table, nft_table)
+
+
+@pytest.mark.skipif(not shutil.which('nft'), reason='nft is needed to check the syntax')
+def test_ruleset_syntax(tmp_path):
+    for script in (kill_switch_ruleset([('10.0.0.1', 1194, 'udp'), ('2001:db8::1', 443, 'tcp')]), kill_switch_removal()):
+        path = tmp_path / 'ruleset.nft'
+        path.write_text(script)
+        subprocess.run(['nft', '--check', '-f', str(path)], check=True)
+
+
+def test_valid_endpoint():
+    assert valid_endpoint(['10.0.0.1', 1194, 'udp']) == ('10.0.0.1', 1194, 'udp')
+    assert valid_endpoint(['2001:DB8::1', 443, 'tcp']) == ('2001:db8::1', 443, 'tcp')  # normalized
+
+
+@pytest.mark.parametrize('endpoint', [
+    ('10.0.0.1', 1194, 'udp'),
+    ['10.0.0.1', 1194],
+    ['10.0.0.1', 1194, 'udp', 'extra'],
+    ['10.0.0.256', 1194, 'udp'],
+    ['de1.nordvpn.com', 1194, 'udp'],
+    ['10.0.0.1; flush ruleset', 1194, 'udp'],
+    ['10.0.0.0/8', 1194, 'udp'],
+    [None, 1194, 'udp'],
+    ['10.0.0.1', 0, 'udp'],
+    ['10.0.0.1', 65536, 'udp'],
+    ['10.0.0.1', '1194', 'udp'],
+    ['10.0.0.1', True, 'udp'],
+    ['10.0.0.1', 1194.0, 'udp'],
+    ['10.0.0.1', 1194, 'icmp'],
+    ['10.0.0.1', 1194, 'UDP'],
+    '10.0.0.1:1194',
+])
+def test_invalid_endpoint(endpoint):
+    with pytest.raises(RequestError):
+        valid_endpoint(endpoint)
+
+
+def test_kill_switch_requests(helper):
+    ruleset_path = os.path.join(helper.root, nft_path.lstrip('/'))
+    assert request(helper, {'op': 'kill_switch_on', 'endpoints': [['10.0.0.1', 1194, 'udp']]}) == {'ok': True}
+    assert open(ruleset_path).read() == kill_switch_ruleset([('10.0.0.1', 1194, 'udp')])
+    too_many = [['10.0.%d.%d' % (i // 256, i % 256), 1194, 'udp'] for i in range(max_endpoints + 1)]
+    for op in ({'op': 'kill_switch_on', 'endpoints': too_many},
+               {'op': 'kill_switch_on', 'endpoints': [['10.0.0.2', 1194, 'udp'], ['x', 1, 'udp']]},
+               {'op': 'kill_switch_on', 'endpoints': '10.0.0.2'},
+               {'op': 'kill_switch_off', 'endpoints': []}):
+        assert request(helper, op)['ok'] is False
+    assert open(ruleset_path).read() == kill_switch_ruleset([('10.0.0.1', 1194, 'udp')])  # unchanged
+    assert request(helper, {'op': 'kill_switch_off'}) == {'ok': True}
+    assert open(ruleset_path).read() == kill_switch_removal()
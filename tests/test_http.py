@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+# Connection reuse of HttpClient, counted as TLS handshakes of a local stand-in
+import shutil
+import ssl
+import subprocess
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from nord_nm_core import HttpClient
+
+
+@pytest.fixture(scope='module')
+def certificate(tmp_path_factory):
+    """
+    :return: (certificate path, key path) of a self-signed certificate for 127.0.0.1
+    """
+    if not shutil.which('openssl'):
+        pytest.skip('openssl is needed to create the certificate of the stand-in')
+    directory = tmp_path_factory.mktemp('tls')
+    cert, key = str(directory / 'cert.pem'), str(directory / 'key.pem')
+    subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-keyout', key, '-out', cert, '-days', '1',
+                    '-subj', '/CN=127.0.0.1', '-addext', 'subjectAltName=IP:127.0.0.1'],
+                   check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return cert, key
+
+
+class TLSServer(ThreadingHTTPServer):
+    """
+    HTTPS server counting the TLS handshakes it completed, one per connection
+    """
+    def get_request(self):
+        sock, address = super(TLSServer, self).get_request()
+        with self.lock:
+            self.handshakes += 1
+        return sock, address
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive
+
+    def do_GET(self):
+        body = b'[]'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server(serve, certificate):
+    server = serve(Handler, server_class=TLSServer)
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(*certificate)
+    server.socket = context.wrap_socket(server.socket, server_side=True)  # handshakes as each connection is accepted
+    server.lock = threading.Lock()
+    server.handshakes = 0
+    server.url = 'https://127.0.0.1:%d/server' % server.server_port
+    return server
+
+
+def test_sequential_requests_share_a_handshake(server, certificate):
+    http = HttpClient()
+    for _ in range(20):
+        assert http.get(server.url, verify=certificate[0]).json() == []
+    assert server.handshakes == 1
+    assert len(http.timings) == 20 and all(timing.status == 200 for timing in http.timings)
+
+
+def test_concurrent_requests_stay_within_the_pool(server, certificate):
+    http = HttpClient(pool_size=4)
+    errors = []
+
+    def fetch():
+        try:
+            for _ in range(10):
+                http.get(server.url, verify=certificate[0])
+        except Exception as ex:
+            errors.append(ex)
+
+    threads = [threading.Thread(target=fetch) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert 1 <= server.handshakes <= 4
+
+    for _ in range(10):  # the pooled connections are kept for later requests
+        http.get(server.url, verify=certificate[0])
+    assert server.handshakes <= 4
+
+
+def test_clients_do_not_share_connections(server, certificate):
+    for _ in range(3):
+        HttpClient().get(server.url, verify=certificate[0])
+    assert server.handshakes == 3
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+# Indexes derived from a refreshed catalog match the ones built from scratch
+import copy
+import random
+
+import pytest
+
+import catalog
+from nord_nm_core import SearchIndex, build_index, server_type_options, update_index
+
+
+def servers(view):
+    return sorted((server.id, server.name, server.load, server.city, tuple(server.type)) for server in view)
+
+
+def assert_same(server_index, search_index, api_data):
+    full = build_index(api_data)
+    fresh = SearchIndex().updated(full.store)
+    assert server_index.countries == full.countries
+    for country in [None] + full.countries:
+        for server_type in server_type_options:
+            view = server_index.lookup(country, server_type)
+            assert servers(view) == servers(full.lookup(country, server_type)), (country, server_type)
+            loads = [server.load for server in view]
+            assert loads == sorted(loads)
+    assert search_index.texts == fresh.texts
+    assert {gram: sorted(ids) for gram, ids in search_index.grams.items()} == \
+           {gram: sorted(ids) for gram, ids in fresh.grams.items()}
+    for query in ('ge', 'zur', 'united', '#17', 'new york', 'us12'):
+        for server_type in (None, 'P2P'):
+            assert servers(search_index.search(query, server_type)) == servers(fresh.search(query, server_type))
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_random_refreshes(seed):
+    rng = random.Random(seed)
+    api_data = catalog.generate(300)
+    server_index = build_index(api_data)
+    search_index = SearchIndex().updated(server_index.store)
+    derived = compacted = 0
+    for step in range(20):
+        api_data = copy.deepcopy(api_data)
+        for server in rng.sample(api_data, 30):
+            server['load'] = rng.randint(0, 100)
+        for server in rng.sample(api_data, 3):
+            server['name'] += ' x'
+        for server in rng.sample(api_data, 2):
+            server['categories'] = [{'name': 'P2P'}]
+        for _ in range(rng.randint(0, 8)):
+            api_data.remove(rng.choice(api_data))
+        for i in range(rng.randint(0, 6)):
+            server = copy.deepcopy(rng.choice(api_data))
+            server['id'] = 1000000 + step * 10 + i
+            server['name'] = 'New #%d' % server['id']
+            server['country'] = rng.choice([server['country'], 'Atlantis'])
+            api_data.append(server)
+        rng.shuffle(api_data)
+        refreshed = update_index(server_index, iter(api_data))
+        if refreshed.base is server_index.store:  # as MainWindow.set_server_index()
+            derived += 1
+            search_index = search_index.updated(refreshed.store, refreshed.changed)
+        else:  # compacted
+            compacted += 1
+            search_index = SearchIndex().updated(refreshed.store)
+        server_index = refreshed
+        assert_same(server_index, search_index, api_data)
+    assert derived and compacted
+
+
+def test_unchanged_refresh():
+    api_data = catalog.generate(300)
+    server_index = build_index(api_data)
+    refreshed = update_index(server_index, iter(api_data))
+    assert refreshed.changed == set()
+    assert refreshed.rows == server_index.rows
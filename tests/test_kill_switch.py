@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+# Servers the kill switch lets through, also for connections this process did not import, e.g. brought up at boot,
+# and the ruleset being in place before a connect brings them up
+import os
+import types
+
+import pytest
+
+import catalog
+import cdn
+from nord_nm_core import NetworkManagerError, NmcliBackend, NordCore, build_index, connection_name, probe_port
+
+shims = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks', 'shims')
+
+servers = catalog.generate(50)
+
+
+@pytest.fixture
+def core(tmp_path):
+    core = NordCore(str(tmp_path / 'config'))
+    core.setup()
+    core.catalog = types.SimpleNamespace(load=lambda: build_index(servers))
+    return core
+
+
+def server_info(index):
+    server_index = build_index(servers)
+    store = server_index.store
+    return store.info(store.names.index(servers[index]['name']))
+
+
+def test_endpoints_from_the_config_store(core):
+    active, standby = server_info(0), server_info(1)
+    for server in (servers[0], servers[1]):
+        core.configs.add(server['domain'], 'udp', cdn.ovpn(server, 'udp'))
+    core.connection_name = connection_name(active, 'UDP')
+    core.standby_name = connection_name(standby, 'UDP')
+    assert core.kill_switch_endpoints() == [
+        [servers[0]['ip_address'], 1194, 'udp'], [servers[0]['ip_address'], probe_port, 'tcp'],
+        [servers[1]['ip_address'], 1194, 'udp'], [servers[1]['ip_address'], probe_port, 'tcp']]
+
+
+def test_tcp_connection(core):
+    server = server_info(2)
+    core.configs.add(servers[2]['domain'], 'tcp', cdn.ovpn(servers[2], 'tcp'))
+    core.connection_name = connection_name(server, 'TCP')
+    assert core.kill_switch_endpoints()[0] == [servers[2]['ip_address'], 443, 'tcp']
+
+
+def test_unknown_server(core):
+    core.connection_name = 'Atlantis #1 [Standard] [UDP]'
+    with pytest.raises(NetworkManagerError):
+        core.kill_switch_endpoints()
+
+
+class RecordingHelper:
+    """
+    Stand-in for the privileged helper recording the kill switch operations, together with the activations
+    """
+    def __init__(self, events):
+        self.events = events
+
+    def call(self, *ops):
+        for op in ops:
+            if op['op'] in ('kill_switch_on', 'kill_switch_off'):
+                self.events.append((op['op'], op.get('endpoints')))
+
+
+@pytest.fixture
+def connecting(core, monkeypatch, tmp_path):
+    monkeypatch.setenv('PATH', shims + os.pathsep + os.environ['PATH'])
+    monkeypatch.setenv('FAKE_NM_STATE', str(tmp_path / 'nm_state.json'))
+    core.backend = NmcliBackend()
+    events = []
+    core.helper = RecordingHelper(events)
+    activate = core.backend.activate
+    core.backend.activate = lambda name: (events.append(('activate', name)), activate(name))[1]
+    for server in servers[:3]:
+        core.configs.add(server['domain'], 'udp', cdn.ovpn(server, 'udp'))
+    return events
+
+
+def allowed(endpoints, index):
+    return [servers[index]['ip_address'], 1194, 'udp'] in endpoints
+
+
+def test_ruleset_loaded_before_activation(core, connecting):
+    name = core.connect(server_info(0), 'Standard', 'UDP', 'user', 'secret', kill_switch=True)
+    assert [event for event, value in connecting] == ['kill_switch_on', 'activate']
+    assert allowed(connecting[0][1], 0) and connecting[1] == ('activate', name)
+    assert core.setting('kill_switch')
+
+
+def test_race_candidates_let_through(core, connecting):
+    name = core.connect(server_info(0), 'Standard', 'UDP', 'user', 'secret', kill_switch=True,
+                        alternatives=[server_info(1), server_info(2)])
+    first_activation = next(i for i, (event, value) in enumerate(connecting) if event == 'activate')
+    kill_switch = [value for event, value in connecting[:first_activation] if event == 'kill_switch_on']
+    assert kill_switch and all(allowed(kill_switch[-1], index) for index in range(3))
+    event, endpoints = connecting[-1]
+    assert event == 'kill_switch_on'  # only the winner once the race decided
+    winner = next(index for index in range(3) if connection_name(server_info(index), 'UDP') == name)
+    assert [index for index in range(3) if allowed(endpoints, index)] == [winner]
+
+
+def refuse(name):
+    raise NetworkManagerError(name + ' timed out')
+
+
+def test_failed_connect_removes_the_kill_switch(core, connecting):
+    core.backend.activate = refuse
+    with pytest.raises(NetworkManagerError):
+        core.connect(server_info(0), 'Standard', 'UDP', 'user', 'secret', kill_switch=True)
+    assert connecting[-1] == ('kill_switch_off', None) and not core.setting('kill_switch')
+
+
+def test_failed_connect_keeps_a_kill_switch_that_was_on(core, connecting):
+    core.set_setting('kill_switch', True)  # e.g. restored at boot
+    core.backend.activate = refuse
+    with pytest.raises(NetworkManagerError):
+        core.connect(server_info(0), 'Standard', 'UDP', 'user', 'secret', kill_switch=True)
+    assert [event for event, value in connecting] == ['kill_switch_on'] and core.setting('kill_switch')
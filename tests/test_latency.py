@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+# Latency probes against local listeners
+import socket
+import threading
+import time
+
+import pytest
+
+from nord_nm_core import LatencyProber, Probe
+
+
+@pytest.fixture
+def listener():
+    """
+    :return: port of a socket listening on 127.0.0.1, connects to it complete without being accepted
+    """
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        sock.listen(64)
+        yield sock.getsockname()[1]
+
+
+@pytest.fixture
+def closed_port():
+    """
+    :return: port on 127.0.0.1 nothing listens on, connects to it are refused
+    """
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def full_backlog():
+    """
+    :return: port of a listener whose backlog is full, connects to it time out instead of completing
+    """
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        sock.listen(0)
+        waiting = []
+        for _ in range(4):  # the kernel admits a connection more than the backlog
+            client = socket.socket()
+            client.setblocking(False)
+            client.connect_ex(sock.getsockname())
+            waiting.append(client)
+        time.sleep(0.1)
+        yield sock.getsockname()[1]
+        for client in waiting:
+            client.close()
+
+
+def test_reachable(listener):
+    probe = LatencyProber(port=listener, attempts=3).probe_host('127.0.0.1')
+    assert probe.loss == 0
+    assert 0 <= probe.rtt < 0.5
+
+
+def test_closed_port(closed_port):
+    prober = LatencyProber(port=closed_port, attempts=3)
+    probe = prober.probe_host('127.0.0.1')
+    assert probe.rtt is None and probe.loss == 1
+    assert prober.fastest(['127.0.0.1']) is None
+
+
+def test_timeout(full_backlog):
+    prober = LatencyProber(port=full_backlog, attempts=2, timeout=0.2)
+    start = time.monotonic()
+    probe = prober.probe_host('127.0.0.1')
+    assert probe.rtt is None and probe.loss == 1
+    assert 0.3 < time.monotonic() - start < 2
+
+
+def test_unresolvable_host(listener):
+    probe = LatencyProber(port=listener).probe_host('unresolvable.invalid')
+    assert probe.rtt is None and probe.loss == 1
+
+
+def test_fastest_skips_unreachable(listener):
+    prober = LatencyProber(port=listener)
+    assert prober.fastest(['unresolvable.invalid', '127.0.0.1']) == '127.0.0.1'
+
+
+def test_bounded_parallelism(listener, monkeypatch):
+    prober = LatencyProber(port=listener, max_workers=3)
+    running = []
+    peak = []
+    lock = threading.Lock()
+    probe_host = prober.probe_host
+
+    def counted(host):
+        with lock:
+            running.append(host)
+            peak.append(len(running))
+        time.sleep(0.05)
+        try:
+            return probe_host('127.0.0.1')
+        finally:
+            with lock:
+                running.remove(host)
+
+    monkeypatch.setattr(prober, 'probe_host', counted)
+    hosts = ['host%d.invalid' % i for i in range(10)]
+    results = prober.probe(hosts)
+    assert set(results) == set(hosts)
+    assert max(peak) == 3
+
+
+def test_ttl(listener, monkeypatch):
+    prober = LatencyProber(port=listener, ttl=60)
+    probed = []
+    monkeypatch.setattr(prober, 'probe_host', lambda host: probed.append(host) or Probe(0.01, 0.0, time.time()))
+    prober.results = {'fresh.invalid': Probe(0.02, 0.0, time.time() - 30),
+                      'expired.invalid': Probe(0.02, 0.0, time.time() - 90)}
+    results = prober.probe(['fresh.invalid', 'expired.invalid'])
+    assert probed == ['expired.invalid']
+    assert results['fresh.invalid'].rtt == 0.02
+    assert prober.cached('expired.invalid') is None  # probe_host was replaced, nothing was stored
+    assert prober.cached('fresh.invalid', ttl=10) is None
+
+
+def test_results_persist(listener, tmp_path):
+    path = str(tmp_path / 'latency.json')
+    LatencyProber(port=listener, path=path).probe(['127.0.0.1'])
+    assert LatencyProber(port=listener, path=path).cached('127.0.0.1').loss == 0
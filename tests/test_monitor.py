@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+# ConnectionMonitor subscribed to the NetworkManager signals of the fakedbus system bus
+import sys
+
+import pytest
+from PyQt5 import QtCore
+
+import fakedbus
+import nord_nm_core
+import nord_nm_gui
+from nord_nm_core import DBusBackend
+
+
+@pytest.fixture(scope='module')
+def app():
+    return QtCore.QCoreApplication.instance() or QtCore.QCoreApplication(sys.argv[:1])
+
+
+@pytest.fixture
+def backend(app, monkeypatch, tmp_path):
+    monkeypatch.setattr(fakedbus, 'shared_bus', None)
+    monkeypatch.setattr(nord_nm_core, 'dbus', fakedbus)
+    monkeypatch.setattr(nord_nm_gui, 'dbus', fakedbus)
+    monkeypatch.setitem(sys.modules, 'dbus', fakedbus)
+    monkeypatch.setitem(sys.modules, 'dbus.mainloop', fakedbus.mainloop)
+    monkeypatch.setitem(sys.modules, 'dbus.mainloop.pyqt5', fakedbus.mainloop.pyqt5)
+    return DBusBackend(str(tmp_path))  # takes the shared bus first, as get_backend() does
+
+
+def test_signals_delivered(backend):
+    monitor = nord_nm_gui.ConnectionMonitor(backend)
+    assert monitor.process is None  # no nmcli fallback
+    assert monitor.bus is not backend.bus and monitor.bus.mainloop is not None
+    monitor.bus.emit('PropertiesChanged', nord_nm_core.nm_path, nord_nm_core.nm_bus_name, {'ActiveConnections': []})
+    assert monitor.refresh_timer.isActive()
+
+
+@pytest.fixture
+def active(backend):
+    """
+    :return: D-Bus path of an active Nord connection
+    """
+    path = '/org/freedesktop/NetworkManager/ActiveConnection/1'
+    backend.bus.active[path] = {'Id': 'Germany #1 [Standard] [UDP]', 'Type': 'vpn', 'Uuid': 'uuid-1', 'State': 2}
+    return path
+
+
+@pytest.mark.parametrize('reason, failed', [(2, False), (3, False), (11, False), (4, True), (6, True), (10, True)])
+def test_deactivation_reason(backend, active, tmp_path, reason, failed):
+    monitor = nord_nm_gui.ConnectionMonitor(backend)
+    monitor.bus.emit('StateChanged', active, nord_nm_core.nm_active_deactivating, reason)
+    del backend.bus.active[active]  # the object is gone once the connection is deactivated
+    monitor.bus.emit('StateChanged', active, nord_nm_core.nm_active_deactivated, reason)
+    assert monitor.deactivation_reason('Germany #1 [Standard] [UDP]') == reason
+    assert nord_nm_core.NordCore(str(tmp_path)).connection_failed(reason) is failed
+    assert monitor.deactivation_reason('Germany #1 [Standard] [UDP]') is None  # reported once
+    assert monitor.names == {}
+
+
+def test_deactivation_reason_unknown(backend, active, tmp_path):
+    monitor = nord_nm_gui.ConnectionMonitor(backend)
+    del backend.bus.active[active]  # gone before any signal of it arrived
+    monitor.bus.emit('StateChanged', active, nord_nm_core.nm_active_deactivated, 6)
+    assert monitor.deactivation_reason('Germany #1 [Standard] [UDP]') is None
+    assert nord_nm_core.NordCore(str(tmp_path)).connection_failed(None)  # as with nmcli monitor, a drop is failed over
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+# Released marks of the profile cache, which keep the GUI from failing over after nord-nm disconnects
+import json
+import os
+
+import pytest
+
+from nord_nm_core import NmcliBackend, NordCore, ProfileCache
+
+shims = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks', 'shims')
+name = 'Germany #1 [Standard] [UDP]'
+
+
+@pytest.fixture
+def profiles(monkeypatch, tmp_path):
+    monkeypatch.setenv('PATH', shims + os.pathsep + os.environ['PATH'])
+    monkeypatch.setenv('FAKE_NM_STATE', str(tmp_path / 'nm_state.json'))
+    (tmp_path / 'nm_state.json').write_text(json.dumps({'connections': [name], 'active': []}))
+    return ProfileCache(NmcliBackend(), str(tmp_path / 'profiles.json'))
+
+
+def test_release_marks(profiles):
+    profiles.add(name, 'user')
+    assert not profiles.released(name)
+    profiles.release(name)
+    assert profiles.released(name)
+    assert profiles.get(name, 'user')  # brought up again
+    assert not profiles.released(name)
+
+
+def test_mark(profiles):
+    profiles.add(name, 'user')
+    profiles.mark(name, True)
+    assert profiles.released(name)
+    profiles.mark(name, False)
+    assert not profiles.released(name)
+    profiles.mark('missing [Standard] [UDP]', True)
+    assert 'missing [Standard] [UDP]' not in profiles.read()
+    assert not profiles.released('missing [Standard] [UDP]')
+
+
+def test_entries_of_earlier_versions(profiles):
+    with open(profiles.path, 'w') as cache_file:
+        json.dump([[name, 'user', 1.0]], cache_file)
+    assert profiles.read()[name] == ('user', 1.0, False)
+    profiles.release(name)
+    with open(profiles.path) as cache_file:
+        assert json.load(cache_file) == [[name, 'user', 1.0, True]]
+
+
+def test_shared_between_cores(profiles, tmp_path):
+    gui, cli = NordCore(str(tmp_path / 'config')), NordCore(str(tmp_path / 'config'))
+    for core in (gui, cli):
+        core.setup()
+        core.backend = profiles.backend
+    gui.profiles.add(name, 'user')
+    gui.connection_name = name
+    assert gui.connection_failed(6)
+    cli.profiles.mark(name, True)  # as nord-nm disconnect does before taking it down
+    assert not gui.connection_failed(6)
+    assert not gui.connection_failed(2)
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+# Race mode against a backend whose activations take as long as each test says
+import threading
+import time
+
+import pytest
+
+import catalog
+import cdn
+from nord_nm_core import NetworkManagerBackend, NetworkManagerError, NordCore, build_index, connection_name, wait_until
+
+servers = catalog.generate(50)
+server_index = build_index(servers)
+candidates = [server_index.store.info(row) for row in range(3)]
+names = [connection_name(server, 'UDP') for server in candidates]
+
+
+class RacingBackend(NetworkManagerBackend):
+    """
+    Brings a connection up after outcomes[name] seconds, or fails it right away if the outcome is an exception
+    A deactivation cuts a pending activation short, as NetworkManager does
+    """
+    def __init__(self, outcomes):
+        self.outcomes = outcomes
+        self.started = {}  # name -> time its activation started
+        self.deactivated = []
+        self.saved = []
+        self.active = []
+        self.cut = {}  # name -> Event set by deactivate()
+        self.lock = threading.Lock()
+
+    def add_vpn(self, name, ovpn_path, username, password):
+        with self.lock:
+            self.saved.append(name)
+
+    def activate(self, name):
+        with self.lock:
+            self.started[name] = time.monotonic()
+            cut = self.cut[name] = threading.Event()
+        outcome = self.outcomes[name]
+        if isinstance(outcome, Exception):
+            raise outcome
+        if cut.wait(outcome):
+            raise NetworkManagerError(name + ' was deactivated')
+        with self.lock:
+            self.active.append(name)
+
+    def deactivate(self, name):
+        with self.lock:
+            self.deactivated.append(name)
+            if name in self.active:
+                self.active.remove(name)
+            elif name in self.cut:
+                self.cut[name].set()
+            else:
+                raise NetworkManagerError(name + ' is not active')
+
+    def delete(self, name):
+        with self.lock:
+            if name not in self.saved:
+                raise NetworkManagerError(name + ' does not exist')
+            self.saved.remove(name)
+
+    def active_connections(self):
+        return [('vpn', name, name) for name in self.active]
+
+    def saved_connections(self):
+        return [('vpn', name) for name in self.saved]
+
+
+@pytest.fixture
+def core(tmp_path):
+    core = NordCore(str(tmp_path / 'config'))
+    core.setup()
+    core.profiles.limit = 0  # connections that lost are deleted right away
+    for server in servers[:3]:
+        core.configs.add(server['domain'], 'udp', cdn.ovpn(server, 'udp'))
+    return core
+
+
+def race(core, outcomes, stagger):
+    core.backend = core.profiles.backend = RacingBackend(dict(zip(names, outcomes)))
+    return core.race(candidates, 'Standard', 'UDP', 'user', 'secret', stagger=stagger)
+
+
+def test_first_up_wins(core):
+    assert race(core, [2.0, 0.1, 2.0], stagger=0.02) == names[1] == core.connection_name
+    backend = core.backend
+    assert backend.active == [names[1]]
+    assert sorted(backend.deactivated) == sorted([names[0], names[2]])
+    assert backend.saved == [names[1]]  # the losers were taken down and deleted
+
+
+def test_staggered_start(core):
+    start = time.monotonic()
+    assert race(core, [0.5, 2.0, 2.0], stagger=0.15) == names[0]
+    started = [core.backend.started[name] - start for name in names]
+    assert started[0] < 0.1
+    assert started[1] >= 0.15 and started[2] >= 0.3
+
+
+def test_later_candidates_not_started(core):
+    assert race(core, [0.05, 2.0, 2.0], stagger=5) == names[0]
+    backend = core.backend
+    assert list(backend.started) == [names[0]] and backend.deactivated == []
+    # prepared but never brought up, their attempts delete them once they see the race decided
+    assert wait_until(lambda: backend.saved == [names[0]], 5)
+
+
+def test_failure_starts_next_candidate(core):
+    start = time.monotonic()
+    assert race(core, [NetworkManagerError('auth failed'), 0.05, 2.0], stagger=5) == names[1]
+    assert time.monotonic() - start < 2  # without waiting out the stagger
+    assert names[2] not in core.backend.started
+    assert names[0] not in core.backend.saved  # the failed connection is discarded
+    assert wait_until(lambda: core.backend.saved == [names[1]], 5)
+
+
+def test_all_fail(core):
+    errors = [NetworkManagerError('first'), NetworkManagerError('second'), NetworkManagerError('third')]
+    with pytest.raises(NetworkManagerError, match='first'):
+        race(core, errors, stagger=5)
+    assert set(core.backend.started) == set(names)
+    assert core.backend.active == [] and core.backend.saved == []
+    assert core.connection_name is None
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+# Server list model following catalog refreshes with row changes instead of a reset, so the selection survives
+import copy
+import random
+import sys
+
+import pytest
+from PyQt5 import QtCore
+from PyQt5.QtTest import QAbstractItemModelTester
+
+import catalog
+from nord_nm_core import build_index, update_index
+from nord_nm_gui import ServerListModel
+
+
+@pytest.fixture(scope='module')
+def app():
+    return QtCore.QCoreApplication.instance() or QtCore.QCoreApplication(sys.argv[:1])
+
+
+@pytest.fixture
+def model(app):
+    model = ServerListModel()
+    model.tester = QAbstractItemModelTester(model, QAbstractItemModelTester.FailureReportingMode.Fatal)
+    model.resets = []
+    model.modelReset.connect(lambda: model.resets.append(True))
+    return model
+
+
+def ids(model):
+    return [model.data(model.index(row), ServerListModel.IdRole) for row in range(model.rowCount())]
+
+
+def view_ids(view):
+    return [view.store.ids[row] for row in view.rows]
+
+
+def refreshed(api_data, rng, keep):
+    api_data = copy.deepcopy(api_data)
+    for server in rng.sample(api_data, len(api_data) // 4):
+        server['load'] = rng.randint(0, 100)
+    removable = [server for server in api_data if server['id'] != keep]
+    for server in rng.sample(removable, 5):
+        api_data.remove(server)
+    for i in range(3):
+        server = copy.deepcopy(rng.choice(api_data))
+        server['id'] = rng.randint(10 ** 6, 10 ** 7)
+        server['name'] += ' new %d' % i
+        api_data.append(server)
+    return api_data
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_rows_and_selection_survive_refreshes(model, seed):
+    rng = random.Random(seed)
+    api_data = catalog.generate(300)
+    server_index = build_index(api_data)
+    model.set_servers(server_index.lookup(None, 'Standard'))
+    selection = QtCore.QItemSelectionModel(model)
+    selected = ids(model)[len(ids(model)) // 2]
+    selection.setCurrentIndex(model.index(ids(model).index(selected)), QtCore.QItemSelectionModel.ClearAndSelect)
+    resets = len(model.resets)
+    for _ in range(5):
+        api_data = refreshed(api_data, rng, keep=selected)
+        server_index = update_index(server_index, iter(api_data))
+        view = server_index.lookup(None, 'Standard')
+        model.update_servers(view, server_index.changed)
+        assert ids(model) == view_ids(view)
+        assert model.data(selection.currentIndex(), ServerListModel.IdRole) == selected
+        assert [model.data(index, ServerListModel.IdRole) for index in selection.selectedIndexes()] == [selected]
+        row = selection.currentIndex().row()
+        assert model.data(model.index(row), ServerListModel.InfoRole).id == selected
+    assert len(model.resets) == resets  # never reset, the view keeps its scroll position
+
+
+def test_filter_change(model):
+    server_index = build_index(catalog.generate(300))
+    countries = server_index.countries
+    model.set_servers(server_index.lookup(countries[0], 'Standard'))
+    for country in countries[1:4] + [None, countries[0]]:
+        view = server_index.lookup(country, 'Standard')
+        model.update_servers(view)
+        assert ids(model) == view_ids(view)
+    model.update_servers(server_index.lookup('Atlantis', 'Standard'))
+    assert model.rowCount() == 0
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+# Startup budget of the GUI, measured by benchmarks/bench_startup.py in fresh interpreters
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+bench = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks', 'bench_startup.py')
+
+
+@pytest.mark.slow
+def test_startup_within_budget(tmp_path):
+    pytest.importorskip('PyQt5.QtWidgets')
+    output = tmp_path / 'startup.json'
+    result = subprocess.run([sys.executable, bench, '--check', '--repeat', '3', '--size', '1000', '--output', str(output)],
+                            stderr=subprocess.PIPE, universal_newlines=True, timeout=300)
+    assert result.returncode == 0, result.stderr
+    report = json.loads(output.read_text())
+    assert report['loaded_by_import'] == []
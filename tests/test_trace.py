@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+# Stage timings of a trace and the subprocesses counted for them, against the nmcli shim of the benchmarks
+import contextvars
+import os
+import threading
+
+import pytest
+
+from nord_nm_core import NmcliBackend, Trace
+
+shims = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks', 'shims')
+
+
+@pytest.fixture
+def backend(monkeypatch, tmp_path):
+    monkeypatch.setenv('PATH', shims + os.pathsep + os.environ['PATH'])
+    monkeypatch.setenv('FAKE_NM_STATE', str(tmp_path / 'nm_state.json'))
+    return NmcliBackend()
+
+
+def test_stage_counts_its_subprocesses(backend):
+    trace = Trace('connect')
+    with trace.stage('query'):
+        backend.active_connections()
+        backend.devices()
+    backend.active_connections()  # after the stage
+    record = trace.finish()
+    assert record['stages'][0]['subprocesses'] == 2
+    assert record['subprocesses'] == 2
+
+
+def test_other_threads_are_not_counted(backend):
+    trace = Trace('connect')
+    with trace.stage('query'):
+        thread = threading.Thread(target=backend.active_connections)  # e.g. a refresh of the connection monitor
+        thread.start()
+        thread.join()
+        backend.active_connections()
+    assert trace.finish()['stages'][0]['subprocesses'] == 1
+
+
+def test_failed_stage(backend):
+    trace = Trace('connect')
+    with pytest.raises(Exception):
+        with trace.stage('enable_connection'):
+            backend.activate('missing [Standard] [UDP]')
+    record = trace.finish()
+    assert record['outcome'] == 'error'
+    assert record['stages'][0]['subprocesses'] == 1
+    assert record['stages'][0]['outcome'].startswith('error: ')
+
+
+def test_copied_context_is_counted(backend):
+    trace = Trace('connect')
+    with trace.stage('race'):  # the attempts of a race run in copies of the context of the stage
+        threads = [threading.Thread(target=contextvars.copy_context().run, args=(backend.active_connections,))
+                   for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    assert trace.finish()['stages'][0]['subprocesses'] == 3
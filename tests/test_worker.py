@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+# Worker outcomes, a timed out worker keeps counting as running until its function returns
+import sys
+import threading
+
+import pytest
+from PyQt5 import QtCore
+
+from nord_nm_gui import Worker
+
+
+@pytest.fixture(scope='module')
+def app():
+    return QtCore.QCoreApplication.instance() or QtCore.QCoreApplication(sys.argv[:1])
+
+
+@pytest.fixture
+def pool(app):
+    pool = QtCore.QThreadPool()
+    yield pool
+    pool.waitForDone()
+
+
+def record(worker):
+    events = []
+    worker.signals.result.connect(lambda value: events.append(('result', value)))
+    worker.signals.error.connect(lambda error: events.append(('error', error)))
+    worker.signals.returned.connect(lambda: events.append(('returned',)))
+    return events
+
+
+def process(app, until, timeout=5):
+    timer = QtCore.QElapsedTimer()
+    timer.start()
+    while not until() and timer.elapsed() < timeout * 1000:
+        app.processEvents(QtCore.QEventLoop.AllEvents, 20)
+    assert until()
+
+
+def test_result(app, pool):
+    worker = Worker(lambda x: x * 2, 21)
+    events = record(worker)
+    pool.start(worker)
+    process(app, lambda: ('returned',) in events)
+    assert events == [('result', 42), ('returned',)]
+    assert not worker.pending() and not worker.running()
+
+
+def test_error(app, pool):
+    worker = Worker(lambda: 1 / 0)
+    events = record(worker)
+    pool.start(worker)
+    process(app, lambda: ('returned',) in events)
+    assert events[0] == ('error', 'division by zero')
+
+
+def test_timed_out_until_returned(app, pool):
+    release = threading.Event()
+    reports = []
+    worker = Worker(lambda report: (report('late'), release.wait(5), 'dropped'))
+    worker.kwargs['report'] = worker.report
+    worker.signals.progress.connect(reports.append)
+    events = record(worker)
+    worker.expire()
+    pool.start(worker)
+    process(app, lambda: events)
+    assert events == [('error', 'Timed out')]
+    assert not worker.pending() and worker.running()  # abandoned, but still busy
+    release.set()
+    process(app, lambda: not worker.running())
+    process(app, lambda: ('returned',) in events)
+    assert events == [('error', 'Timed out'), ('returned',)]  # the result of an abandoned worker is dropped
+    assert reports == []